@@ -1,35 +1,338 @@
 import os
+import io
+import contextlib
 import pandas as pd
 import numpy as np
-from sklearn.cluster import KMeans
-from sklearn.preprocessing import StandardScaler
-import matplotlib.pyplot as plt
-import matplotlib
-matplotlib.use('Agg')  # Use non-interactive backend
-import io
-import base64
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, render_template, request, jsonify, send_file, Response
 import json
+import re
+import uuid
+from flask import session, g
+from flask.json.provider import DefaultJSONProvider
+import time
+import threading
+from streaming import run_streaming_job, DEFAULT_CHUNKSIZE
+from dataset_store import DatasetStore
+from jobs import JobManager, JobQueueFull
+from clustering_core import run_clustering_job, run_sweep_job, check_restart_seeding, feature_cache
+from exporting import iter_export, iter_npz, select_rows, page_to_json, EXPORT_FORMATS, ROW_FORMATS
+from plotting import render_cluster_plot, PlotCache, PLOT_MODES
+from feature_cache import make_key
+from kmeans_engine import ENGINES
+from coreset import SEEDING_METHODS
+from reduction import parse_reduction
+from restarts import RESTART_METHODS
+from model_registry import ModelRegistry, DEFAULT_MODEL_DIR, check_model_name
+from compaction import compact_frame, frame_nbytes
+from shared_state import ResultStore, load_secret_key
+from chunked_upload import UploadStore, detect_compression, open_decompressed
+import metrics
+from metrics import timed, timed_iter
+from startup import prewarm
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """Default JSON provider that records JSON encoding as a pipeline stage"""
+
+    def dumps(self, obj, **kwargs):
+        with timed('json_encode'):
+            return super().dumps(obj, **kwargs)
+
+if int(pd.__version__.split('.')[0]) < 3:
+    # Always on from pandas 3.0: column selections and the dataset store's labelled views
+    # share column buffers instead of copying them
+    pd.set_option('mode.copy_on_write', True)
 
 app = Flask(__name__)
+app.json = TimedJSONProvider(app)
 app.config['UPLOAD_FOLDER'] = 'uploads'
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+# 16MB max file size by default; raise MAX_UPLOAD_MB for large streaming uploads
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_UPLOAD_MB', 16)) * 1024 * 1024
 
 # Create uploads directory if it doesn't exist
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
-# Global variable to store the current dataset
-current_dataset = None
-original_dataset = None
+# Outputs of streaming runs, one file per run; they are dropped after EXPORT_TTL_SECONDS,
+# and the oldest go first once they take more than MAX_EXPORT_MB together
+EXPORT_FOLDER = os.path.join(app.config['UPLOAD_FOLDER'], 'exports')
+os.makedirs(EXPORT_FOLDER, exist_ok=True)
+EXPORT_TTL_SECONDS = int(os.environ.get('EXPORT_TTL_SECONDS', 24 * 3600))
+MAX_EXPORT_BYTES = int(os.environ.get('MAX_EXPORT_MB', 1024)) * 1024 * 1024
+
+# Sessions only carry the ID of the user's dataset; the data lives in the store. All server
+# worker processes must sign sessions with the same key, so a generated one is kept on disk.
+app.secret_key = os.environ.get('SECRET_KEY') or load_secret_key(
+    os.path.join(app.config['UPLOAD_FOLDER'], '.secret_key'))
+
+# Uploads are stored in columnar form under uploads/datasets. Resident datasets of all
+# sessions share one memory budget; least-recently-used ones are reopened from disk on demand.
+dataset_store = DatasetStore(
+    memory_budget=int(os.environ.get('DATASET_MEMORY_BUDGET_MB', 512)) * 1024 * 1024,
+    storage_dir=os.path.join(app.config['UPLOAD_FOLDER'], 'datasets')
+)
+
+# Large and compressed CSVs arrive in parts below MAX_CONTENT_LENGTH and are assembled
+# (and parsed while they arrive) under uploads/incoming
+upload_store = UploadStore(
+    os.path.join(app.config['UPLOAD_FOLDER'], 'incoming'), dataset_store,
+    max_bytes=int(os.environ.get('MAX_CHUNKED_UPLOAD_MB', 4096)) * 1024 * 1024,
+    max_part_size=app.config['MAX_CONTENT_LENGTH']
+)
+# How long completing an upload waits for the parser to catch up before asking to retry
+UPLOAD_COMPLETE_TIMEOUT = 60
+
+# Clustering runs in a bounded process pool; extra jobs wait in a bounded queue
+job_manager = JobManager(
+    max_workers=int(os.environ.get('CLUSTER_WORKERS', max(1, (os.cpu_count() or 2) // 2))),
+    max_queued=int(os.environ.get('CLUSTER_QUEUE_SIZE', 8)),
+    # Job status and results are shared with the other server workers through these files
+    state_dir=os.path.join(app.config['UPLOAD_FOLDER'], 'jobs'),
+    dumps=app.json.dumps
+)
+# Worker processes for a job's parallel restarts or sweep candidates: its share of the cores,
+# since the pool runs several jobs at once (gunicorn.conf.py also divides by the web workers)
+RESTART_WORKERS = (int(os.environ.get('KMEANS_RESTART_WORKERS', 0))
+                   or max(1, (os.cpu_count() or 1) // job_manager.max_workers))
+
+# Runs given a model_name save their fitted model; only the newest versions of each name are kept
+model_registry = ModelRegistry(DEFAULT_MODEL_DIR,
+                               keep_versions=int(os.environ.get('MODEL_KEEP_VERSIONS', 5)))
+
+# Rendered plots are cached by (result ID, axes, mode); results keep their labels for re-plotting
+plot_cache = PlotCache(max_bytes=int(os.environ.get('PLOT_CACHE_MB', 64)) * 1024 * 1024)
+# Results are evicted per dataset, so one client re-clustering its upload never breaks the
+# /plot and /download links of another; the total cap only bounds disk use
+MAX_RESULTS_PER_DATASET = int(os.environ.get('MAX_RESULTS_PER_DATASET', 16))
+MAX_CLUSTER_RESULTS = int(os.environ.get('MAX_CLUSTER_RESULTS', 1000))
+result_store = ResultStore(os.path.join(app.config['UPLOAD_FOLDER'], 'results'), dataset_store,
+                           MAX_RESULTS_PER_DATASET, MAX_CLUSTER_RESULTS)
+# How often /jobs/<id>/events looks for new progress, and how long it stays silent at most
+EVENT_POLL_SECONDS = 0.25
+EVENT_KEEPALIVE_SECONDS = 15
+# Every open event stream holds a server thread, so only some of them may stream at once;
+# keep this below the threads per worker (WEB_THREADS) so uploads and polling still get through
+MAX_EVENT_STREAMS = int(os.environ.get('MAX_EVENT_STREAMS', 8))
+event_stream_slots = threading.BoundedSemaphore(MAX_EVENT_STREAMS)
+# Largest page /rows serves in one response
+MAX_PAGE_ROWS = int(os.environ.get('MAX_PAGE_ROWS', 10_000))
+# Downcast numeric columns and turn repetitive text into categoricals on upload
+COMPACT_DATASETS = os.environ.get('COMPACT_DATASETS', '1').lower() not in ('0', 'false', 'no')
+
+def refresh_gauges(registry):
+    """Copy current store, cache and job pool sizes into gauges before /metrics renders"""
+    rss = metrics.current_rss()
+    if rss is not None:
+        registry.set('kmeans_process_rss_bytes', 'Resident memory of the web process', rss)
+    usage = dataset_store.memory_usage()
+    registry.set('kmeans_datasets_resident_bytes', 'Bytes of resident datasets', usage['resident_bytes'])
+    registry.set('kmeans_datasets', 'Stored datasets', usage['resident_datasets'], state='resident')
+    registry.set('kmeans_datasets', 'Stored datasets', usage['spilled_datasets'], state='spilled')
+    cache = feature_cache.stats()
+    registry.set('kmeans_feature_cache_bytes', 'Bytes of cached scaled matrices', cache['bytes'])
+    registry.set('kmeans_feature_cache_hits', 'Feature cache hits since start', cache['hits'])
+    registry.set('kmeans_feature_cache_misses', 'Feature cache misses since start', cache['misses'])
+    jobs = job_manager.stats()
+    for state in ('queued', 'running'):
+        registry.set('kmeans_jobs', 'Clustering jobs by state', jobs[state], state=state)
+
+metrics.registry.register_callback(refresh_gauges)
+
+@app.before_request
+def start_request_timing():
+    g.request_start = time.perf_counter()
+    metrics.start_breakdown()
+
+@app.after_request
+def finish_request_timing(response):
+    """Record request latency and report this request's stage times in Server-Timing"""
+    breakdown = metrics.stop_breakdown()
+    endpoint = request.endpoint or 'unknown'
+    metrics.registry.observe('kmeans_http_request_seconds', 'Latency of HTTP requests by endpoint',
+                             time.perf_counter() - g.request_start, endpoint=endpoint)
+    metrics.registry.inc('kmeans_http_requests_total', 'HTTP requests by endpoint and status',
+                         endpoint=endpoint, status=response.status_code)
+    if breakdown is not None and breakdown.seconds:
+        # Streamed bodies are produced after this point, so their time only reaches /metrics
+        response.headers['Server-Timing'] = breakdown.server_timing()
+    return response
+
+def register_result(dataset_id, columns, labels, projection=None):
+    """Remember a clustering result so its plots can be rendered on demand by any worker.
+
+    projection is the (plot coordinates, axis names) pair of a reduced fit.
+    """
+    xy, axes = projection or (None, None)
+    return result_store.add(dataset_id, columns, labels, projection=xy, axes=axes)
+
+def prune_exports(keep=None):
+    """Remove streaming exports past their TTL, then the oldest while over the size limit"""
+    exports = []
+    for name in os.listdir(EXPORT_FOLDER):
+        path = os.path.join(EXPORT_FOLDER, name)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        exports.append((stat.st_mtime, stat.st_size, path))
+    cutoff = time.time() - EXPORT_TTL_SECONDS
+    total = sum(size for _, size, _ in exports)
+    for mtime, size, path in sorted(exports):
+        if path == keep or (mtime >= cutoff and total <= MAX_EXPORT_BYTES):
+            continue
+        # Another server worker may have removed it first
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(path)
+        total -= size
+
+def get_dataset_id():
+    """Return the dataset ID from the request or the session, if it is still stored"""
+    dataset_id = request.args.get('dataset_id')
+    if dataset_id is None and request.is_json:
+        dataset_id = (request.get_json(silent=True) or {}).get('dataset_id')
+    if dataset_id is None:
+        dataset_id = session.get('dataset_id')
+    if dataset_id is None or dataset_id not in dataset_store:
+        return None
+    return dataset_id
+
+def validate_columns(dataset, selected_columns):
+    """Check that the selected columns exist and are numeric"""
+    numeric_columns = []
+    for col in selected_columns:
+        if col not in dataset.columns:
+            raise ValueError(f'Column "{col}" not found')
+        if not pd.api.types.is_numeric_dtype(dataset[col]):
+            raise ValueError(f'Column "{col}" is not numeric')
+        numeric_columns.append(col)
+    return numeric_columns
+
+def get_engine_options(data):
+    """Read the K-Means engine, float precision and seeding requested in a JSON body"""
+    engine = data.get('engine', 'sklearn')
+    if engine not in ENGINES:
+        raise ValueError(f"Engine must be one of {', '.join(sorted(ENGINES))}")
+    dtype = 'float32' if data.get('float32') else 'float64'
+    seeding = data.get('seeding', 'full')
+    if seeding not in SEEDING_METHODS:
+        raise ValueError(f"Seeding must be one of {', '.join(SEEDING_METHODS)}")
+    return engine, dtype, seeding
+
+def get_restart_method(data, seeding='full'):
+    """Read how the K-Means restarts should run from a JSON body"""
+    restarts = data.get('restarts', 'sequential')
+    if restarts not in RESTART_METHODS:
+        raise ValueError(f"Restarts must be one of {', '.join(RESTART_METHODS)}")
+    check_restart_seeding(restarts, seeding)
+    return restarts
+
+def get_reduction_options(data):
+    """Read the dimensionality reduction requested in a JSON body (None for none)"""
+    return parse_reduction(data.get('reduction', 'none'), data.get('n_components'),
+                           data.get('variance'))
+
+def get_cached_features(entry, columns, dtype='float64'):
+    """Return (cached features or None, columnar handle of the selected columns).
+
+    The handle lets the worker map just the selected columns from disk instead of
+    receiving a pickled copy of them.
+    """
+    features = feature_cache.get(make_key(entry.content_hash, columns, {'dtype': dtype}))
+    return features, entry.handle.subset(columns)
+
+def cache_features(entry, columns, result, dtype='float64'):
+    """Store features a worker computed, so the next job on these columns skips preprocessing"""
+    features = result.pop('features', None)
+    if features is not None:
+        feature_cache.put(make_key(entry.content_hash, columns, {'dtype': dtype}), *features)
+
+def submit_job(kind, fn, *args, dataset_id=None, on_success=None, on_done=None):
+    """Submit a job and return the 202 response, or 503 if the pool is saturated.
+
+    With dataset_id the job holds that dataset until it is over; on_done runs
+    when the job is over, or right away if it was never queued.
+    """
+    # The job holds its own reference, so a new upload or a reset in this session cannot
+    # delete the columns the worker maps before the job is finished with them
+    holder = f'job-{uuid.uuid4().hex}'
+    
+    def done():
+        if dataset_id is not None:
+            dataset_store.release(dataset_id, holder)
+        if on_done is not None:
+            on_done()
+    
+    if dataset_id is not None:
+        try:
+            dataset_store.acquire(dataset_id, holder)
+        except KeyError:
+            if on_done is not None:
+                on_done()
+            return jsonify({'error': 'Dataset no longer available'}), 404
+    try:
+        # Jobs report their stage and fit iterations, and stop there once cancelled
+        job_id = job_manager.submit(kind, fn, *args, on_success=on_success, progress=True,
+                                    on_done=done)
+    except JobQueueFull:
+        done()
+        response = jsonify({'error': 'Server is busy, please retry shortly'})
+        response.headers['Retry-After'] = '5'
+        return response, 503
+    except Exception:
+        done()
+        raise
+    
+    return jsonify({
+        'success': True,
+        'job_id': job_id,
+        'status_url': f'/jobs/{job_id}',
+        'result_url': f'/jobs/{job_id}/result',
+        'events_url': f'/jobs/{job_id}/events',
+        'cancel_url': f'/jobs/{job_id}/cancel'
+    }), 202
 
 @app.route('/')
 def index():
     return render_template('index.html')
 
+def store_dataset(df, compact=COMPACT_DATASETS, holder='upload'):
+    """Compact and store a parsed upload; returns its ID and the dataset info shown to the user"""
+    if compact:
+        with timed('compaction'):
+            df, memory = compact_frame(df)
+    else:
+        memory = {'before_bytes': frame_nbytes(df), 'after_bytes': frame_nbytes(df), 'dtypes': {}}
+    metrics.record_dataset(len(df), memory['after_bytes'])
+    with timed('store'):
+        dataset_id = dataset_store.add(df, holder)
+    
+    # Get basic info about the dataset
+    info = {
+        'shape': df.shape,
+        'columns': df.columns.tolist(),
+        'head': df.head().to_dict('records'),
+        'dtypes': df.dtypes.astype(str).to_dict(),
+        'memory': memory
+    }
+    return dataset_id, info
+
+def use_dataset(dataset_id, info):
+    """Make a stored upload this session's dataset and describe it"""
+    # Replace this session's previous dataset instead of keeping both around
+    previous_id = session.get('dataset_id')
+    if previous_id is not None:
+        dataset_store.release(previous_id, 'upload')
+    session['dataset_id'] = dataset_id
+    return jsonify({
+        'success': True,
+        'message': f"Dataset loaded successfully! Shape: {tuple(info['shape'])}",
+        'dataset_id': dataset_id,
+        'data': info
+    })
+
+def parse_compact(value):
+    return str(value).lower() not in ('0', 'false', 'no')
+
 @app.route('/upload', methods=['POST'])
 def upload_file():
-    global current_dataset, original_dataset
-    
     try:
         if 'file' not in request.files:
             return jsonify({'error': 'No file selected'}), 400
@@ -38,38 +341,117 @@ def upload_file():
         if file.filename == '':
             return jsonify({'error': 'No file selected'}), 400
         
-        if not file.filename.lower().endswith('.csv'):
-            return jsonify({'error': 'Please upload a CSV file'}), 400
-        
-        # Read the CSV file
-        df = pd.read_csv(file)
-        current_dataset = df.copy()
-        original_dataset = df.copy()
+        try:
+            compression = detect_compression(file.filename)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        # Get basic info about the dataset
-        info = {
-            'shape': df.shape,
-            'columns': df.columns.tolist(),
-            'head': df.head().to_dict('records'),
-            'dtypes': df.dtypes.astype(str).to_dict()
-        }
-        
-        return jsonify({
-            'success': True,
-            'message': f'Dataset loaded successfully! Shape: {df.shape}',
-            'data': info
-        })
+        # Read the CSV file, decompressing it on the fly
+        with timed('csv_parse'):
+            df = pd.read_csv(open_decompressed(file.stream, compression))
+        compact = parse_compact(request.form.get('compact', COMPACT_DATASETS))
+        dataset_id, info = store_dataset(df, compact)
+        return use_dataset(dataset_id, info)
         
     except Exception as e:
         return jsonify({'error': f'Error loading file: {str(e)}'}), 500
 
+def load_chunked_upload(chunks, options, holder):
+    """UploadStore loader: store the parsed chunks of a chunked upload"""
+    df = pd.concat(chunks, ignore_index=True)
+    dataset_id, info = store_dataset(df, parse_compact(options.get('compact', COMPACT_DATASETS)),
+                                     holder)
+    # Stored as JSON until the upload is completed, possibly by another worker
+    return json.loads(app.json.dumps({'dataset_id': dataset_id, 'info': info}))
+
+@app.route('/uploads', methods=['POST'])
+def start_chunked_upload():
+    """Open a chunked upload for a CSV larger than one request (.csv, .csv.gz or .csv.zst).
+
+    Send the parts with PUT /uploads/<id>/parts/<index>, in any order and
+    again after a failure; GET /uploads/<id> lists the missing parts and
+    POST /uploads/<id>/complete loads the dataset. Parsing starts as soon
+    as the first part arrives. An upload opened with "stream": true is not
+    parsed; pass its ID to /cluster_stream once all parts are in instead.
+    """
+    try:
+        data = request.json or {}
+        stream = bool(data.get('stream'))
+        try:
+            upload_id = upload_store.create(data.get('filename', ''), data.get('size', 0),
+                                            data.get('part_size'),
+                                            options={'compact': data.get('compact', COMPACT_DATASETS),
+                                                     'stream': stream})
+        except (TypeError, ValueError) as e:
+            return jsonify({'error': str(e)}), 400
+        if not stream:
+            upload_store.start_parsing(upload_id, load_chunked_upload)
+        return jsonify(dict(upload_store.status(upload_id), success=True,
+                            parts_url=f'/uploads/{upload_id}/parts',
+                            status_url=f'/uploads/{upload_id}',
+                            complete_url=f'/uploads/{upload_id}/complete')), 201
+    
+    except Exception as e:
+        return jsonify({'error': f'Error starting upload: {str(e)}'}), 500
+
+@app.route('/uploads/<upload_id>/parts/<int:index>', methods=['PUT'])
+def upload_part(upload_id, index):
+    try:
+        with timed('upload_part'):
+            upload_store.write_part(upload_id, index, request.get_data(cache=False))
+    except KeyError:
+        return jsonify({'error': 'Upload not found'}), 404
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    status = upload_store.status(upload_id)
+    if status is None:
+        return jsonify({'error': 'Upload not found'}), 404
+    return jsonify({'success': True, 'received_parts': status['received_parts'],
+                    'missing_parts': len(status['missing_parts']),
+                    'parsed_rows': status['parsed_rows']})
+
+@app.route('/uploads/<upload_id>')
+def chunked_upload_status(upload_id):
+    status = upload_store.status(upload_id)
+    if status is None:
+        return jsonify({'error': 'Upload not found'}), 404
+    return jsonify(status)
+
+@app.route('/uploads/<upload_id>/complete', methods=['POST'])
+def complete_chunked_upload(upload_id):
+    """Wait for the parser to finish and make the upload this session's dataset"""
+    meta = upload_store.meta(upload_id)
+    if meta is not None and meta['options'].get('stream'):
+        return jsonify({'error': 'This upload is for /cluster_stream and is not loaded as a dataset'}), 400
+    try:
+        result = upload_store.complete(upload_id, load_chunked_upload, 'upload',
+                                       timeout=UPLOAD_COMPLETE_TIMEOUT)
+    except KeyError:
+        return jsonify({'error': 'Upload not found'}), 404
+    except ValueError as e:
+        return jsonify({'error': f'Error loading file: {str(e)}'}), 400
+    except TimeoutError as e:
+        # Still parsing; the client can simply complete again
+        return jsonify({'error': str(e)}), 503
+    except Exception as e:
+        return jsonify({'error': f'Error loading file: {str(e)}'}), 500
+    return use_dataset(result['dataset_id'], result['info'])
+
+@app.route('/uploads/<upload_id>', methods=['DELETE'])
+def abort_chunked_upload(upload_id):
+    if upload_store.meta(upload_id) is None:
+        return jsonify({'error': 'Upload not found'}), 404
+    upload_store.remove(upload_id)
+    return jsonify({'success': True, 'message': 'Upload aborted'})
+
 @app.route('/cluster', methods=['POST'])
 def perform_clustering():
-    global current_dataset
-    
     try:
-        if current_dataset is None:
+        dataset_id = get_dataset_id()
+        if dataset_id is None:
             return jsonify({'error': 'No dataset loaded'}), 400
+        entry = dataset_store.get(dataset_id)
+        dataset = entry.original
         
         data = request.json
         selected_columns = data.get('columns', [])
@@ -81,104 +463,526 @@ def perform_clustering():
         if n_clusters < 2:
             return jsonify({'error': 'Number of clusters must be at least 2'}), 400
         
-        # Check if selected columns exist and are numeric
-        numeric_columns = []
-        for col in selected_columns:
-            if col not in current_dataset.columns:
-                return jsonify({'error': f'Column "{col}" not found'}), 400
-            if not pd.api.types.is_numeric_dtype(current_dataset[col]):
-                return jsonify({'error': f'Column "{col}" is not numeric'}), 400
-            numeric_columns.append(col)
+        try:
+            with timed('validation'):
+                numeric_columns = validate_columns(dataset, selected_columns)
+            engine, dtype, seeding = get_engine_options(data)
+            restarts = get_restart_method(data, seeding)
+            reduction = get_reduction_options(data)
+            # A model is only saved when the client names it, as with /cluster_stream
+            model_name = data.get('model_name')
+            if model_name is not None:
+                check_model_name(model_name)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        # Reuse the scaled matrix if these columns were preprocessed before;
+        # otherwise only the selected columns are shipped to the worker process
+        features, X = get_cached_features(entry, numeric_columns, dtype)
         
-        # Extract features for clustering
-        X = current_dataset[numeric_columns].copy()
+        def finish(result):
+            # Runs in this process once the worker is done
+            metrics.record_breakdown(result['timings'])
+            metrics.record_fit(engine, result['n_iter'], result['converged'])
+            cache_features(entry, numeric_columns, result, dtype)
+            dataset_store.set_labels(dataset_id, result['labels'])
+            projection = result.pop('projection', None)
+            result_id = register_result(dataset_id, numeric_columns, result['labels'], projection)
+            current_dataset = dataset_store.get(dataset_id).current
+            
+            response = {
+                'success': True,
+                'message': f'Clustering completed! {n_clusters} clusters created.',
+                'cluster_stats': result['cluster_stats'],
+                # count, mean, std, min/max and quartiles of every column per cluster
+                'cluster_profile': result['cluster_profile'],
+                'result_id': result_id,
+                # Plots are rendered on demand by /plot instead of being inlined as base64;
+                # after a reduction they show the first two principal components
+                'plot_url': f'/plot/{result_id}' if projection or len(numeric_columns) >= 2 else None,
+                # The export is built lazily when someone actually downloads it
+                'download_url': f'/download?result_id={result_id}',
+                'inertia': result['inertia'],
+                'n_iter': result['n_iter'],
+                'converged': result['converged'],
+                'seeding': result['seeding'],
+                # Workers used and restarts abandoned, with parallel restarts
+                'restarts': result['restarts'],
+                # Dimensions kept, variance retained and time saved, when reduced
+                'reduction': result['reduction'],
+                # Time and memory growth of each stage in the worker
+                'timings': result['timings'],
+                'clustered_data': current_dataset.head(10).to_dict('records')
+            }
+            if model_name is not None:
+                version = model_registry.save(model_name, numeric_columns, **result['model'], metadata={
+                    'engine': engine, 'inertia': result['inertia'], 'n_rows': len(result['labels']),
+                    'reduction': result['reduction']['method'] if result['reduction'] else 'none'
+                })
+                response['model'] = {'name': model_name, 'version': version}
+            return response
         
-        # Handle missing values
-        if X.isnull().any().any():
-            X = X.fillna(X.mean())
+        return submit_job('cluster', run_clustering_job, numeric_columns, n_clusters, X, features,
+                          engine, dtype, seeding, bool(data.get('compare_seeding')), reduction,
+                          bool(data.get('compare_reduction')), restarts, RESTART_WORKERS,
+                          dataset_id=dataset_id, on_success=finish)
+        
+    except Exception as e:
+        return jsonify({'error': f'Error during clustering: {str(e)}'}), 500
+
+@app.route('/sweep', methods=['POST'])
+def sweep_clusters():
+    """Evaluate a range of K values on one scaled matrix to help choose K"""
+    try:
+        dataset_id = get_dataset_id()
+        if dataset_id is None:
+            return jsonify({'error': 'No dataset loaded'}), 400
+        entry = dataset_store.get(dataset_id)
+        dataset = entry.original
         
-        # Standardize the features
-        scaler = StandardScaler()
-        X_scaled = scaler.fit_transform(X)
+        data = request.json
+        selected_columns = data.get('columns', [])
+        k_min = int(data.get('k_min', 2))
+        k_max = int(data.get('k_max', 10))
         
-        # Perform K-Means clustering
-        kmeans = KMeans(n_clusters=n_clusters, random_state=42, n_init=10)
-        cluster_labels = kmeans.fit_predict(X_scaled)
+        if not selected_columns:
+            return jsonify({'error': 'Please select at least one column'}), 400
         
-        # Add cluster labels to the dataset
-        current_dataset['Cluster'] = cluster_labels
+        if k_min < 2 or k_max < k_min:
+            return jsonify({'error': 'K range must satisfy 2 <= k_min <= k_max'}), 400
         
-        # Save the clustered dataset
-        output_path = 'clustered_dataset.csv'
-        current_dataset.to_csv(output_path, index=False)
+        try:
+            with timed('validation'):
+                numeric_columns = validate_columns(dataset, selected_columns)
+            engine, dtype, seeding = get_engine_options(data)
+            reduction = get_reduction_options(data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        # Create visualization if at least 2 features are selected
-        plot_data = None
-        if len(numeric_columns) >= 2:
-            plot_data = create_cluster_plot(X, cluster_labels, numeric_columns[:2])
+        features, X = get_cached_features(entry, numeric_columns, dtype)
         
-        # Get cluster statistics
-        cluster_stats = current_dataset.groupby('Cluster').size().to_dict()
+        def finish(result):
+            metrics.record_breakdown(result['timings'])
+            cache_features(entry, numeric_columns, result, dtype)
+            return {
+                'success': True,
+                'message': f'Evaluated K from {k_min} to {k_max}. Recommended K: {result["recommended_k"]}',
+                **result
+            }
         
-        return jsonify({
-            'success': True,
-            'message': f'Clustering completed! {n_clusters} clusters created.',
-            'cluster_stats': cluster_stats,
-            'plot': plot_data,
-            'clustered_data': current_dataset.head(10).to_dict('records')
-        })
+        # The candidates share the job's cores, like parallel restarts do
+        return submit_job('sweep', run_sweep_job, list(range(k_min, k_max + 1)), X, features,
+                          RESTART_WORKERS, engine, dtype, seeding, reduction, dataset_id=dataset_id,
+                          on_success=finish)
         
     except Exception as e:
-        return jsonify({'error': f'Error during clustering: {str(e)}'}), 500
+        return jsonify({'error': f'Error during K sweep: {str(e)}'}), 500
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(dict(job.to_dict(), progress=job_manager.watch(job_id)))
 
-def create_cluster_plot(X, cluster_labels, feature_names):
-    """Create a scatter plot of the first two features colored by cluster"""
+def format_event(event, data):
+    """One server-sent event with a JSON payload"""
+    return f'event: {event}\ndata: {app.json.dumps(data)}\n\n'
+
+@app.route('/jobs/<job_id>/events')
+def job_events(job_id):
+    """Stream a job's progress as server-sent events until it finishes.
+
+    'progress' events carry the stage and, while fitting, the restart out of
+    n_init, the iteration and the inertia; a final 'done' event carries the
+    job status. Progress is read from the shared job files, so any worker can
+    serve the stream. Beyond MAX_EVENT_STREAMS open streams the answer is
+    503, and clients poll /jobs/<job_id> instead.
+    """
+    if job_manager.get(job_id) is None:
+        return jsonify({'error': 'Job not found'}), 404
+    if not event_stream_slots.acquire(blocking=False):
+        response = jsonify({'error': 'Too many open event streams, poll the job status instead'})
+        response.headers['Retry-After'] = '5'
+        return response, 503
+    
+    def events():
+        last_progress = None
+        last_sent = time.monotonic()
+        while True:
+            job = job_manager.get(job_id)
+            if job is None or job.finished_at is not None or job.state == 'cancelled':
+                yield format_event('done', job.to_dict() if job is not None else {'job_id': job_id})
+                return
+            progress = job_manager.watch(job_id)
+            if progress is not None and progress != last_progress:
+                yield format_event('progress', progress)
+                last_progress, last_sent = progress, time.monotonic()
+            elif time.monotonic() - last_sent >= EVENT_KEEPALIVE_SECONDS:
+                # Comment line, so proxies do not close an idle stream
+                yield ': keep-alive\n\n'
+                last_sent = time.monotonic()
+            time.sleep(EVENT_POLL_SECONDS)
+    
+    response = Response(events(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        # Tell nginx-style proxies not to buffer the stream
+        'X-Accel-Buffering': 'no'
+    })
+    # Runs when the stream ends or the client goes away, even if it never started
+    response.call_on_close(event_stream_slots.release)
+    return response
+
+@app.route('/jobs/<job_id>/result')
+def job_result(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    if job.state == 'done':
+        return jsonify(job.result)
+    if job.state == 'failed':
+        return jsonify({'error': f'Error during clustering: {job.error}'}), 500
+    if job.state == 'cancelled':
+        return jsonify({'error': 'Job was cancelled'}), 410
+    return jsonify(job.to_dict()), 202
+
+@app.route('/jobs/<job_id>/cancel', methods=['POST', 'DELETE'])
+def cancel_job(job_id):
+    if not job_manager.cancel(job_id):
+        return jsonify({'error': 'Job not found or already finished'}), 404
+    return jsonify({'success': True, 'message': 'Job cancelled'})
+
+@app.route('/plot/<result_id>')
+def cluster_plot(result_id):
+    """Render (or serve from cache) a cluster plot for a clustering result.
+
+    Results of a reduced fit are plotted on their first two principal
+    components unless x and y name columns to plot instead.
+    """
+    result = result_store.get(result_id)
+    if result is None:
+        return jsonify({'error': 'Result not found'}), 404
+    
+    columns = result['columns']
+    mode = request.args.get('mode', 'auto')
+    if mode not in PLOT_MODES:
+        return jsonify({'error': f"Plot mode must be one of {', '.join(PLOT_MODES)}"}), 400
+    
+    projected = result['projection'] is not None and not ('x' in request.args or 'y' in request.args)
+    if projected:
+        key = (result_id, None, None, mode)
+    else:
+        x_col = request.args.get('x', columns[0])
+        y_col = request.args.get('y', columns[1] if len(columns) > 1 else columns[0])
+        key = (result_id, x_col, y_col, mode)
+    png = plot_cache.get(key)
+    if png is None and projected:
+        with timed('plot'):
+            xy = result['projection']
+            png = render_cluster_plot(xy[:, 0], xy[:, 1], result['labels'], result['axes'],
+                                      mode=mode)
+        plot_cache.put(key, png)
+    elif png is None:
+        try:
+            dataset = dataset_store.get(result['dataset_id']).original
+            numeric_columns = validate_columns(dataset, [x_col, y_col])
+        except KeyError:
+            return jsonify({'error': 'Dataset no longer available'}), 404
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        with timed('plot'):
+            png = render_cluster_plot(dataset[numeric_columns[0]], dataset[numeric_columns[1]],
+                                      result['labels'], numeric_columns, mode=mode)
+        plot_cache.put(key, png)
+    
+    response = send_file(io.BytesIO(png), mimetype='image/png')
+    response.headers['Cache-Control'] = 'private, max-age=3600'
+    return response
+
+@app.route('/cache')
+def cache_stats():
+    return jsonify(feature_cache.stats())
+
+@app.route('/cluster_stream', methods=['POST'])
+def cluster_stream():
+    """Cluster a CSV out-of-core as a job, without loading it into memory.
+
+    Send the file in a multipart form (up to MAX_UPLOAD_MB), or the ID of a
+    chunked upload opened with "stream": true and fully received, in JSON.
+    Either may be gzip or zstd compressed.
+    """
     try:
-        plt.figure(figsize=(10, 8))
+        if request.files:
+            data = request.form
+            selected_columns = [c.strip() for c in data.get('columns', '').split(',') if c.strip()]
+        else:
+            data = request.get_json(silent=True) or {}
+            selected_columns = data.get('columns', [])
+        n_clusters = int(data.get('n_clusters', 3))
+        chunksize = int(data.get('chunksize', DEFAULT_CHUNKSIZE))
         
-        # Create scatter plot
-        unique_clusters = np.unique(cluster_labels)
-        colors = plt.cm.Set1(np.linspace(0, 1, len(unique_clusters)))
+        if not selected_columns:
+            return jsonify({'error': 'Please select at least one column'}), 400
+        if n_clusters < 2:
+            return jsonify({'error': 'Number of clusters must be at least 2'}), 400
+        if chunksize < 1:
+            return jsonify({'error': 'Chunk size must be positive'}), 400
+        model_name = data.get('model_name')
+        if model_name is not None:
+            check_model_name(model_name)
         
-        for i, cluster in enumerate(unique_clusters):
-            mask = cluster_labels == cluster
-            plt.scatter(X.iloc[mask, 0], X.iloc[mask, 1], 
-                       c=[colors[i]], label=f'Cluster {cluster}', alpha=0.7)
+        # The input is spooled to disk so it is never held in memory as a whole;
+        # every run gets its own output file so concurrent users never clobber each other
+        run_id = uuid.uuid4().hex
+        spool_path = os.path.join(app.config['UPLOAD_FOLDER'], f'{run_id}.stream')
+        export_path = os.path.join(EXPORT_FOLDER, f'{run_id}.csv')
+        if 'file' in request.files:
+            file = request.files['file']
+            compression = detect_compression(file.filename)
+            file.save(spool_path)
+        elif data.get('upload_id') is not None:
+            meta = upload_store.meta(data['upload_id'])
+            if meta is None:
+                return jsonify({'error': 'Upload not found'}), 404
+            if not meta['options'].get('stream'):
+                return jsonify({'error': 'Open the upload with "stream": true to cluster it out-of-core'}), 400
+            try:
+                compression = upload_store.claim(data['upload_id'], spool_path)
+            except KeyError:
+                return jsonify({'error': 'Upload not found'}), 404
+        else:
+            return jsonify({'error': 'No file selected'}), 400
         
-        plt.xlabel(feature_names[0])
-        plt.ylabel(feature_names[1])
-        plt.title('K-Means Clustering Results')
-        plt.legend()
-        plt.grid(True, alpha=0.3)
+        def finish(result):
+            # Runs in this process once the worker is done
+            metrics.record_breakdown(result['timings'])
+            prune_exports(keep=export_path)
+            response = {
+                'success': True,
+                'message': f'Clustering completed! {n_clusters} clusters created from {result["n_rows"]} rows.',
+                'cluster_stats': result['cluster_stats'],
+                'cluster_profile': result['cluster_profile'],
+                'inertia': result['inertia'],
+                'plot_url': None,
+                'download_url': f'/exports/{run_id}',
+                'timings': result['timings']
+            }
+            if model_name is not None:
+                version = model_registry.save(model_name, selected_columns, **result['model'],
+                                              metadata={'engine': 'minibatch', 'inertia': result['inertia'],
+                                                        'n_rows': result['n_rows']})
+                response['model'] = {'name': model_name, 'version': version}
+            return response
         
-        # Convert plot to base64 string
-        img_buffer = io.BytesIO()
-        plt.savefig(img_buffer, format='png', dpi=150, bbox_inches='tight')
-        img_buffer.seek(0)
-        plot_data = base64.b64encode(img_buffer.getvalue()).decode()
-        plt.close()
+        def remove_spool():
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(spool_path)
         
-        return plot_data
+        return submit_job('cluster_stream', run_streaming_job, spool_path, selected_columns,
+                          n_clusters, export_path, chunksize, compression,
+                          on_success=finish, on_done=remove_spool)
         
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
-        print(f"Error creating plot: {e}")
-        return None
+        return jsonify({'error': f'Error during clustering: {str(e)}'}), 500
 
 @app.route('/download')
 def download_file():
+    """Stream the clustered dataset as CSV, gzipped CSV or a NumPy .npz archive"""
     try:
-        return send_file('clustered_dataset.csv', as_attachment=True)
+        fmt = request.args.get('format', 'csv')
+        if fmt not in EXPORT_FORMATS:
+            return jsonify({'error': f"Export format must be one of {', '.join(EXPORT_FORMATS)}"}), 400
+        
+        result_id = request.args.get('result_id')
+        if result_id is not None:
+            result = result_store.get(result_id)
+            if result is None:
+                return jsonify({'error': 'Result not found'}), 404
+            dataset_id, labels = result['dataset_id'], result['labels']
+        else:
+            dataset_id = get_dataset_id()
+            if dataset_id is None:
+                return jsonify({'error': 'No dataset loaded'}), 400
+            labels = dataset_store.get(dataset_id).labels
+        
+        if labels is None:
+            return jsonify({'error': 'Run clustering before downloading'}), 400
+        dataset = dataset_store.get(dataset_id).original
+        
+        mimetype, extension = EXPORT_FORMATS[fmt]
+        stream = timed_iter(f'export_{fmt}', iter_export(dataset, labels, fmt))
+        return Response(stream, mimetype=mimetype, headers={
+            'Content-Disposition': f'attachment; filename=clustered_dataset.{extension}'
+        })
+        
+    except KeyError:
+        return jsonify({'error': 'Dataset no longer available'}), 404
     except Exception as e:
         return jsonify({'error': f'Error downloading file: {str(e)}'}), 500
 
+@app.route('/rows')
+def browse_rows():
+    """Return one page of the (clustered) dataset: offset/limit, columns, cluster filter and format"""
+    try:
+        offset = request.args.get('offset', 0, type=int)
+        limit = request.args.get('limit', 100, type=int)
+        if offset < 0 or not 0 < limit <= MAX_PAGE_ROWS:
+            return jsonify({'error': f'offset must be >= 0 and limit between 1 and {MAX_PAGE_ROWS}'}), 400
+        fmt = request.args.get('format', 'records')
+        if fmt not in ROW_FORMATS:
+            return jsonify({'error': f"Format must be one of {', '.join(ROW_FORMATS)}"}), 400
+        
+        result_id = request.args.get('result_id')
+        if result_id is not None:
+            result = result_store.get(result_id)
+            if result is None:
+                return jsonify({'error': 'Result not found'}), 404
+            dataset_id, labels = result['dataset_id'], result['labels']
+        else:
+            dataset_id = get_dataset_id()
+            if dataset_id is None:
+                return jsonify({'error': 'No dataset loaded'}), 400
+            labels = dataset_store.get(dataset_id).labels
+        dataset = dataset_store.get(dataset_id).original
+        
+        columns = request.args.get('columns')
+        if columns is not None:
+            columns = [c for c in columns.split(',') if c]
+            missing = [c for c in columns if c not in dataset.columns]
+            if missing:
+                return jsonify({'error': f"Unknown columns: {', '.join(missing)}"}), 400
+        clusters = request.args.get('cluster')
+        if clusters is not None:
+            if labels is None:
+                return jsonify({'error': 'Run clustering before filtering by cluster'}), 400
+            try:
+                clusters = [int(c) for c in clusters.split(',') if c]
+            except ValueError:
+                return jsonify({'error': 'cluster must be a comma-separated list of cluster IDs'}), 400
+        
+        with timed('rows_select'):
+            page, positions, total = select_rows(dataset, labels, offset, limit, columns, clusters)
+        headers = {'X-Total-Rows': str(total)}
+        if fmt == 'npz':
+            # Row positions travel as an extra array next to the columns
+            page = page.copy(deep=False)
+            page['_row'] = positions
+            return Response(timed_iter('rows_npz', iter_npz(page, None)),
+                            mimetype='application/octet-stream', headers=headers)
+        with timed('rows_encode'):
+            rows = page_to_json(page, fmt)
+        return jsonify({
+            'offset': offset,
+            'limit': limit,
+            'total': int(total),
+            'columns': [str(name) for name in page.columns],
+            'row_index': positions.tolist(),
+            'rows': rows
+        }), 200, headers
+        
+    except KeyError:
+        return jsonify({'error': 'Dataset no longer available'}), 404
+    except Exception as e:
+        return jsonify({'error': f'Error reading rows: {str(e)}'}), 500
+
+@app.route('/exports/<run_id>')
+def download_export(run_id):
+    """Download the output of a streaming clustering run"""
+    if not re.fullmatch(r'[0-9a-f]{32}', run_id):
+        return jsonify({'error': 'Export not found'}), 404
+    path = os.path.join(EXPORT_FOLDER, f'{run_id}.csv')
+    if not os.path.exists(path):
+        return jsonify({'error': 'Export not found'}), 404
+    return send_file(os.path.abspath(path), as_attachment=True, download_name='clustered_dataset.csv')
+
+@app.route('/models')
+def list_models():
+    """List saved models and their versions"""
+    return jsonify(model_registry.list())
+
+@app.route('/models/<name>')
+def model_info(name):
+    """Describe one model version (the latest unless ?version= is given)"""
+    try:
+        return jsonify(model_registry.load(name, request.args.get('version')).info())
+    except (KeyError, ValueError):
+        return jsonify({'error': 'Model not found'}), 404
+
+@app.route('/predict', methods=['POST'])
+def predict():
+    """Assign new rows to the clusters of a saved model without refitting.
+
+    Accepts either a JSON body {"model", "version"?, "rows"} where rows are objects keyed
+    by column or lists in the model's column order, or a CSV upload with form fields
+    model, version and format ("json" for labels, "csv" for the file with a Cluster column).
+    An optional assignment of "brute" or "kdtree" overrides the automatic choice of
+    nearest-centroid search.
+    """
+    try:
+        if request.is_json:
+            params = request.get_json(silent=True) or {}
+            rows = params.get('rows')
+            if not isinstance(rows, list) or not rows:
+                return jsonify({'error': 'Please provide rows to score'}), 400
+            fmt = 'json'
+        else:
+            params = request.form
+            if 'file' not in request.files or request.files['file'].filename == '':
+                return jsonify({'error': 'No file selected'}), 400
+            fmt = params.get('format', 'json')
+            if fmt not in ('json', 'csv'):
+                return jsonify({'error': 'Format must be json or csv'}), 400
+        
+        name = params.get('model')
+        if not name:
+            return jsonify({'error': 'Please choose a model'}), 400
+        try:
+            model = model_registry.load(name, params.get('version'))
+        except KeyError:
+            return jsonify({'error': f'Model "{name}" not found'}), 404
+        
+        if request.is_json:
+            X = pd.DataFrame(rows) if isinstance(rows[0], dict) else rows
+        else:
+            with timed('csv_parse'):
+                X = pd.read_csv(request.files['file'])
+        with timed('predict'):
+            labels, distances = model.predict(X, params.get('assignment'))
+        
+        if fmt == 'csv':
+            return Response(timed_iter('export_csv', iter_export(X, labels, 'csv')), mimetype='text/csv', headers={
+                'Content-Disposition': 'attachment; filename=predicted.csv'
+            })
+        return jsonify({
+            'success': True,
+            'model': {'name': model.name, 'version': model.version},
+            'n_rows': len(labels),
+            'labels': labels.tolist(),
+            'distances': distances.tolist()
+        })
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': f'Error during prediction: {str(e)}'}), 500
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus text exposition of stage timings, fit statistics and resource gauges"""
+    return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/reset')
 def reset_dataset():
-    global current_dataset, original_dataset
-    if original_dataset is not None:
-        current_dataset = original_dataset.copy()
+    dataset_id = get_dataset_id()
+    if dataset_id is not None:
+        dataset_store.reset(dataset_id)
         return jsonify({'success': True, 'message': 'Dataset reset successfully'})
     return jsonify({'error': 'No original dataset to reset to'}), 400
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
+    # scikit-learn and Matplotlib load in the background while the server starts answering
+    prewarm()
     app.run(host='0.0.0.0', port=port, debug=False)
\ No newline at end of file
@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+"""
+Benchmark harness for the clustering pipeline.
+
+Generates synthetic blob datasets over a grid of rows, columns and K, runs
+them through the command-line path (clustering_tool.perform_clustering,
+plot rendering, CSV writing) and through the web app via Flask's test client
+(/upload, /cluster, /plot, /download), and records the wall time and peak
+memory of every stage. Results are written as JSON so two runs can be
+compared with --compare.
+
+    python benchmark.py --rows 10000,100000 --cols 2,10 --k 3,8 --output bench.json
+    python benchmark.py --compare bench.json --output new.json
+
+The assignment suite times nearest-centroid assignment by brute force and
+with a KD-tree over the centers for each (rows, cols, k) and reports the
+smallest K from which the tree is faster, per number of columns:
+
+    python benchmark.py --suite assignment --rows 100000 --cols 2,4,8,16 --k 64,256,1024,4096
+
+The engines suite fits every grid point with each K-Means engine (k-means++
+seeding and 10 restarts, as the app does) and reports the faster one:
+
+    python benchmark.py --suite engines --rows 200000 --cols 2,16 --k 50,256
+
+Peak memory is the peak of Python-tracked allocations (tracemalloc, which
+includes NumPy buffers) in this process. Web clustering runs in a worker
+process, so for it the largest worker RSS seen so far is reported as well.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+os.environ.setdefault('MPLBACKEND', 'Agg')
+
+import numpy as np
+import pandas as pd
+from sklearn.datasets import make_blobs
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+STAGES_CLI = ('cli_cluster', 'cli_plot', 'cli_csv_write')
+STAGES_WEB = ('web_upload', 'web_cluster', 'web_plot', 'web_download')
+SUITE_DEFAULTS = {
+    'pipeline': {'rows': [1000, 10000, 100000], 'cols': [2, 10], 'k': [3, 8]},
+    'assignment': {'rows': [100000], 'cols': [2, 4, 8, 16], 'k': [16, 64, 256, 1024, 4096]},
+    'engines': {'rows': [200000], 'cols': [2, 16], 'k': [50, 256]},
+}
+
+
+def parse_int_list(text):
+    try:
+        return [int(x) for x in text.split(',') if x.strip()]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected comma-separated integers, got '{text}'")
+
+
+def make_dataset(n_rows, n_cols, n_clusters, seed=0):
+    """Blob data with a few missing values and a text column, like a typical upload"""
+    X, _ = make_blobs(n_samples=n_rows, n_features=n_cols, centers=n_clusters, random_state=seed)
+    df = pd.DataFrame(X, columns=[f'f{i}' for i in range(n_cols)])
+    rng = np.random.default_rng(seed)
+    df.iloc[rng.integers(n_rows, size=max(1, n_rows // 1000)), 0] = np.nan
+    df['name'] = np.array(['alpha', 'beta', 'gamma'])[rng.integers(3, size=n_rows)]
+    return df
+
+
+def children_maxrss():
+    """Largest RSS of any finished or running child process, in bytes (Unix only)"""
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+class Recorder:
+    """Time stages and collect one result row per stage"""
+
+    def __init__(self, trace_memory=True):
+        self.trace_memory = trace_memory
+        self.rows = []
+
+    @contextlib.contextmanager
+    def stage(self, name, **params):
+        row = {'stage': name, **params}
+        if self.trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        try:
+            yield row
+        finally:
+            row['seconds'] = time.perf_counter() - start
+            if self.trace_memory:
+                row['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+            self.rows.append(row)
+
+
+def bench_cli(recorder, df, columns, n_clusters, params):
+    """Command-line path: clustering, plot rendering and writing the clustered CSV"""
+    import clustering_tool
+    from clustering_core import feature_cache
+    from plotting import create_cluster_plot
+
+    # Every repeat measures a cold run, not a feature cache hit
+    feature_cache.clear()
+    with recorder.stage('cli_cluster', **params):
+        with contextlib.redirect_stdout(io.StringIO()):
+            df_clustered, X, labels, scaler, kmeans = clustering_tool.perform_clustering(
+                df, columns, n_clusters)
+    if len(columns) >= 2:
+        with recorder.stage('cli_plot', **params):
+            create_cluster_plot(X, labels, columns)
+    with recorder.stage('cli_csv_write', **params):
+        df_clustered.to_csv(io.StringIO(), index=False)
+
+
+def wait_for_job(client, response, timeout=3600):
+    job_id = response.get_json()['job_id']
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        result = client.get(f'/jobs/{job_id}/result')
+        if result.status_code != 202:
+            return result
+        time.sleep(0.01)
+    raise TimeoutError(f'Job {job_id} did not finish within {timeout}s')
+
+
+def bench_web(recorder, client, csv_bytes, columns, n_clusters, params):
+    """Web path through the Flask test client: upload, cluster job, plot and download"""
+    with recorder.stage('web_upload', **params):
+        response = client.post('/upload', data={'file': (io.BytesIO(csv_bytes), 'bench.csv')})
+    if response.status_code != 200:
+        raise RuntimeError(f"/upload failed: {response.get_json()}")
+
+    with recorder.stage('web_cluster', **params) as row:
+        response = wait_for_job(client, client.post('/cluster', json={
+            'columns': columns, 'n_clusters': n_clusters
+        }))
+    row['worker_maxrss_bytes'] = children_maxrss()
+    result = response.get_json()
+    if response.status_code != 200:
+        raise RuntimeError(f"/cluster failed: {result}")
+
+    if result.get('plot_url'):
+        with recorder.stage('web_plot', **params):
+            client.get(result['plot_url'])
+
+    with recorder.stage('web_download', **params):
+        response = client.get(result['download_url'])
+        response.get_data()
+
+
+def run_assignment_grid(args):
+    """Time brute-force and KD-tree nearest-centroid assignment over the grid"""
+    from kmeans_engine import nearest_two
+
+    recorder = Recorder(trace_memory=not args.no_memory)
+    for n_rows in args.rows:
+        for n_cols in args.cols:
+            for n_clusters in args.k:
+                X, _ = make_blobs(n_samples=n_rows, n_features=n_cols, centers=n_clusters,
+                                  random_state=args.seed)
+                rng = np.random.default_rng(args.seed)
+                centers = X[rng.choice(n_rows, size=min(n_clusters, n_rows), replace=False)]
+                x_sq = np.einsum('ij,ij->i', X, X)
+                for repeat in range(args.repeats):
+                    params = {'rows': n_rows, 'cols': n_cols, 'k': n_clusters, 'repeat': repeat}
+                    print(f"⏱️  rows={n_rows} cols={n_cols} k={n_clusters} repeat={repeat}")
+                    for method in ('brute', 'kdtree'):
+                        with recorder.stage(f'assign_{method}', **params):
+                            nearest_two(X, centers, x_sq, method=method)
+    return recorder.rows
+
+
+def print_crossover(summary):
+    """Print, per (rows, cols), the smallest K from which the KD-tree beats brute force"""
+    print(f"\n{'rows':>9} {'cols':>5}  KD-tree faster from K")
+    for n_rows, n_cols in sorted({(key[0], key[1]) for key in summary}):
+        ks = sorted({key[2] for key in summary if key[:2] == (n_rows, n_cols)})
+        faster = [k for k in ks
+                  if summary[(n_rows, n_cols, k, 'assign_kdtree')]['seconds']
+                  < summary[(n_rows, n_cols, k, 'assign_brute')]['seconds']]
+        # The crossover is where the tree starts winning and keeps winning for larger K
+        crossover = next((k for k in ks if all(larger in faster for larger in ks if larger >= k)), None)
+        print(f"{n_rows:>9} {n_cols:>5}  {crossover if crossover is not None else 'never (up to ' + str(ks[-1]) + ')'}")
+
+
+def run_engine_grid(args):
+    """Time a full fit (seeding and every restart) with each K-Means engine over the grid"""
+    from kmeans_engine import ENGINES, get_engine
+
+    recorder = Recorder(trace_memory=not args.no_memory)
+    for n_rows in args.rows:
+        for n_cols in args.cols:
+            for n_clusters in args.k:
+                X, _ = make_blobs(n_samples=n_rows, n_features=n_cols, centers=n_clusters,
+                                  random_state=args.seed)
+                X = (X - X.mean(axis=0)) / X.std(axis=0)
+                for repeat in range(args.repeats):
+                    params = {'rows': n_rows, 'cols': n_cols, 'k': n_clusters, 'repeat': repeat}
+                    print(f"⏱️  rows={n_rows} cols={n_cols} k={n_clusters} repeat={repeat}")
+                    for name in sorted(ENGINES):
+                        with recorder.stage(f'fit_{name}', **params) as row:
+                            model = get_engine(name).fit(X, n_clusters, random_state=args.seed)
+                        row['n_iter'] = int(model.n_iter_)
+    return recorder.rows
+
+
+def print_engine_winners(summary):
+    """Print, per grid point, the faster engine and its speed-up over the other"""
+    print(f"\n{'rows':>9} {'cols':>5} {'k':>5}  faster engine")
+    for point in sorted({key[:3] for key in summary}):
+        seconds = {key[3][len('fit_'):]: stats['seconds']
+                   for key, stats in summary.items() if key[:3] == point}
+        ranked = sorted(seconds, key=seconds.get)
+        print(f"{point[0]:>9} {point[1]:>5} {point[2]:>5}  {ranked[0]} "
+              f"({seconds[ranked[-1]] / seconds[ranked[0]]:.2f}x)")
+
+
+def run_grid(args):
+    recorder = Recorder(trace_memory=not args.no_memory)
+    client = None
+    if 'web' in args.paths:
+        import app
+        # The benchmark uploads files larger than the default request limit
+        app.app.config['MAX_CONTENT_LENGTH'] = None
+        client = app.app.test_client()
+
+    for n_rows in args.rows:
+        for n_cols in args.cols:
+            for n_clusters in args.k:
+                df = make_dataset(n_rows, n_cols, n_clusters, seed=args.seed)
+                columns = [c for c in df.columns if c != 'name']
+                csv_bytes = df.to_csv(index=False).encode() if client else None
+                for repeat in range(args.repeats):
+                    params = {'rows': n_rows, 'cols': n_cols, 'k': n_clusters, 'repeat': repeat}
+                    print(f"⏱️  rows={n_rows} cols={n_cols} k={n_clusters} repeat={repeat}")
+                    if 'cli' in args.paths:
+                        bench_cli(recorder, df, columns, n_clusters, params)
+                    if client is not None:
+                        bench_web(recorder, client, csv_bytes, columns, n_clusters, params)
+    return recorder.rows
+
+
+def environment():
+    """Versions and machine details stored with the results"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ''
+    import sklearn
+    return {
+        'commit': commit or None,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'sklearn': sklearn.__version__,
+        'timestamp': time.time(),
+    }
+
+
+def summarize(rows):
+    """Median seconds and peak bytes per (rows, cols, k, stage)"""
+    groups = {}
+    for row in rows:
+        key = (row['rows'], row['cols'], row['k'], row['stage'])
+        groups.setdefault(key, []).append(row)
+    summary = {}
+    for key, group in groups.items():
+        summary[key] = {
+            'seconds': statistics.median(r['seconds'] for r in group),
+            'peak_bytes': max((r.get('peak_bytes') or 0) for r in group) or None,
+        }
+    return summary
+
+
+def print_summary(summary, baseline=None):
+    header = f"{'rows':>9} {'cols':>5} {'k':>4} {'stage':<14} {'seconds':>9} {'peak MB':>9}"
+    print("\n" + header + ("  vs baseline" if baseline else ""))
+    for key in sorted(summary):
+        stats = summary[key]
+        peak = f"{stats['peak_bytes'] / 1e6:9.1f}" if stats['peak_bytes'] else f"{'n/a':>9}"
+        line = f"{key[0]:>9} {key[1]:>5} {key[2]:>4} {key[3]:<14} {stats['seconds']:>9.4f} {peak}"
+        if baseline and key in baseline:
+            ratio = stats['seconds'] / baseline[key]['seconds'] if baseline[key]['seconds'] else float('inf')
+            line += f"  {ratio:5.2f}x"
+        print(line)
+
+
+def load_results(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Benchmark the clustering pipeline stage by stage.')
+    parser.add_argument('--suite', choices=sorted(SUITE_DEFAULTS), default='pipeline',
+                        help='pipeline stages (default), nearest-centroid assignment methods '
+                             'or K-Means engines')
+    parser.add_argument('--rows', type=parse_int_list, default=None,
+                        help='comma-separated row counts (pipeline default 1000,10000,100000)')
+    parser.add_argument('--cols', type=parse_int_list, default=None,
+                        help='comma-separated column counts (pipeline default 2,10)')
+    parser.add_argument('--k', type=parse_int_list, default=None,
+                        help='comma-separated cluster counts (pipeline default 3,8)')
+    parser.add_argument('--repeats', type=int, default=3, help='runs per grid point')
+    parser.add_argument('--paths', choices=['cli', 'web'], nargs='+', default=['cli', 'web'],
+                        help='which code paths to drive')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-memory', action='store_true',
+                        help='skip tracemalloc, which adds overhead to allocation-heavy stages')
+    parser.add_argument('--output', default='benchmark_results.json', help='JSON results path')
+    parser.add_argument('--compare', metavar='BASELINE', help='JSON results of an earlier run')
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    for name, default in SUITE_DEFAULTS[args.suite].items():
+        if getattr(args, name) is None:
+            setattr(args, name, default)
+    output = os.path.abspath(args.output)
+    baseline = summarize(load_results(args.compare)['results']) if args.compare else None
+
+    # The web app writes uploads/ relative to the working directory; keep that out of the repo
+    workdir = tempfile.mkdtemp(prefix='kmeans-bench-')
+    previous_dir = os.getcwd()
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    os.chdir(workdir)
+    try:
+        suites = {'assignment': run_assignment_grid, 'engines': run_engine_grid, 'pipeline': run_grid}
+        rows = suites[args.suite](args)
+    finally:
+        os.chdir(previous_dir)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    with open(output, 'w') as f:
+        json.dump({'environment': environment(), 'config': vars(args), 'results': rows}, f, indent=1)
+    summary = summarize(rows)
+    print_summary(summary, baseline)
+    if args.suite == 'assignment':
+        print_crossover(summary)
+    elif args.suite == 'engines':
+        print_engine_winners(summary)
+    print(f"\n✅ Results written to {output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,425 @@
+"""
+Chunked, resumable uploads of large and compressed CSV files.
+
+A client opens an upload of a known size, sends it in fixed-size parts (each
+below the request size limit) in any order, asks which parts are still
+missing after a dropped connection, and completes the upload once all parts
+are in. Parts are written at their offset into one file under
+uploads/incoming/<id>/ and each received part leaves an empty marker file,
+so any server worker can accept any part (see shared_state.py).
+
+Parsing starts with the first part. A background thread in the worker that
+opened the upload reads the contiguous prefix of received parts as it grows,
+stream-decompresses it (gzip, or zstd when the zstandard package is
+installed) and parses it into DataFrame chunks, so ingest overlaps the
+transfer and completing an upload only waits for the last chunks. The
+parser holds a lock on the upload while it runs; if its worker dies, the
+request that completes the upload parses the assembled file itself. The
+same happens for uploads opened while a worker already runs max_parsers
+parsers, and for those whose parser gave up waiting for the next part.
+"""
+
+import contextlib
+import gzip
+import io
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+
+import pandas as pd
+
+from metrics import timed
+
+try:
+    import fcntl
+except ImportError:  # Windows: uploads are parsed when they are completed
+    fcntl = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+DEFAULT_PART_SIZE = 8 * 1024 * 1024
+MIN_PART_SIZE = 64 * 1024
+# Abandoned uploads are deleted after this long without a new part
+UPLOAD_TTL_SECONDS = int(os.environ.get('UPLOAD_TTL_SECONDS', 24 * 3600))
+# The background parser gives up after waiting this long for the next part
+PARSER_IDLE_SECONDS = 120
+# Background parser threads per process; further uploads are parsed when completed
+MAX_PARSER_THREADS = int(os.environ.get('MAX_PARSER_THREADS', 4))
+POLL_SECONDS = 0.05
+PARSE_CHUNK_ROWS = 100_000
+READ_BUFFER_BYTES = 1024 * 1024
+
+_UPLOAD_ID = re.compile(r'[0-9a-f]{32}')
+
+
+class UploadAborted(Exception):
+    """The upload was removed while it was being parsed"""
+
+
+def detect_compression(filename):
+    """Return None, 'gzip' or 'zstd' for a CSV file name; raises ValueError otherwise"""
+    name = filename.lower()
+    if name.endswith('.csv'):
+        return None
+    if name.endswith(('.csv.gz', '.csv.gzip')):
+        return 'gzip'
+    if name.endswith(('.csv.zst', '.csv.zstd')):
+        if zstandard is None:
+            raise ValueError('zstd-compressed uploads need the zstandard package on the server')
+        return 'zstd'
+    raise ValueError('Please upload a CSV file (optionally .gz or .zst compressed)')
+
+
+def open_decompressed(stream, compression):
+    """Wrap a binary stream so reads return the decompressed CSV bytes"""
+    if compression == 'gzip':
+        return gzip.GzipFile(fileobj=stream, mode='rb')
+    if compression == 'zstd':
+        return zstandard.ZstdDecompressor().stream_reader(stream, read_across_frames=True)
+    return stream
+
+
+def read_csv_chunks(stream, compression=None, chunksize=PARSE_CHUNK_ROWS):
+    """Yield DataFrame chunks of a (possibly compressed) binary CSV stream"""
+    with pd.read_csv(open_decompressed(stream, compression), chunksize=chunksize) as reader:
+        yield from reader
+
+
+class _GrowingFile(io.RawIOBase):
+    """Reads an upload's data file up to its contiguous received prefix, waiting for more"""
+
+    def __init__(self, store, upload_id, meta, idle_timeout):
+        self.store = store
+        self.upload_id = upload_id
+        self.size = meta['size']
+        self.part_size = meta['part_size']
+        self.idle_timeout = idle_timeout
+        self._fd = os.open(store._file(upload_id, 'data'), os.O_RDONLY)
+        self._position = 0
+        self._next_part = 0
+        self._available = 0
+
+    def readable(self):
+        return True
+
+    def _refresh(self):
+        while self.store._has_part(self.upload_id, self._next_part):
+            self._next_part += 1
+        self._available = min(self._next_part * self.part_size, self.size)
+
+    def readinto(self, buffer):
+        waited = 0.0
+        while self._position >= self._available:
+            if self._position >= self.size:
+                return 0
+            self._refresh()
+            if self._position < self._available:
+                break
+            if not os.path.isdir(self.store._path(self.upload_id)):
+                raise UploadAborted(self.upload_id)
+            if waited > self.idle_timeout:
+                raise TimeoutError(f'No new part of upload {self.upload_id} for {self.idle_timeout}s')
+            time.sleep(POLL_SECONDS)
+            waited += POLL_SECONDS
+        data = os.pread(self._fd, min(len(buffer), self._available - self._position), self._position)
+        buffer[:len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+    def close(self):
+        if not self.closed:
+            os.close(self._fd)
+        super().close()
+
+
+class UploadStore:
+    """Uploads in progress, shared by all server workers through files.
+
+    load(chunks, options, holder) turns the parsed DataFrame chunks into a
+    stored dataset held by holder and returns a JSON-friendly dict with at
+    least 'dataset_id'; options are those given to create(). The upload
+    keeps that reference until complete() hands it over to the caller, or
+    remove() drops it.
+    """
+
+    def __init__(self, directory, dataset_store, max_bytes, max_part_size, ttl=UPLOAD_TTL_SECONDS,
+                 max_parsers=MAX_PARSER_THREADS):
+        self.directory = directory
+        self.dataset_store = dataset_store
+        self.max_bytes = max_bytes
+        self.max_part_size = max_part_size
+        self.ttl = ttl
+        self._parser_slots = threading.BoundedSemaphore(max_parsers)
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, upload_id):
+        # IDs come from clients, so never let one escape the uploads directory
+        if not isinstance(upload_id, str) or not _UPLOAD_ID.fullmatch(upload_id):
+            raise KeyError(upload_id)
+        return os.path.join(self.directory, upload_id)
+
+    def _file(self, upload_id, name):
+        return os.path.join(self._path(upload_id), name)
+
+    def _has_part(self, upload_id, index):
+        return os.path.exists(self._file(upload_id, os.path.join('parts', str(index))))
+
+    def _read_json(self, upload_id, name):
+        try:
+            with open(self._file(upload_id, name)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _write_json(self, upload_id, name, value):
+        tmp = self._file(upload_id, f'.{name}.{uuid.uuid4().hex}')
+        with open(tmp, 'w') as f:
+            json.dump(value, f)
+        os.replace(tmp, self._file(upload_id, name))
+
+    def create(self, filename, size, part_size=None, options=None):
+        """Open an upload of size bytes and return its ID; raises ValueError for bad arguments"""
+        compression = detect_compression(filename)
+        size = int(size)
+        part_size = int(part_size or min(DEFAULT_PART_SIZE, self.max_part_size))
+        if size <= 0:
+            raise ValueError('Upload size must be positive')
+        if size > self.max_bytes:
+            raise ValueError(f'Upload exceeds the limit of {self.max_bytes // (1024 * 1024)}MB')
+        if not MIN_PART_SIZE <= part_size <= self.max_part_size:
+            raise ValueError(f'Part size must be between {MIN_PART_SIZE} and {self.max_part_size} bytes')
+        self._prune()
+
+        upload_id = uuid.uuid4().hex
+        tmp_dir = os.path.join(self.directory, f'.tmp-{upload_id}')
+        os.makedirs(os.path.join(tmp_dir, 'parts'))
+        with open(os.path.join(tmp_dir, 'data'), 'wb') as f:
+            # Parts are written at their offsets into this (sparse) file
+            f.truncate(size)
+        with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+            json.dump({'filename': filename, 'size': size, 'part_size': part_size,
+                       'n_parts': -(-size // part_size), 'compression': compression,
+                       'options': options or {}, 'created_at': time.time()}, f)
+        os.replace(tmp_dir, self._path(upload_id))
+        return upload_id
+
+    def meta(self, upload_id):
+        """Return the upload's settings, or None if it does not exist"""
+        try:
+            return self._read_json(upload_id, 'meta.json')
+        except KeyError:
+            return None
+
+    def write_part(self, upload_id, index, data):
+        """Store part index (re-sending a part overwrites it); raises ValueError for a bad part"""
+        meta = self.meta(upload_id)
+        if meta is None:
+            raise KeyError(upload_id)
+        if not 0 <= index < meta['n_parts']:
+            raise ValueError(f"Part index must be between 0 and {meta['n_parts'] - 1}")
+        offset = index * meta['part_size']
+        expected = min(meta['part_size'], meta['size'] - offset)
+        if len(data) != expected:
+            raise ValueError(f'Part {index} must be {expected} bytes, got {len(data)}')
+        fd = os.open(self._file(upload_id, 'data'), os.O_WRONLY)
+        try:
+            os.pwrite(fd, data, offset)
+        finally:
+            os.close(fd)
+        # The marker comes last, so a readable marker always means the bytes are in place
+        open(self._file(upload_id, os.path.join('parts', str(index))), 'a').close()
+
+    def status(self, upload_id):
+        """Return the received and missing parts and the parsing state, or None"""
+        meta = self.meta(upload_id)
+        if meta is None:
+            return None
+        received = [i for i in range(meta['n_parts']) if self._has_part(upload_id, i)]
+        missing = sorted(set(range(meta['n_parts'])) - set(received))
+        received_bytes = len(received) * meta['part_size']
+        if received and received[-1] == meta['n_parts'] - 1:
+            # The last part is usually shorter
+            received_bytes -= meta['n_parts'] * meta['part_size'] - meta['size']
+        if self._read_json(upload_id, 'result.json') is not None:
+            state = 'parsed'
+        elif self._read_json(upload_id, 'error.json') is not None:
+            state = 'failed'
+        else:
+            state = 'receiving' if missing else 'received'
+        progress = self._read_json(upload_id, 'progress.json') or {}
+        return {
+            'upload_id': upload_id,
+            'filename': meta['filename'],
+            'compression': meta['compression'],
+            'size': meta['size'],
+            'part_size': meta['part_size'],
+            'n_parts': meta['n_parts'],
+            'received_parts': len(received),
+            'received_bytes': received_bytes,
+            'missing_parts': missing,
+            'parsed_rows': progress.get('rows', 0),
+            'state': state,
+        }
+
+    @contextlib.contextmanager
+    def _parse_lock(self, upload_id, blocking):
+        """Yield True while holding the upload's parser lock, False if another parser has it"""
+        with open(self._file(upload_id, 'parse.lock'), 'a') as lock:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+                except BlockingIOError:
+                    yield False
+                    return
+            yield True
+
+    def _parse(self, upload_id, load, idle_timeout):
+        """Parse the upload with load and record the result; the caller holds the parser lock"""
+        meta = self.meta(upload_id)
+        holder = f'chunked-{upload_id}'
+
+        def chunks():
+            rows = 0
+            with _GrowingFile(self, upload_id, meta, idle_timeout) as raw:
+                stream = io.BufferedReader(raw, buffer_size=READ_BUFFER_BYTES)
+                for chunk in read_csv_chunks(stream, meta['compression']):
+                    rows += len(chunk)
+                    self._write_json(upload_id, 'progress.json', {'rows': rows})
+                    yield chunk
+
+        try:
+            with timed('csv_parse'):
+                result = load(chunks(), meta['options'], holder)
+        except (UploadAborted, TimeoutError):
+            raise
+        except Exception as e:
+            with contextlib.suppress(FileNotFoundError):
+                self._write_json(upload_id, 'error.json', {'error': str(e)})
+            raise
+        try:
+            self._write_json(upload_id, 'result.json', result)
+        except FileNotFoundError:
+            # Removed while the last chunks were being stored
+            self.dataset_store.release(result['dataset_id'], holder)
+            raise UploadAborted(upload_id)
+        return result
+
+    def _parse_in_background(self, upload_id, load):
+        try:
+            with self._parse_lock(upload_id, blocking=False) as acquired:
+                if acquired and self._read_json(upload_id, 'result.json') is None:
+                    self._parse(upload_id, load, PARSER_IDLE_SECONDS)
+        except Exception:
+            # Recorded in error.json, or left for complete() to retry
+            pass
+        finally:
+            self._parser_slots.release()
+
+    def start_parsing(self, upload_id, load):
+        """Parse the upload in a background thread of this process as its parts arrive.
+
+        Returns the thread, or None when no parser slot is free and complete()
+        will parse the upload instead.
+        """
+        if fcntl is None:
+            # Without file locks complete() could not tell whether a parser is alive
+            return None
+        if not self._parser_slots.acquire(blocking=False):
+            return None
+        thread = threading.Thread(target=self._parse_in_background, args=(upload_id, load),
+                                  name=f'parse-{upload_id[:8]}', daemon=True)
+        thread.start()
+        return thread
+
+    def complete(self, upload_id, load, holder, timeout):
+        """Wait for the upload to be parsed and hand its dataset over to holder.
+
+        Parses the assembled file here if no background parser is alive.
+        Returns load's result; raises KeyError for an unknown upload, ValueError
+        if parts are missing or the CSV could not be parsed (which also removes
+        the upload) and TimeoutError if the background parser did not finish
+        within timeout seconds.
+        """
+        status = self.status(upload_id)
+        if status is None:
+            raise KeyError(upload_id)
+        if status['missing_parts']:
+            raise ValueError(f"{len(status['missing_parts'])} of {status['n_parts']} parts are missing")
+
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._parse_lock(upload_id, blocking=False) as acquired:
+                if acquired:
+                    error = self._read_json(upload_id, 'error.json')
+                    result = self._read_json(upload_id, 'result.json')
+                    if error is None and result is None:
+                        try:
+                            result = self._parse(upload_id, load, idle_timeout=0)
+                        except UploadAborted:
+                            raise KeyError(upload_id)
+                        except Exception as e:
+                            error = {'error': str(e)}
+                    if error is not None:
+                        # Sending the same bytes again would fail the same way
+                        self.remove(upload_id)
+                        raise ValueError(error['error'])
+                    self.dataset_store.acquire(result['dataset_id'], holder)
+                    self.dataset_store.release(result['dataset_id'], f'chunked-{upload_id}')
+                    break
+            if time.monotonic() > deadline:
+                raise TimeoutError(f'Upload {upload_id} is still being parsed')
+            time.sleep(POLL_SECONDS)
+        shutil.rmtree(self._path(upload_id), ignore_errors=True)
+        return result
+
+    def claim(self, upload_id, path):
+        """Move a fully received upload's file to path for a caller that reads it itself.
+
+        Removes the upload and returns its compression; raises KeyError for an
+        unknown upload and ValueError if parts are missing or it is being parsed.
+        """
+        status = self.status(upload_id)
+        if status is None:
+            raise KeyError(upload_id)
+        if status['missing_parts']:
+            raise ValueError(f"{len(status['missing_parts'])} of {status['n_parts']} parts are missing")
+        try:
+            with self._parse_lock(upload_id, blocking=False) as acquired:
+                if not acquired or status['state'] != 'received':
+                    raise ValueError(f'Upload {upload_id} is being loaded as a dataset')
+                os.replace(self._file(upload_id, 'data'), path)
+        except FileNotFoundError:
+            # Claimed or removed by another request in the meantime
+            raise KeyError(upload_id)
+        shutil.rmtree(self._path(upload_id), ignore_errors=True)
+        return status['compression']
+
+    def remove(self, upload_id):
+        """Delete an upload and the dataset parsed from it, if nobody has taken it over"""
+        try:
+            result = self._read_json(upload_id, 'result.json')
+        except KeyError:
+            return
+        shutil.rmtree(self._path(upload_id), ignore_errors=True)
+        if result is not None:
+            self.dataset_store.release(result['dataset_id'], f'chunked-{upload_id}')
+
+    def _prune(self):
+        cutoff = time.time() - self.ttl
+        for name in os.listdir(self.directory):
+            if not _UPLOAD_ID.fullmatch(name):
+                continue
+            with contextlib.suppress(FileNotFoundError):
+                # Every part rewrites the data file, so its mtime is the last activity
+                if os.stat(os.path.join(self.directory, name, 'data')).st_mtime < cutoff:
+                    self.remove(name)
+
+    def __len__(self):
+        return sum(1 for name in os.listdir(self.directory) if _UPLOAD_ID.fullmatch(name))
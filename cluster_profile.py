@@ -0,0 +1,197 @@
+"""
+Per-cluster feature statistics computed in one vectorized pass.
+
+A ClusterProfile holds, for every cluster and feature column, the count of
+non-missing values, mean, variance moments, min and max, plus a quantile
+sketch. Rows are grouped with one stable sort of the labels instead of one
+boolean mask per cluster, so the cost is O(n log n) regardless of K.
+
+Everything in a profile is mergeable: profiles of chunks (streaming mode) or
+shards (distributed mode) combine into exactly the profile of the whole data,
+except that quantiles are approximate. The quantile sketch follows DDSketch:
+values fall into logarithmic buckets whose boundaries grow by a factor
+gamma = (1 + alpha) / (1 - alpha), so every quantile is returned with a
+relative error of at most alpha, and merging two sketches just adds their
+bucket counts.
+"""
+
+import numpy as np
+import pandas as pd
+
+from streaming import merge_moments
+
+DEFAULT_QUANTILES = (0.25, 0.5, 0.75)
+RELATIVE_ACCURACY = 0.01
+# Magnitudes below this share the zero bucket
+MIN_MAGNITUDE = 1e-9
+
+
+class ClusterProfile:
+    """Mergeable per-cluster statistics of a set of feature columns"""
+
+    def __init__(self, columns, n_clusters, relative_accuracy=RELATIVE_ACCURACY):
+        self.columns = list(columns)
+        self.n_clusters = n_clusters
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = np.log(self.gamma)
+        # Bucket indices of magnitudes from MIN_MAGNITUDE to the largest float64
+        self._min_index = int(np.ceil(np.log(MIN_MAGNITUDE) / self._log_gamma))
+        self._max_index = int(np.ceil(np.log(np.finfo(np.float64).max) / self._log_gamma))
+        self._key_span = 2 * (self._max_index - self._min_index + 2) + 1
+
+        shape = (n_clusters, len(self.columns))
+        self.sizes = np.zeros(n_clusters, dtype=np.int64)
+        self.count = np.zeros(shape)
+        self.mean = np.zeros(shape)
+        self.m2 = np.zeros(shape)
+        self.min = np.full(shape, np.inf)
+        self.max = np.full(shape, -np.inf)
+        # Per column: sorted unique (cluster, bucket) codes and their counts
+        self.sketch_codes = [np.empty(0, dtype=np.int64) for _ in self.columns]
+        self.sketch_counts = [np.empty(0, dtype=np.int64) for _ in self.columns]
+
+    def _bucket_keys(self, values):
+        """Order-preserving integer bucket key of each (non-missing) value; 0 is the zero bucket"""
+        magnitude = np.abs(values)
+        index = np.ceil(np.log(np.maximum(magnitude, MIN_MAGNITUDE)) / self._log_gamma)
+        index = np.clip(index, self._min_index, self._max_index).astype(np.int64)
+        keys = index - self._min_index + 1
+        keys = np.where(values < 0, -keys, keys)
+        return np.where(magnitude < MIN_MAGNITUDE, 0, keys)
+
+    def _bucket_values(self, keys):
+        """Representative value of each bucket key (the midpoint in relative terms)"""
+        index = np.abs(keys) - 1 + self._min_index
+        values = 2 * np.power(self.gamma, index.astype(np.float64)) / (self.gamma + 1)
+        return np.where(keys == 0, 0.0, np.sign(keys) * values)
+
+    def update(self, X, labels):
+        """Add rows X (2-D array or DataFrame of the profile's columns) with their labels"""
+        if isinstance(X, pd.DataFrame):
+            X = X[self.columns].to_numpy(dtype=np.float64)
+        X = np.asarray(X, dtype=np.float64)
+        labels = np.asarray(labels, dtype=np.int64)
+        if len(labels) == 0:
+            return self
+        self.sizes += np.bincount(labels, minlength=self.n_clusters)
+
+        # One stable sort groups the rows of every cluster into a contiguous run
+        order = np.argsort(labels, kind='stable')
+        sorted_labels = labels[order]
+        starts = np.flatnonzero(np.r_[True, sorted_labels[1:] != sorted_labels[:-1]])
+        present = sorted_labels[starts]
+
+        for j in range(len(self.columns)):
+            column = X[order, j]
+            valid = ~np.isnan(column)
+            count = np.add.reduceat(valid.astype(np.float64), starts)
+            chunk_mean = np.add.reduceat(np.where(valid, column, 0.0), starts) / np.maximum(count, 1)
+            run_mean = np.repeat(chunk_mean, np.diff(np.r_[starts, len(column)]))
+            chunk_m2 = np.add.reduceat(np.where(valid, column - run_mean, 0.0) ** 2, starts)
+
+            merged = merge_moments((self.count[present, j], self.mean[present, j], self.m2[present, j]),
+                                   (count, chunk_mean, chunk_m2))
+            self.count[present, j], self.mean[present, j], self.m2[present, j] = merged
+            self.min[present, j] = np.minimum(self.min[present, j],
+                                              np.minimum.reduceat(np.where(valid, column, np.inf), starts))
+            self.max[present, j] = np.maximum(self.max[present, j],
+                                              np.maximum.reduceat(np.where(valid, column, -np.inf), starts))
+
+            codes = (sorted_labels[valid] * self._key_span + self._key_span // 2
+                     + self._bucket_keys(column[valid]))
+            self._add_to_sketch(j, *np.unique(codes, return_counts=True))
+        return self
+
+    def _add_to_sketch(self, j, codes, counts):
+        if len(self.sketch_codes[j]):
+            codes = np.concatenate([self.sketch_codes[j], codes])
+            counts = np.concatenate([self.sketch_counts[j], counts])
+            codes, inverse = np.unique(codes, return_inverse=True)
+            counts = np.bincount(inverse.ravel(), weights=counts, minlength=len(codes)).astype(np.int64)
+        self.sketch_codes[j], self.sketch_counts[j] = codes, counts
+
+    def merge(self, other):
+        """Fold another profile of the same columns and K into this one"""
+        if other.columns != self.columns or other.n_clusters != self.n_clusters:
+            raise ValueError('Can only merge profiles of the same columns and number of clusters')
+        self.sizes += other.sizes
+        self.count, self.mean, self.m2 = merge_moments((self.count, self.mean, self.m2),
+                                                       (other.count, other.mean, other.m2))
+        self.min = np.minimum(self.min, other.min)
+        self.max = np.maximum(self.max, other.max)
+        for j in range(len(self.columns)):
+            self._add_to_sketch(j, other.sketch_codes[j], other.sketch_counts[j])
+        return self
+
+    @property
+    def std(self):
+        """Sample standard deviation (ddof=1), like DataFrame.describe()"""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self.count > 1, np.sqrt(self.m2 / np.maximum(self.count - 1, 1)), np.nan)
+
+    def quantiles(self, qs=DEFAULT_QUANTILES):
+        """Approximate quantiles as an array of shape (len(qs), n_clusters, n_columns)"""
+        result = np.full((len(qs), self.n_clusters, len(self.columns)), np.nan)
+        for j in range(len(self.columns)):
+            codes, counts = self.sketch_codes[j], self.sketch_counts[j]
+            if not len(codes):
+                continue
+            # Codes are sorted by cluster first and value second
+            clusters = codes // self._key_span
+            keys = codes - clusters * self._key_span - self._key_span // 2
+            values = self._bucket_values(keys)
+            cumulative = np.cumsum(counts)
+            starts = np.flatnonzero(np.r_[True, clusters[1:] != clusters[:-1]])
+            ends = np.r_[starts[1:], len(codes)]
+            before = np.r_[0, cumulative][starts]
+            totals = cumulative[ends - 1] - before
+            for i, q in enumerate(qs):
+                # Rank of the q-quantile within each cluster, as in DDSketch
+                ranks = before + np.floor(q * (totals - 1))
+                positions = np.searchsorted(cumulative, ranks, side='right')
+                result[i, clusters[starts], j] = values[positions]
+        return result
+
+    def to_dict(self, qs=DEFAULT_QUANTILES):
+        """JSON-friendly {cluster: {'size', 'columns': {column: stats}}}"""
+        quantiles = self.quantiles(qs)
+        std = self.std
+        profile = {}
+        for cluster in range(self.n_clusters):
+            columns = {}
+            for j, name in enumerate(self.columns):
+                has_values = self.count[cluster, j] > 0
+                stats = {
+                    'count': int(self.count[cluster, j]),
+                    'mean': float(self.mean[cluster, j]) if has_values else None,
+                    'std': float(std[cluster, j]) if np.isfinite(std[cluster, j]) else None,
+                    'min': float(self.min[cluster, j]) if has_values else None,
+                    'max': float(self.max[cluster, j]) if has_values else None,
+                }
+                for i, q in enumerate(qs):
+                    value = quantiles[i, cluster, j]
+                    stats[f'p{round(q * 100):g}'] = float(value) if np.isfinite(value) else None
+                columns[str(name)] = stats
+            profile[str(cluster)] = {'size': int(self.sizes[cluster]), 'columns': columns}
+        return profile
+
+    def describe(self, cluster, qs=DEFAULT_QUANTILES):
+        """A DataFrame shaped like DataFrame.describe() for one cluster"""
+        quantiles = self.quantiles(qs)
+        rows = {'count': self.count[cluster], 'mean': self.mean[cluster], 'std': self.std[cluster],
+                'min': np.where(self.count[cluster] > 0, self.min[cluster], np.nan)}
+        for i, q in enumerate(qs):
+            rows[f'{round(q * 100):g}%'] = quantiles[i, cluster]
+        rows['max'] = np.where(self.count[cluster] > 0, self.max[cluster], np.nan)
+        return pd.DataFrame(rows, index=self.columns).T
+
+
+def profile_clusters(X, labels, n_clusters=None, columns=None):
+    """Compute the ClusterProfile of X (DataFrame or 2-D array) for the given labels"""
+    labels = np.asarray(labels)
+    if columns is None:
+        columns = list(X.columns) if isinstance(X, pd.DataFrame) else list(range(X.shape[1]))
+    if n_clusters is None:
+        n_clusters = int(labels.max()) + 1 if len(labels) else 0
+    return ClusterProfile(columns, n_clusters).update(X, labels)
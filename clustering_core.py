@@ -0,0 +1,433 @@
+"""
+Core clustering pipeline shared by the web app and its background workers.
+
+Everything in this module is importable from a worker process, so heavy
+work (scaling, K-Means fitting) can run outside the request thread.
+scikit-learn is imported inside the functions that use it, so importing
+this module (and the web app) stays fast.
+"""
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+from columnar_store import ColumnarDataset
+from feature_cache import FeatureCache, dataset_fingerprint, make_key
+from kmeans_engine import ENGINES, get_engine, resolve_dtype
+from metrics import timed, collect_breakdown
+from cluster_profile import profile_clusters
+from coreset import fit_coreset_kmeans, SEEDING_METHODS
+from reduction import reduce_features, full_space_inertia
+from restarts import fit_restarts, RESTART_METHODS
+
+# Per-process cache of scaled matrices; in the web app it lives in the server process
+feature_cache = FeatureCache(max_bytes=int(os.environ.get('FEATURE_CACHE_MB', 256)) * 1024 * 1024)
+# Jobs only hand scaled matrices up to this size back for the server's cache: larger ones
+# would be pickled through the pool's pipe both ways, which costs about as much as rescaling
+RETURN_FEATURES_BYTES = int(os.environ.get('FEATURE_RETURN_MB', 32)) * 1024 * 1024
+
+
+def _no_progress(stage, **counters):
+    """Stands in for a job's progress reporter when nobody is listening"""
+
+
+def prepare_features(X, dtype=None):
+    """Fill missing values with column means and standardize the features.
+
+    With dtype float32 the scaled matrix is produced in single precision directly.
+    """
+    from sklearn.preprocessing import StandardScaler
+
+    with timed('imputation'):
+        # Compacted (narrow integer or float32) columns are widened so means are exact
+        if (X.dtypes != np.float64).any():
+            X = X.astype(np.float64)
+        if X.isnull().any().any():
+            X = X.fillna(X.mean())
+    with timed('scaling'):
+        if resolve_dtype(dtype) == np.float32:
+            X = X.astype(np.float32)
+        scaler = StandardScaler()
+        X_scaled = scaler.fit_transform(X)
+    return X, X_scaled, scaler
+
+
+def get_scaled_features(X, content_hash=None, dtype=None, cache=feature_cache):
+    """Return (X_scaled, scaler) for X, reusing a cached matrix when one exists.
+
+    content_hash identifies the dataset X was taken from; it is computed from
+    X itself when not given.
+    """
+    if content_hash is None:
+        content_hash = dataset_fingerprint(X)
+    key = make_key(content_hash, X.columns, {'dtype': resolve_dtype(dtype).name})
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+    X, X_scaled, scaler = prepare_features(X, dtype)
+    cache.put(key, X_scaled, scaler)
+    return X_scaled, scaler
+
+
+def unscale_features(X_scaled, scaler, columns):
+    """Rebuild the mean-imputed feature values from a scaled matrix"""
+    n = len(columns)
+    values = X_scaled[:, :n] * scaler.scale_[:n] + scaler.mean_[:n]
+    return pd.DataFrame(values, columns=columns)
+
+
+def check_restart_seeding(restarts, seeding):
+    """Raise ValueError for parallel restarts with coreset seeding, which would run sequentially"""
+    if restarts == 'parallel' and seeding == 'coreset':
+        raise ValueError('Parallel restarts need full seeding; coreset seeding already runs its '
+                         'restarts on a small sample')
+
+
+def _fit(X_scaled, n_clusters, engine, seeding, callback, restarts='sequential', restart_workers=None):
+    if restarts not in RESTART_METHODS:
+        raise ValueError(f"Restarts must be one of {', '.join(RESTART_METHODS)}")
+    check_restart_seeding(restarts, seeding)
+    restart_report = {'method': 'sequential'}
+    if seeding == 'coreset':
+        # Restarts on the coreset are cheap already
+        kmeans, report = fit_coreset_kmeans(X_scaled, n_clusters, engine, random_state=42,
+                                            n_init=10, callback=callback)
+    elif seeding == 'full' and restarts == 'parallel':
+        kmeans, restart_report = fit_restarts(X_scaled, n_clusters, engine, random_state=42,
+                                              n_init=10, n_jobs=restart_workers, callback=callback)
+        report = {'method': 'full'}
+    elif seeding == 'full':
+        kmeans = get_engine(engine).fit(X_scaled, n_clusters, random_state=42, n_init=10,
+                                        callback=callback)
+        report = {'method': 'full'}
+    else:
+        raise ValueError(f"Seeding must be one of {', '.join(SEEDING_METHODS)}")
+    kmeans.seeding_ = report
+    kmeans.restarts_ = restart_report
+    return kmeans
+
+
+def fit_kmeans(X_scaled, n_clusters, engine='sklearn', seeding='full', callback=None,
+               restarts='sequential', restart_workers=None):
+    """Fit K-Means on standardized features with the named engine.
+
+    seeding is 'full' (k-means++ restarts on all rows) or 'coreset'; the
+    model's seeding_ attribute describes how it was seeded. restarts is
+    'sequential' (every restart runs to convergence) or 'parallel' (see
+    restarts.fit_restarts, on restart_workers processes; only with full
+    seeding, coreset seeding raises ValueError); the model's restarts_ attribute describes how they ran.
+    callback is passed on to the engine (see kmeans_engine).
+    """
+    with timed('fit'):
+        kmeans = _fit(X_scaled, n_clusters, engine, seeding, callback, restarts, restart_workers)
+    return kmeans, kmeans.labels_
+
+
+def fit_convergence(kmeans):
+    """(iterations, converged) of the best K-Means run behind a model fitted by fit_kmeans.
+
+    For coreset seeding that is the best restart on the coreset: the full-data
+    refinement always stops after a few iterations and is reported in
+    seeding_['refine_iter'] instead.
+    """
+    if kmeans.seeding_['method'] == 'coreset':
+        return kmeans.seeding_['coreset_iter'], kmeans.seeding_['converged']
+    return int(kmeans.n_iter_), bool(kmeans.n_iter_ < kmeans.max_iter)
+
+
+def reduce_and_fit(X_scaled, n_clusters, reduction=None, engine='sklearn', seeding='full',
+                   callback=None, restarts='sequential', restart_workers=None):
+    """Fit K-Means, first reducing the standardized features when reduction options are given.
+
+    Returns (kmeans, labels, reduced); reduced is None without a reduction.
+    Otherwise it holds the reduced rows and the plot coordinates, the
+    model's reduction_ attribute describes the reduction (with the inertia of
+    the clusters in the full standardized space) and its cluster_centers_
+    are mapped back into that space, so saved models score raw rows.
+    """
+    if reduction is None:
+        kmeans, labels = fit_kmeans(X_scaled, n_clusters, engine, seeding, callback, restarts,
+                                    restart_workers)
+        return kmeans, labels, None
+    with timed('reduce'):
+        reduced = reduce_features(X_scaled, **reduction)
+    start = time.perf_counter()
+    kmeans, labels = fit_kmeans(reduced.X, n_clusters, engine, seeding, callback, restarts,
+                                restart_workers)
+    report = reduced.report
+    report['fit_seconds'] = time.perf_counter() - start
+    report['inertia'] = full_space_inertia(X_scaled, labels, n_clusters)
+    kmeans.reduction_ = report
+    kmeans.cluster_centers_ = reduced.full_centers(X_scaled, labels, kmeans.cluster_centers_)
+    return kmeans, labels, reduced
+
+
+def compare_full_width(X_scaled, n_clusters, kmeans, engine='sklearn', seeding='full', callback=None,
+                       restarts='sequential', restart_workers=None):
+    """Fit again on all standardized columns and add the time saved to kmeans.reduction_"""
+    start = time.perf_counter()
+    with timed('fit_full_width'):
+        full = _fit(X_scaled, n_clusters, engine, seeding, callback, restarts, restart_workers)
+    report = kmeans.reduction_
+    report['full_fit_seconds'] = time.perf_counter() - start
+    report['full_inertia'] = float(full.inertia_)
+    # The reduction itself counts against the reduced fit
+    report['time_saved_seconds'] = report['full_fit_seconds'] - report['seconds'] - report['fit_seconds']
+    # Relative excess inertia, both measured in the full standardized space
+    report['inertia_gap'] = float(report['inertia'] / full.inertia_ - 1) if full.inertia_ else 0.0
+    return report
+
+
+def compare_seeding(X_scaled, n_clusters, kmeans, engine='sklearn', callback=None):
+    """Fit again with full seeding and add the inertia gap to kmeans.seeding_"""
+    start = time.perf_counter()
+    with timed('fit_full_seeding'):
+        full = get_engine(engine).fit(X_scaled, n_clusters, random_state=42, n_init=10,
+                                      callback=callback)
+    report = kmeans.seeding_
+    report['full_inertia'] = float(full.inertia_)
+    report['full_seconds'] = time.perf_counter() - start
+    # Relative excess inertia over full seeding; negative when the coreset fit is better
+    report['inertia_gap'] = float(kmeans.inertia_ / full.inertia_ - 1) if full.inertia_ else 0.0
+    return report
+
+
+# Scaled matrix shared by all K candidates inside one sweep worker process
+_sweep_matrix = None
+
+
+def _init_sweep_worker(X_scaled, n_threads):
+    from threadpoolctl import threadpool_limits
+
+    global _sweep_matrix
+    _sweep_matrix = X_scaled
+    # Keep OpenMP/BLAS threads per worker in check so the workers do not oversubscribe cores
+    threadpool_limits(limits=n_threads)
+
+
+def _evaluate_k(k, silhouette_sample, engine, X_scaled=None, seeding='full', progress=None):
+    """Fit one candidate K and score it by inertia and sampled silhouette.
+
+    With a job's progress reporter, the fit stops between iterations once the job is cancelled
+    (with scikit-learn only while the job is watched, see _fit_progress).
+    """
+    from sklearn.metrics import silhouette_score
+
+    X_scaled = _sweep_matrix if X_scaled is None else X_scaled
+    callback = None
+    if progress is not None and _iteration_progress_wanted(progress, engine):
+        callback = lambda restart, n_init, iteration, inertia: progress.raise_if_cancelled()
+    kmeans, labels = fit_kmeans(X_scaled, k, engine, seeding, callback)
+    silhouette = None
+    if len(np.unique(labels)) > 1:
+        sample_size = min(silhouette_sample, len(X_scaled))
+        silhouette = float(silhouette_score(X_scaled, labels, sample_size=sample_size,
+                                            random_state=42))
+    return {'k': k, 'inertia': float(kmeans.inertia_), 'silhouette': silhouette,
+            'n_iter': fit_convergence(kmeans)[0]}
+
+
+def elbow_k(ks, inertias):
+    """Pick the K whose inertia lies furthest below the line joining the curve's ends"""
+    if len(ks) < 3:
+        return ks[0]
+    x = (np.asarray(ks, dtype=float) - ks[0]) / (ks[-1] - ks[0])
+    y = np.asarray(inertias, dtype=float)
+    spread = y[0] - y[-1]
+    y = (y - y[-1]) / spread if spread > 0 else np.zeros_like(y)
+    # Distance below the chord from (0, 1) to (1, 0)
+    return ks[int(np.argmax(1 - x - y))]
+
+
+def sweep_k(X_scaled, ks, n_jobs=None, silhouette_sample=10000, engine='sklearn', seeding='full',
+            progress=None):
+    """Fit every K in ks on one scaled matrix, in parallel across processes.
+
+    n_jobs is the number of cores the sweep may use (all of them by default).
+    Silhouette is computed on a random sample of at most silhouette_sample
+    rows, which keeps it from growing quadratically with the dataset.
+    progress (a job's ProgressReporter) is told about every finished K.
+    """
+    ks = sorted(set(int(k) for k in ks))
+    if not ks or ks[0] < 2:
+        raise ValueError('Number of clusters must be at least 2')
+    if ks[-1] > len(X_scaled):
+        raise ValueError(f'Cannot form {ks[-1]} clusters from {len(X_scaled)} rows')
+
+    cores = n_jobs or os.cpu_count() or 1
+    n_jobs = min(len(ks), cores)
+    def report(done, k):
+        (progress or _no_progress)('sweep', completed=done, total=len(ks), k=k)
+
+    if n_jobs <= 1:
+        results = []
+        for k in ks:
+            results.append(_evaluate_k(k, silhouette_sample, engine, X_scaled, seeding, progress))
+            report(len(results), k)
+    else:
+        n_threads = max(1, cores // n_jobs)
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_sweep_worker,
+                                 initargs=(X_scaled, n_threads)) as executor:
+            # Largest K first: those fits are slowest, so this balances the workers
+            futures = {executor.submit(_evaluate_k, k, silhouette_sample, engine, None, seeding,
+                                       progress): k
+                       for k in reversed(ks)}
+            by_k = {}
+            try:
+                for future in as_completed(futures):
+                    by_k[futures[future]] = future.result()
+                    report(len(by_k), futures[future])
+            except BaseException:
+                # Cancelled (or failed): candidates that have not started never will
+                executor.shutdown(wait=True, cancel_futures=True)
+                raise
+            results = [by_k[k] for k in ks]
+
+    inertias = [r['inertia'] for r in results]
+    scored = [r for r in results if r['silhouette'] is not None]
+    best_silhouette = max(scored, key=lambda r: r['silhouette'])['k'] if scored else None
+    elbow = elbow_k(ks, inertias)
+    return {
+        'ks': ks,
+        'inertia': inertias,
+        'silhouette': [r['silhouette'] for r in results],
+        'n_iter': [r['n_iter'] for r in results],
+        'elbow_k': elbow,
+        'silhouette_k': best_silhouette,
+        'recommended_k': best_silhouette if best_silhouette is not None else elbow,
+    }
+
+
+def _resolve_features(X, features, dtype=None):
+    """Use precomputed (X_scaled, scaler) if given, otherwise preprocess X"""
+    if features is not None:
+        return features[0], features[1], False
+    if isinstance(X, ColumnarDataset):
+        # Memory-mapped columns: nothing is parsed or copied before scaling
+        X = X.to_frame()
+    X, X_scaled, scaler = prepare_features(X, dtype)
+    return X_scaled, scaler, True
+
+
+def _iteration_progress_wanted(progress, engine):
+    """Whether to follow every iteration of a fit: always when it is cheap, else while watched"""
+    return not ENGINES[engine].costly_callback or progress.watched()
+
+
+def _fit_progress(progress, stage, engine):
+    """Engine callback that reports each iteration of a fit to a job's progress reporter.
+
+    None without a reporter, or when the engine pays for the callback and
+    nobody watches the job; the fit then only stops at the next stage once
+    the job is cancelled.
+    """
+    if progress is None or not _iteration_progress_wanted(progress, engine):
+        return None
+    return _FitProgress(progress, stage)
+
+
+class _FitProgress:
+    """Picklable engine callback, so parallel restarts can report from their worker processes"""
+
+    def __init__(self, progress, stage):
+        self.progress = progress
+        self.stage = stage
+
+    def __call__(self, restart, n_init, iteration, inertia):
+        self.progress(self.stage, restart=restart, n_init=n_init, iteration=iteration, inertia=inertia)
+
+
+def run_clustering_job(columns, n_clusters, X=None, features=None, engine='sklearn', dtype=None,
+                       seeding='full', compare=False, reduction=None, compare_reduction=False,
+                       restarts='sequential', restart_workers=None, progress=None):
+    """Worker entry point: scale and fit the selected feature columns.
+
+    Pass the raw features X (a DataFrame or a ColumnarDataset handle), cached
+    (X_scaled, scaler) features, or both; X is also used for the cluster profile.
+    Freshly computed features of up to RETURN_FEATURES_BYTES are returned so
+    the caller can cache them, along with the time spent in each stage. With compare, a coreset-seeded
+    fit is also run with full seeding to report the inertia gap. reduction
+    (see reduction.parse_reduction) fits on reduced features and returns their
+    2-D projection for plotting; compare_reduction also fits all columns to
+    report the time saved. restarts 'parallel' runs the restarts of a fully
+    seeded fit on restart_workers processes (the job's share of the cores)
+    and abandons the losing ones early.
+    progress (a job's ProgressReporter) is told the stage and, while fitting
+    (with scikit-learn only while the job is watched), the restart,
+    iteration and inertia; it stops the job when the job is cancelled.
+    """
+    report = progress or _no_progress
+    with collect_breakdown() as breakdown:
+        report('scaling')
+        X_scaled, scaler, computed = _resolve_features(X, features, dtype)
+        if reduction is not None:
+            report('reduce')
+        else:
+            report('fit')
+        kmeans, cluster_labels, reduced = reduce_and_fit(X_scaled, n_clusters, reduction, engine,
+                                                         seeding, _fit_progress(progress, 'fit', engine),
+                                                         restarts, restart_workers)
+        if compare and kmeans.seeding_['method'] == 'coreset':
+            report('compare')
+            # Against full seeding on the same (possibly reduced) rows
+            compare_seeding(X_scaled if reduced is None else reduced.X, n_clusters, kmeans, engine,
+                            _fit_progress(progress, 'compare', engine))
+        if compare_reduction and reduced is not None:
+            report('full_width')
+            compare_full_width(X_scaled, n_clusters, kmeans, engine, seeding,
+                               _fit_progress(progress, 'full_width', engine), restarts, restart_workers)
+        profile = None
+        if X is not None:
+            report('profile')
+            # Statistics of the raw (not imputed, not scaled) values of every cluster
+            with timed('profile'):
+                raw = X.to_frame() if isinstance(X, ColumnarDataset) else X
+                profile = profile_clusters(raw, cluster_labels, n_clusters).to_dict()
+
+    n_iter, converged = fit_convergence(kmeans)
+    result = {
+        'labels': cluster_labels,
+        'cluster_stats': pd.Series(cluster_labels).value_counts().sort_index().to_dict(),
+        # In the full standardized space, so runs with and without a reduction compare
+        'inertia': float(kmeans.inertia_) if reduced is None else kmeans.reduction_['inertia'],
+        'n_iter': n_iter,
+        'converged': converged,
+        'seeding': kmeans.seeding_,
+        'restarts': kmeans.restarts_,
+        'reduction': None if reduced is None else kmeans.reduction_,
+        'cluster_profile': profile,
+        'timings': breakdown.to_dict(),
+        # Enough to score new rows later without refitting
+        'model': {'mean': scaler.mean_, 'scale': scaler.scale_, 'centers': kmeans.cluster_centers_},
+    }
+    if reduced is not None and reduced.plot_xy is not None:
+        result['projection'] = (reduced.plot_xy, reduced.axes)
+    if computed and X_scaled.nbytes <= RETURN_FEATURES_BYTES:
+        result['features'] = (X_scaled, scaler)
+    return result
+
+
+def run_sweep_job(ks, X=None, features=None, n_jobs=None, engine='sklearn', dtype=None,
+                  seeding='full', reduction=None, progress=None):
+    """Worker entry point: scale the features once and evaluate every K.
+
+    With reduction, every K is fitted (and scored) on the same reduced features.
+    """
+    with collect_breakdown() as breakdown:
+        (progress or _no_progress)('scaling')
+        X_scaled, scaler, computed = _resolve_features(X, features, dtype)
+        X_fit = X_scaled
+        if reduction is not None:
+            (progress or _no_progress)('reduce')
+            with timed('reduce'):
+                reduced = reduce_features(X_scaled, **reduction)
+            X_fit = reduced.X
+        with timed('sweep'):
+            result = sweep_k(X_fit, ks, n_jobs=n_jobs, engine=engine, seeding=seeding,
+                             progress=progress)
+    result['reduction'] = None if reduction is None else reduced.report
+    result['timings'] = breakdown.to_dict()
+    if computed and X_scaled.nbytes <= RETURN_FEATURES_BYTES:
+        result['features'] = (X_scaled, scaler)
+    return result
@@ -6,11 +6,27 @@ A complete Python script for clustering CSV datasets using K-Means algorithm.
 
 import pandas as pd
 import numpy as np
-from sklearn.cluster import KMeans
 from sklearn.preprocessing import StandardScaler
 import matplotlib.pyplot as plt
 import os
 import sys
+import argparse
+import glob
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from threadpoolctl import threadpool_limits
+from clustering_core import (get_scaled_features, unscale_features, fit_kmeans, prepare_features,
+                             compare_seeding, reduce_and_fit, compare_full_width, check_restart_seeding,
+                             feature_cache)
+from coreset import SEEDING_METHODS
+from reduction import REDUCTION_METHODS, parse_reduction, describe_reduction
+from restarts import RESTART_METHODS, describe_restarts
+from kmeans_engine import ENGINES, ASSIGNMENT_METHODS
+from cluster_profile import profile_clusters
+from compaction import compact_frame, compact_labels, frame_nbytes, format_bytes
+from model_registry import ModelRegistry, DEFAULT_MODEL_DIR, check_model_name
+from plotting import draw_clusters, render_cluster_plot
 
 def load_dataset():
     """Load CSV dataset from user input"""
@@ -26,9 +42,11 @@ def load_dataset():
                 print("❌ Please provide a CSV file.")
                 continue
                 
-            df = pd.read_csv(file_path)
+            df, memory = compact_frame(pd.read_csv(file_path))
             print(f"✅ Dataset loaded successfully!")
             print(f"📊 Dataset shape: {df.shape[0]} rows × {df.shape[1]} columns")
+            print(f"💾 Memory: {format_bytes(memory['before_bytes'])} → "
+                  f"{format_bytes(memory['after_bytes'])} after compacting column types")
             
             return df, file_path
             
@@ -113,35 +131,36 @@ def get_cluster_count():
         except ValueError:
             print("❌ Please enter a valid integer.")
 
-def perform_clustering(df, selected_columns, n_clusters):
+def perform_clustering(df, selected_columns, n_clusters, engine='sklearn', dtype=None,
+                       seeding='full'):
     """Perform K-Means clustering on selected features"""
     print("\n" + "="*60)
     print("🤖 PERFORMING K-MEANS CLUSTERING")
     print("="*60)
     
     # Extract features
-    X = df[selected_columns].copy()
+    X = df[selected_columns]
     
-    # Handle missing values
-    if X.isnull().any().any():
-        print("⚠️  Found missing values. Filling with column means...")
-        X = X.fillna(X.mean())
+    # Scaled features are cached per process, so re-running with another K skips this step
+    hits_before = feature_cache.hits
+    X_scaled, scaler = get_scaled_features(X, dtype=dtype)
+    if feature_cache.hits > hits_before:
+        print("♻️  Reusing cached standardized features")
+    else:
+        if X.isnull().any().any():
+            print("⚠️  Found missing values. Filled with column means.")
+        print(f"📊 Features shape: {X.shape}")
+        print("🔄 Standardized features")
+    X = unscale_features(X_scaled, scaler, selected_columns)
     
-    print(f"📊 Features shape: {X.shape}")
-    print("🔄 Standardizing features...")
-    
-    # Standardize features
-    scaler = StandardScaler()
-    X_scaled = scaler.fit_transform(X)
-    
-    print(f"🎯 Running K-Means with {n_clusters} clusters...")
+    print(f"🎯 Running K-Means with {n_clusters} clusters ({engine} engine)...")
     
     # Perform K-Means clustering
-    kmeans = KMeans(n_clusters=n_clusters, random_state=42, n_init=10)
-    cluster_labels = kmeans.fit_predict(X_scaled)
+    kmeans, cluster_labels = fit_kmeans(X_scaled, n_clusters, engine, seeding)
     
-    # Add cluster labels to original dataset
-    df_clustered = df.copy()
+    # Add cluster labels to a shallow copy, so the original columns are not duplicated
+    cluster_labels = compact_labels(cluster_labels, n_clusters)
+    df_clustered = df.copy(deep=False)
     df_clustered['Cluster'] = cluster_labels
     
     print("✅ Clustering completed!")
@@ -165,20 +184,15 @@ def create_visualization(X, cluster_labels, feature_names, n_clusters):
     
     plt.figure(figsize=(12, 8))
     
-    # Create scatter plot
-    unique_clusters = np.unique(cluster_labels)
-    colors = plt.cm.Set1(np.linspace(0, 1, len(unique_clusters)))
-    
-    for i, cluster in enumerate(unique_clusters):
-        mask = cluster_labels == cluster
-        plt.scatter(X.iloc[mask, 0], X.iloc[mask, 1], 
-                   c=[colors[i]], label=f'Cluster {cluster}', 
-                   alpha=0.7, s=50)
+    # Large datasets are drawn as a density raster instead of one marker per point
+    mode = draw_clusters(plt.gca(), X.iloc[:, 0], X.iloc[:, 1], cluster_labels, s=50,
+                         legend_kwargs={'bbox_to_anchor': (1.05, 1), 'loc': 'upper left'})
+    if mode != 'scatter':
+        print(f"ℹ️  {len(X)} points: plotting in {mode} mode")
     
     plt.xlabel(feature_names[0], fontsize=12)
     plt.ylabel(feature_names[1], fontsize=12)
     plt.title(f'K-Means Clustering Results (K={n_clusters})', fontsize=14, fontweight='bold')
-    plt.legend(bbox_to_anchor=(1.05, 1), loc='upper left')
     plt.grid(True, alpha=0.3)
     plt.tight_layout()
     
@@ -187,8 +201,9 @@ def create_visualization(X, cluster_labels, feature_names, n_clusters):
     plt.savefig(plot_filename, dpi=300, bbox_inches='tight')
     print(f"✅ Plot saved as '{plot_filename}'")
     
-    # Show plot
+    # Show plot, then free it so repeated sessions do not accumulate figures
     plt.show()
+    plt.close()
 
 def save_results(df_clustered, original_filename):
     """Save the clustered dataset"""
@@ -200,19 +215,92 @@ def save_results(df_clustered, original_filename):
     print(f"\n📋 Sample of clustered data:")
     print(df_clustered.head(10))
 
-def analyze_clusters(df_clustered, selected_columns):
-    """Provide detailed cluster analysis"""
+def print_profile(profile):
+    """Print the statistics of every non-empty cluster of a ClusterProfile"""
     print("\n" + "="*60)
     print("📊 CLUSTER ANALYSIS")
     print("="*60)
     
-    for cluster in sorted(df_clustered['Cluster'].unique()):
-        cluster_data = df_clustered[df_clustered['Cluster'] == cluster]
-        print(f"\n🎯 Cluster {cluster} ({len(cluster_data)} points):")
-        
-        # Show statistics for selected features
-        cluster_stats = cluster_data[selected_columns].describe()
-        print(cluster_stats.round(3))
+    for cluster in np.flatnonzero(profile.sizes):
+        print(f"\n🎯 Cluster {cluster} ({profile.sizes[cluster]} points):")
+        print(profile.describe(cluster).round(3))
+
+def analyze_clusters(df_clustered, selected_columns):
+    """Provide detailed cluster analysis"""
+    # One pass over the data for all clusters; quartiles are approximate (within 1%)
+    profile = profile_clusters(df_clustered[selected_columns], df_clustered['Cluster'])
+    print_profile(profile)
+    return profile
+
+def save_model(selected_columns, scaler, kmeans):
+    """Offer to save the fitted model so new data can be scored later"""
+    while True:
+        name = input("\n💾 Save this model for 'predict'? Enter a name (or press Enter to skip): ").strip()
+        if not name:
+            return None
+        try:
+            check_model_name(name)
+        except ValueError as e:
+            print(f"❌ {str(e)}")
+            continue
+        version = ModelRegistry(DEFAULT_MODEL_DIR).save_fitted(
+            name, selected_columns, scaler, kmeans, metadata={'inertia': float(kmeans.inertia_)}
+        )
+        print(f"✅ Saved model '{name}' version {version}")
+        return version
+
+def cluster_one_dataset():
+    """Run one interactive load-select-cluster-save session; return False if it could not run"""
+    # Step 1: Load dataset
+    df, original_filename = load_dataset()
+    
+    # Step 2: Display dataset information
+    display_dataset_info(df)
+    
+    # Step 3: Select features
+    selected_columns = select_features(df)
+    if selected_columns is None:
+        print("❌ Cannot proceed without numeric columns.")
+        return False
+    
+    # Step 4: Get number of clusters
+    n_clusters = get_cluster_count()
+    
+    # Step 5: Perform clustering
+    df_clustered, X, cluster_labels, scaler, kmeans = perform_clustering(
+        df, selected_columns, n_clusters
+    )
+    
+    # Step 6: Create visualization
+    create_visualization(X, cluster_labels, selected_columns, n_clusters)
+    
+    # Step 7: Save results
+    save_results(df_clustered, original_filename)
+    
+    # Step 8: Detailed analysis
+    analyze_clusters(df_clustered, selected_columns)
+    
+    # Step 9: Keep the model for scoring new data
+    save_model(selected_columns, scaler, kmeans)
+    
+    print("\n" + "="*60)
+    print("🎉 CLUSTERING COMPLETED SUCCESSFULLY!")
+    print("="*60)
+    print("Files created:")
+    print("  📄 clustered_dataset.csv - Your data with cluster labels")
+    print("  📊 clustering_results.png - Visualization plot")
+    return True
+
+def ask_again():
+    """Ask whether to cluster another dataset"""
+    while True:
+        again = input("\n🔄 Would you like to cluster another dataset? (y/n): ").lower()
+        if again in ['y', 'yes']:
+            return True
+        elif again in ['n', 'no']:
+            return False
+        else:
+            print("Please enter 'y' or 'n'.")
 
 def main():
     """Main function to run the clustering tool"""
@@ -221,54 +309,10 @@ def main():
     print("Welcome! This tool will help you cluster your CSV data using K-Means algorithm.")
     
     try:
-        # Step 1: Load dataset
-        df, original_filename = load_dataset()
-        
-        # Step 2: Display dataset information
-        display_dataset_info(df)
-        
-        # Step 3: Select features
-        selected_columns = select_features(df)
-        if selected_columns is None:
-            print("❌ Cannot proceed without numeric columns.")
-            return
-        
-        # Step 4: Get number of clusters
-        n_clusters = get_cluster_count()
-        
-        # Step 5: Perform clustering
-        df_clustered, X, cluster_labels, scaler, kmeans = perform_clustering(
-            df, selected_columns, n_clusters
-        )
-        
-        # Step 6: Create visualization
-        create_visualization(X, cluster_labels, selected_columns, n_clusters)
-        
-        # Step 7: Save results
-        save_results(df_clustered, original_filename)
-        
-        # Step 8: Detailed analysis
-        analyze_clusters(df_clustered, selected_columns)
-        
-        print("\n" + "="*60)
-        print("🎉 CLUSTERING COMPLETED SUCCESSFULLY!")
-        print("="*60)
-        print("Files created:")
-        print("  📄 clustered_dataset.csv - Your data with cluster labels")
-        print("  📊 clustering_results.png - Visualization plot")
-        
-        # Ask if user wants to run again
-        while True:
-            again = input("\n🔄 Would you like to cluster another dataset? (y/n): ").lower()
-            if again in ['y', 'yes']:
-                print("\n" + "="*80)
-                main()  # Recursive call
-                break
-            elif again in ['n', 'no']:
-                print("👋 Thank you for using the AI-Powered K-Means Clustering Tool!")
-                break
-            else:
-                print("Please enter 'y' or 'n'.")
+        # Loop instead of recursing, so long sessions do not grow the stack
+        while cluster_one_dataset() and ask_again():
+            print("\n" + "="*80)
+        print("👋 Thank you for using the AI-Powered K-Means Clustering Tool!")
         
     except KeyboardInterrupt:
         print("\n\n👋 Operation cancelled by user. Goodbye!")
@@ -276,5 +320,459 @@ def main():
         print(f"\n❌ An unexpected error occurred: {str(e)}")
         print("Please check your data and try again.")
 
+def run_stream(args):
+    """Cluster a large CSV out-of-core without loading it into memory"""
+    from streaming import cluster_csv_streaming
+
+    columns = [c.strip() for c in args.columns.split(',') if c.strip()]
+    print(f"🌊 Streaming {args.file} in chunks of {args.chunksize} rows...")
+    result = cluster_csv_streaming(args.file, columns, args.k,
+                                   output_path=args.output,
+                                   chunksize=args.chunksize,
+                                   n_epochs=args.epochs)
+
+    print(f"✅ Clustered {result['n_rows']} rows into {args.k} clusters")
+    print(f"\n📊 Cluster distribution:")
+    for cluster, count in result['cluster_stats'].items():
+        percentage = (count / result['n_rows']) * 100
+        print(f"  Cluster {cluster}: {count} points ({percentage:.1f}%)")
+    print(f"✅ Clustered dataset saved as '{result['output_path']}'")
+    print_profile(result['profile'])
+    if args.save_model:
+        version = ModelRegistry(args.models_dir).save(
+            args.save_model, columns, result['scaling']['mean'], result['scaling']['scale'],
+            result['kmeans'].cluster_centers_,
+            metadata={'engine': 'minibatch', 'inertia': result['inertia'], 'n_rows': result['n_rows']}
+        )
+        print(f"💾 Saved model '{args.save_model}' version {version}")
+    return result
+
+def parse_address(text):
+    """Parse HOST:PORT into a (host, port) tuple"""
+    host, _, port = text.rpartition(':')
+    try:
+        return host or '127.0.0.1', int(port)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid address '{text}', expected HOST:PORT")
+
+def run_distributed(args):
+    """Cluster a CSV with sharded K-Means across worker processes"""
+    from distributed import cluster_csv_distributed
+
+    columns = [c.strip() for c in args.columns.split(',') if c.strip()]
+    total = args.workers + args.remote_workers
+    print(f"🧩 Splitting {args.file} into {total} shards...")
+    if args.remote_workers:
+        print(f"⏳ Waiting for {args.remote_workers} remote workers on {args.listen[0]}:{args.listen[1]}")
+    start = time.perf_counter()
+    result = cluster_csv_distributed(args.file, columns, args.k, output_path=args.output,
+                                     n_workers=args.workers, max_iter=args.max_iter,
+                                     chunksize=args.chunksize, listen=args.listen,
+                                     remote_workers=args.remote_workers,
+                                     connect_timeout=args.connect_timeout)
+    elapsed = time.perf_counter() - start
+
+    print(f"✅ Clustered {result['n_rows']} rows into {args.k} clusters on {result['n_workers']} "
+          f"workers in {result['n_iter']} iterations ({elapsed:.1f}s)")
+    print(f"\n📊 Cluster distribution:")
+    for cluster, count in result['cluster_stats'].items():
+        percentage = (count / result['n_rows']) * 100
+        print(f"  Cluster {cluster}: {count} points ({percentage:.1f}%)")
+    print(f"✅ Clustered dataset saved as '{result['output_path']}'")
+    print_profile(result['profile'])
+    if args.save_model:
+        version = ModelRegistry(args.models_dir).save(
+            args.save_model, columns, result['scaling']['mean'], result['scaling']['scale'],
+            result['cluster_centers'],
+            metadata={'engine': 'distributed', 'inertia': result['inertia'], 'n_rows': result['n_rows']}
+        )
+        print(f"💾 Saved model '{args.save_model}' version {version}")
+    return result
+
+def run_worker(args):
+    """Serve a distributed clustering coordinator from this host"""
+    from distributed import run_worker as serve
+
+    authkey = os.environ.get('KMEANS_AUTHKEY')
+    if not authkey:
+        raise ValueError('Set KMEANS_AUTHKEY to the same secret as the coordinator')
+    print(f"🔌 Connecting to coordinator at {args.connect[0]}:{args.connect[1]}...")
+    serve(args.connect, authkey.encode(), n_threads=args.threads)
+    print("✅ Coordinator finished")
+
+def expand_inputs(patterns):
+    """Expand files, directories and glob patterns into an ordered list of CSV paths"""
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matches = sorted(glob.glob(os.path.join(pattern, '*.csv')))
+        else:
+            matches = sorted(glob.glob(pattern))
+        if not matches:
+            raise ValueError(f"No CSV files match '{pattern}'")
+        paths.extend(path for path in matches if path not in paths)
+    return paths
+
+def output_stems(paths):
+    """Give every input a unique output name, even when file names repeat across directories"""
+    stems, seen = [], {}
+    for path in paths:
+        stem = os.path.splitext(os.path.basename(path))[0]
+        seen[stem] = seen.get(stem, 0) + 1
+        stems.append(stem if seen[stem] == 1 else f'{stem}_{seen[stem]}')
+    return stems
+
+def cluster_file(path, columns_arg, n_clusters, engine, dtype, output_dir, stem, plot=True,
+                 compact=True, seeding='full', compare=False, reduction=None, compare_reduction=False,
+                 restarts='sequential', restart_workers=None):
+    """Cluster one CSV and write <stem>_clustered.csv (and <stem>_clusters.png) to output_dir.
+
+    With reduction the plot shows the first two principal components.
+    """
+    start = time.perf_counter()
+    df = pd.read_csv(path)
+    if compact:
+        df, memory = compact_frame(df)
+    else:
+        memory = {'before_bytes': frame_nbytes(df), 'after_bytes': frame_nbytes(df), 'dtypes': {}}
+    if columns_arg:
+        columns = parse_columns(df, columns_arg)
+    else:
+        columns = df.select_dtypes(include=[np.number]).columns.tolist()
+    if not columns:
+        raise ValueError('No numeric columns to cluster')
+    
+    X, X_scaled, scaler = prepare_features(df[columns], dtype)
+    kmeans, cluster_labels, reduced = reduce_and_fit(X_scaled, n_clusters, reduction, engine, seeding,
+                                                     restarts=restarts, restart_workers=restart_workers)
+    if compare and kmeans.seeding_['method'] == 'coreset':
+        compare_seeding(X_scaled if reduced is None else reduced.X, n_clusters, kmeans, engine)
+    if compare_reduction and reduced is not None:
+        compare_full_width(X_scaled, n_clusters, kmeans, engine, seeding, restarts=restarts,
+                           restart_workers=restart_workers)
+    cluster_labels = compact_labels(cluster_labels, n_clusters)
+    profile = profile_clusters(df[columns], cluster_labels, n_clusters)
+    
+    outputs = [os.path.join(output_dir, f'{stem}_clustered.csv')]
+    df_clustered = df.copy(deep=False)
+    df_clustered['Cluster'] = cluster_labels
+    df_clustered.to_csv(outputs[0], index=False)
+    if reduced is not None and reduced.plot_xy is not None:
+        x, y, axes = reduced.plot_xy[:, 0], reduced.plot_xy[:, 1], reduced.axes
+    else:
+        x, y, axes = X.iloc[:, 0], X.iloc[:, 1] if len(columns) >= 2 else None, columns
+    if plot and y is not None:
+        outputs.append(os.path.join(output_dir, f'{stem}_clusters.png'))
+        png = render_cluster_plot(x, y, cluster_labels, axes,
+                                  title=f'K-Means Clustering Results (K={n_clusters})')
+        with open(outputs[1], 'wb') as f:
+            f.write(png)
+    
+    return {
+        'file': path,
+        'rows': len(df),
+        'columns': columns,
+        'inertia': float(kmeans.inertia_) if reduced is None else kmeans.reduction_['inertia'],
+        'seeding': kmeans.seeding_,
+        'restarts': kmeans.restarts_,
+        'reduction': None if reduced is None else kmeans.reduction_,
+        'cluster_stats': {int(c): int(n) for c, n in enumerate(profile.sizes)},
+        'cluster_profile': profile.to_dict(),
+        'outputs': outputs,
+        'memory': memory,
+        'seconds': time.perf_counter() - start,
+    }
+
+def describe_seeding(report):
+    """One-line summary of how a coreset-seeded fit compares with full seeding"""
+    text = (f"Seeded on a coreset of {report['coreset_size']} rows, "
+            f"{report['refine_iter']} full-data refinement iterations")
+    if 'inertia_gap' in report:
+        text += (f"; inertia {report['inertia_gap']:+.2%} vs full seeding "
+                 f"(which took {report['full_seconds']:.2f}s)")
+    return text
+
+def _init_batch_worker(n_threads):
+    # Several files are clustered at once, so each worker gets its share of the cores
+    threadpool_limits(limits=n_threads)
+
+def run_batch(args):
+    """Cluster many CSV files in parallel, one set of output files per input"""
+    check_restart_seeding(args.restarts, args.seeding)
+    paths = expand_inputs(args.inputs)
+    stems = output_stems(paths)
+    os.makedirs(args.output_dir, exist_ok=True)
+    n_jobs = max(1, min(args.jobs or os.cpu_count() or 1, len(paths)))
+    print(f"📂 Clustering {len(paths)} files with K={args.k} on {n_jobs} processes...")
+    
+    start = time.perf_counter()
+    results, failures = [], []
+    n_threads = max(1, (os.cpu_count() or 1) // n_jobs)
+    # Parallel restarts of one file get that file's share of the cores too
+    task_args = [(path, args.columns, args.k, args.engine, engine_dtype(args), args.output_dir,
+                  stem, not args.no_plot, not args.no_compact, args.seeding, args.compare_seeding,
+                  engine_reduction(args), args.compare_reduction, args.restarts, n_threads)
+                 for path, stem in zip(paths, stems)]
+    with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_batch_worker,
+                             initargs=(n_threads,)) as executor:
+        futures = {executor.submit(cluster_file, *task): task[0] for task in task_args}
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                failures.append({'file': path, 'error': str(e)})
+                print(f"❌ {path}: {str(e)}")
+                continue
+            results.append(result)
+            print(f"✅ {path}: {result['rows']} rows in {result['seconds']:.2f}s -> {result['outputs'][0]}")
+            if result['seeding']['method'] == 'coreset':
+                print(f"   🎲 {describe_seeding(result['seeding'])}")
+            if result['restarts']['method'] == 'parallel':
+                print(f"   🔀 {describe_restarts(result['restarts'])}")
+            if result['reduction'] is not None:
+                print(f"   🗜️  {describe_reduction(result['reduction'])}")
+    elapsed = time.perf_counter() - start
+    
+    total_rows = sum(r['rows'] for r in results)
+    summary = {
+        'files': len(paths),
+        'succeeded': len(results),
+        'failed': len(failures),
+        'rows': total_rows,
+        'seconds': elapsed,
+        'rows_per_second': total_rows / elapsed if elapsed else None,
+        'files_per_second': len(results) / elapsed if elapsed else None,
+        'processes': n_jobs,
+        'results': sorted(results, key=lambda r: paths.index(r['file'])),
+        'failures': failures,
+    }
+    with open(os.path.join(args.output_dir, 'batch_summary.json'), 'w') as f:
+        json.dump(summary, f, indent=1)
+    
+    print("\n" + "="*60)
+    print(f"📊 {len(results)}/{len(paths)} files clustered, {total_rows} rows in {elapsed:.2f}s")
+    print(f"⚡ Throughput: {summary['rows_per_second']:.0f} rows/s, {summary['files_per_second']:.2f} files/s")
+    print(f"✅ Outputs and batch_summary.json saved in '{args.output_dir}'")
+    if failures:
+        raise ValueError(f"{len(failures)} of {len(paths)} files failed")
+    return summary
+
+def run_predict(args):
+    """Assign the rows of a CSV to the clusters of a saved model, chunk by chunk"""
+    from streaming import read_chunks
+
+    model = ModelRegistry(args.models_dir).load(check_model_name(args.model), args.version)
+    print(f"🎯 Scoring {args.file} with model '{model.name}' version {model.version} "
+          f"({model.n_clusters} clusters on {', '.join(model.columns)})")
+
+    counts = np.zeros(model.n_clusters, dtype=np.int64)
+    n_rows = 0
+    with open(args.output, 'w', newline='') as out:
+        for chunk in read_chunks(args.file, args.chunksize):
+            labels, _ = model.predict(chunk, args.assignment)
+            chunk['Cluster'] = labels
+            chunk.to_csv(out, index=False, header=n_rows == 0)
+            counts += np.bincount(labels, minlength=model.n_clusters)
+            n_rows += len(chunk)
+
+    print(f"\n📊 Cluster distribution:")
+    for cluster, count in enumerate(counts):
+        percentage = (count / max(n_rows, 1)) * 100
+        print(f"  Cluster {cluster}: {count} points ({percentage:.1f}%)")
+    print(f"✅ Scored {n_rows} rows, saved as '{args.output}'")
+    return counts
+
+def run_models(args):
+    """List saved models and their versions"""
+    models = ModelRegistry(args.models_dir).list()
+    if not models:
+        print(f"No models saved in {args.models_dir}")
+    for name, versions in models.items():
+        print(f"  {name}: versions {', '.join(map(str, versions))}")
+    return models
+
+def parse_columns(df, columns_arg):
+    """Resolve a comma-separated column list against the numeric columns of df"""
+    columns = [c.strip() for c in columns_arg.split(',') if c.strip()]
+    for col in columns:
+        if col not in df.columns:
+            raise ValueError(f'Column "{col}" not found')
+        if not pd.api.types.is_numeric_dtype(df[col]):
+            raise ValueError(f'Column "{col}" is not numeric')
+    return columns
+
+def parse_k_range(text):
+    """Parse a K range such as '2-10' or '2,4,8'"""
+    try:
+        if '-' in text:
+            start, end = (int(x) for x in text.split('-', 1))
+            return list(range(start, end + 1))
+        return [int(x) for x in text.split(',')]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid K range '{text}'")
+
+def run_sweep(args):
+    """Evaluate a range of K values on a single scaled matrix"""
+    from clustering_core import sweep_k
+    from reduction import reduce_features
+
+    df = pd.read_csv(args.file)
+    columns = parse_columns(df, args.columns)
+    print(f"📊 Dataset shape: {df.shape[0]} rows × {df.shape[1]} columns")
+    print(f"🔄 Standardizing features once for K = {args.k_range[0]}..{args.k_range[-1]}...")
+    X_scaled, scaler = get_scaled_features(df[columns], dtype=engine_dtype(args))
+    reduction = engine_reduction(args)
+    if reduction is not None:
+        reduced = reduce_features(X_scaled, **reduction)
+        X_scaled = reduced.X
+        print(f"🗜️  Reduced {reduced.report['input_dim']} -> {reduced.report['output_dim']} dimensions "
+              f"({reduced.report['variance_retained']:.1%} of the variance) in {reduced.report['seconds']:.2f}s")
+
+    result = sweep_k(X_scaled, args.k_range, n_jobs=args.jobs,
+                     silhouette_sample=args.silhouette_sample, engine=args.engine,
+                     seeding=args.seeding)
+
+    print(f"\n{'K':>4} {'Inertia':>14} {'Silhouette':>11}")
+    for k, inertia, silhouette in zip(result['ks'], result['inertia'], result['silhouette']):
+        score = f"{silhouette:.3f}" if silhouette is not None else 'n/a'
+        print(f"{k:>4} {inertia:>14.2f} {score:>11}")
+    print(f"\n📐 Elbow K: {result['elbow_k']}")
+    print(f"📈 Best silhouette K: {result['silhouette_k']}")
+    print(f"✅ Recommended K: {result['recommended_k']}")
+    return result
+
+def engine_dtype(args):
+    return 'float32' if args.float32 else 'float64'
+
+def engine_reduction(args):
+    return parse_reduction(args.reduction, args.components, args.variance)
+
+def add_engine_arguments(parser):
+    """Add the K-Means engine options shared by the subcommands that fit K-Means"""
+    parser.add_argument('--engine', choices=sorted(ENGINES), default='sklearn',
+                        help='K-Means implementation (default: sklearn)')
+    parser.add_argument('--float32', action='store_true',
+                        help='scale and cluster in single precision to halve memory')
+    parser.add_argument('--seeding', choices=SEEDING_METHODS, default='full',
+                        help="'coreset' runs the restarts on a weighted sample, then refines on "
+                             "all rows (default: full)")
+    parser.add_argument('--reduction', choices=REDUCTION_METHODS, default='none',
+                        help="reduce the standardized features before fitting: 'pca', or 'projection' "
+                             "(sparse random projection) for very wide data (default: none)")
+    parser.add_argument('--components', type=int, default=None,
+                        help='dimensions to keep (default: enough for --variance with pca)')
+    parser.add_argument('--variance', type=float, default=None,
+                        help='with pca, keep the fewest components explaining this share of the '
+                             'variance (default: 0.9)')
+
+def build_parser():
+    """Build the argument parser for non-interactive use"""
+    parser = argparse.ArgumentParser(
+        description="AI-Powered K-Means Clustering Tool. Run without arguments for interactive mode."
+    )
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    stream = subparsers.add_parser('stream', help='cluster a CSV larger than memory in chunks')
+    stream.add_argument('file', help='path to the CSV file')
+    stream.add_argument('--columns', required=True, help='comma-separated numeric columns')
+    stream.add_argument('-k', '--k', type=int, required=True, help='number of clusters')
+    stream.add_argument('--chunksize', type=int, default=100_000, help='rows per chunk')
+    stream.add_argument('--epochs', type=int, default=1, help='passes over the file for fitting')
+    stream.add_argument('--output', default='clustered_dataset.csv', help='output CSV path')
+    stream.add_argument('--save-model', metavar='NAME', help='save the fitted model under this name')
+    stream.add_argument('--models-dir', default=DEFAULT_MODEL_DIR, help='model registry directory')
+    stream.set_defaults(func=run_stream)
+
+    sweep = subparsers.add_parser('sweep', help='evaluate a range of K values (elbow / silhouette)')
+    sweep.add_argument('file', help='path to the CSV file')
+    sweep.add_argument('--columns', required=True, help='comma-separated numeric columns')
+    sweep.add_argument('--k-range', type=parse_k_range, default=list(range(2, 11)),
+                       help="K values to try, e.g. '2-10' or '2,4,8' (default 2-10)")
+    sweep.add_argument('--jobs', type=int, default=None, help='parallel fits (default: all cores)')
+    sweep.add_argument('--silhouette-sample', type=int, default=10000,
+                       help='rows sampled for the silhouette score')
+    add_engine_arguments(sweep)
+    sweep.set_defaults(func=run_sweep)
+
+    predict = subparsers.add_parser('predict', help='score a CSV with a saved model, without refitting')
+    predict.add_argument('file', help='path to the CSV file')
+    predict.add_argument('--model', required=True, help='name of the saved model')
+    predict.add_argument('--version', type=int, default=None, help='model version (default: latest)')
+    predict.add_argument('--output', default='predicted_dataset.csv', help='output CSV path')
+    predict.add_argument('--chunksize', type=int, default=100_000, help='rows per chunk')
+    predict.add_argument('--assignment', choices=ASSIGNMENT_METHODS, default=None,
+                         help='nearest-centroid search: brute force, KD-tree or auto (by K and columns)')
+    predict.add_argument('--models-dir', default=DEFAULT_MODEL_DIR, help='model registry directory')
+    predict.set_defaults(func=run_predict)
+
+    batch = subparsers.add_parser('batch', help='cluster many CSV files in parallel without prompts')
+    batch.add_argument('inputs', nargs='+', help='CSV files, directories or glob patterns')
+    batch.add_argument('--columns', default=None,
+                       help='comma-separated numeric columns (default: every numeric column)')
+    batch.add_argument('-k', '--k', type=int, required=True, help='number of clusters')
+    batch.add_argument('--output-dir', default='clustered', help='directory for the output files')
+    batch.add_argument('--jobs', type=int, default=None, help='parallel processes (default: all cores)')
+    batch.add_argument('--no-plot', action='store_true', help='skip the per-file plots')
+    batch.add_argument('--no-compact', action='store_true',
+                       help='keep the parsed column types instead of downcasting them')
+    batch.add_argument('--compare-seeding', action='store_true',
+                       help='with --seeding coreset, also fit with full seeding and report the gap')
+    batch.add_argument('--compare-reduction', action='store_true',
+                       help='with --reduction, also fit on all columns and report the time saved')
+    batch.add_argument('--restarts', choices=RESTART_METHODS, default='sequential',
+                       help="'parallel' runs the K-Means restarts on worker processes and stops the "
+                            "losing ones early (default: sequential)")
+    add_engine_arguments(batch)
+    batch.set_defaults(func=run_batch)
+
+    dist = subparsers.add_parser('distributed', help='cluster a CSV with sharded K-Means on worker processes')
+    dist.add_argument('file', help='path to the CSV file (visible to every worker at the same path)')
+    dist.add_argument('--columns', required=True, help='comma-separated numeric columns')
+    dist.add_argument('-k', '--k', type=int, required=True, help='number of clusters')
+    dist.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                      help='local worker processes (default: all cores)')
+    dist.add_argument('--remote-workers', type=int, default=0,
+                      help="workers to wait for on --listen, started with the 'worker' subcommand")
+    dist.add_argument('--listen', type=parse_address, default=('127.0.0.1', 0),
+                      help='HOST:PORT the coordinator listens on (needs KMEANS_AUTHKEY for remote workers)')
+    dist.add_argument('--connect-timeout', type=float, default=300,
+                      help='seconds to wait for all workers to connect (default: 300)')
+    dist.add_argument('--max-iter', type=int, default=300, help='maximum Lloyd iterations')
+    dist.add_argument('--chunksize', type=int, default=100_000, help='rows per parsed chunk')
+    dist.add_argument('--output', default='clustered_dataset.csv', help='output CSV path')
+    dist.add_argument('--save-model', metavar='NAME', help='save the fitted model under this name')
+    dist.add_argument('--models-dir', default=DEFAULT_MODEL_DIR, help='model registry directory')
+    dist.set_defaults(func=run_distributed)
+
+    worker = subparsers.add_parser('worker', help='serve a distributed coordinator on another host')
+    worker.add_argument('--connect', type=parse_address, required=True, help='coordinator HOST:PORT')
+    worker.add_argument('--threads', type=int, default=1, help='BLAS threads for this worker')
+    worker.set_defaults(func=run_worker)
+
+    models = subparsers.add_parser('models', help='list saved models')
+    models.add_argument('--models-dir', default=DEFAULT_MODEL_DIR, help='model registry directory')
+    models.set_defaults(func=run_models)
+
+    return parser
+
+def cli(argv=None):
+    """Entry point for command-line arguments"""
+    args = build_parser().parse_args(argv)
+    try:
+        args.func(args)
+    except KeyError as e:
+        print(f"❌ Model not found: {e.args[0]}")
+        sys.exit(1)
+    except (ValueError, FileNotFoundError, TimeoutError) as e:
+        print(f"❌ {str(e)}")
+        sys.exit(1)
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    if int(pd.__version__.split('.')[0]) < 3:
+        # Always on from pandas 3.0; column selections share buffers instead of copying
+        pd.set_option('mode.copy_on_write', True)
+    if len(sys.argv) > 1:
+        cli()
+    else:
+        main()
\ No newline at end of file
@@ -0,0 +1,154 @@
+"""
+Columnar on-disk format for uploaded datasets.
+
+Each dataset is a directory holding a JSON manifest, one .npy file per
+numeric column and a single pickle for the remaining (text, categorical,
+mixed) columns. Numeric columns are opened as memory maps, so reading the
+columns selected for clustering costs no parsing and no copy, and any
+process can reopen a dataset by its directory.
+"""
+
+import json
+import os
+import shutil
+import uuid
+
+import numpy as np
+import pandas as pd
+
+MANIFEST = 'manifest.json'
+OBJECTS_FILE = 'objects.pkl'
+LABELS_FILE = 'labels.npy'
+
+
+def _is_array_column(series):
+    # Plain NumPy dtypes round-trip through .npy; extension dtypes go to the pickle
+    return isinstance(series.dtype, np.dtype) and series.dtype.kind in 'iufbmM'
+
+
+def write_dataset(df, directory):
+    """Write df to directory in columnar form and return the opened dataset"""
+    tmp_dir = f'{directory}.tmp-{uuid.uuid4().hex[:8]}'
+    os.makedirs(tmp_dir)
+    try:
+        columns = []
+        other = {}
+        for i, name in enumerate(df.columns):
+            series = df[name]
+            if _is_array_column(series):
+                file_name = f'col_{i}.npy'
+                np.save(os.path.join(tmp_dir, file_name), series.to_numpy())
+                columns.append({'name': name, 'dtype': str(series.dtype), 'file': file_name})
+            else:
+                other[i] = series
+                columns.append({'name': name, 'dtype': str(series.dtype), 'file': OBJECTS_FILE,
+                                'key': i})
+
+        if other:
+            pd.DataFrame(other).to_pickle(os.path.join(tmp_dir, OBJECTS_FILE))
+
+        manifest = {'n_rows': len(df), 'columns': columns}
+        with open(os.path.join(tmp_dir, MANIFEST), 'w') as f:
+            json.dump(manifest, f)
+
+        # Readers never see a half-written dataset
+        os.replace(tmp_dir, directory)
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    return ColumnarDataset(directory, manifest)
+
+
+def is_dataset(directory):
+    return os.path.isfile(os.path.join(directory, MANIFEST))
+
+
+def open_dataset(directory):
+    """Open a dataset written by write_dataset"""
+    with open(os.path.join(directory, MANIFEST)) as f:
+        return ColumnarDataset(directory, json.load(f))
+
+
+class ColumnarDataset:
+    """Handle on a columnar dataset directory.
+
+    The handle is cheap to pickle, so it can be sent to worker processes,
+    which then map the column files themselves.
+    """
+
+    def __init__(self, directory, manifest):
+        self.directory = directory
+        self.manifest = manifest
+
+    @property
+    def n_rows(self):
+        return self.manifest['n_rows']
+
+    @property
+    def columns(self):
+        return [c['name'] for c in self.manifest['columns']]
+
+    @property
+    def dtypes(self):
+        return {c['name']: c['dtype'] for c in self.manifest['columns']}
+
+    def subset(self, columns):
+        """Return a handle restricted to the given columns"""
+        by_name = {c['name']: c for c in self.manifest['columns']}
+        for name in columns:
+            if name not in by_name:
+                raise KeyError(name)
+        manifest = dict(self.manifest, columns=[by_name[name] for name in columns])
+        return ColumnarDataset(self.directory, manifest)
+
+    def column(self, name):
+        """Return one numeric column as a read-only-on-disk memory map"""
+        for spec in self.manifest['columns']:
+            if spec['name'] == name and spec['file'] != OBJECTS_FILE:
+                # 'c' mode: pages are shared with the file until someone writes to them
+                return np.load(os.path.join(self.directory, spec['file']), mmap_mode='c')
+        raise KeyError(name)
+
+    def to_frame(self):
+        """Build a DataFrame whose numeric columns are backed by the memory maps"""
+        data = {}
+        others = None
+        for spec in self.manifest['columns']:
+            if spec['file'] == OBJECTS_FILE:
+                if others is None:
+                    others = pd.read_pickle(os.path.join(self.directory, OBJECTS_FILE))
+                data[spec['name']] = others[spec['key']]
+            else:
+                data[spec['name']] = self.column(spec['name'])
+        return pd.DataFrame(data, columns=self.columns, copy=False)
+
+    def load_labels(self):
+        path = os.path.join(self.directory, LABELS_FILE)
+        return np.load(path, mmap_mode='c') if os.path.exists(path) else None
+
+    def labels_version(self):
+        """Identity of the current labels file (None if there is none); changes on every save"""
+        try:
+            stat = os.stat(os.path.join(self.directory, LABELS_FILE))
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    def save_labels(self, labels):
+        path = os.path.join(self.directory, LABELS_FILE)
+        if labels is None:
+            if os.path.exists(path):
+                os.remove(path)
+            return
+        tmp_path = f'{path}.tmp-{uuid.uuid4().hex[:8]}.npy'
+        np.save(tmp_path, np.asarray(labels))
+        os.replace(tmp_path, path)
+
+    def delete(self):
+        # Renamed first so other processes never see a half-deleted dataset
+        trash = f'{self.directory}.deleted-{uuid.uuid4().hex[:8]}'
+        try:
+            os.rename(self.directory, trash)
+        except FileNotFoundError:
+            return
+        shutil.rmtree(trash, ignore_errors=True)
@@ -0,0 +1,96 @@
+"""
+Compact in-memory representation of loaded datasets.
+
+compact_frame() shrinks a DataFrame at ingest time without changing any
+value: integer columns get the narrowest integer type that holds their
+range, float columns become float32 when every value survives the round
+trip exactly, and text columns with few distinct values become
+categoricals (one small integer code per row plus the distinct strings).
+Cluster labels are kept as a separate array of the narrowest integer type
+for K instead of a column added to a copy of the frame.
+"""
+
+import numpy as np
+import pandas as pd
+
+# Text columns with at most this fraction of distinct values become categoricals
+CATEGORY_MAX_RATIO = 0.5
+
+
+def frame_nbytes(df):
+    """Memory used by a DataFrame, including the strings it references"""
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+def _downcast_integer(series):
+    if series.empty:
+        return series
+    return pd.to_numeric(series, downcast='unsigned' if series.min() >= 0 else 'integer')
+
+
+def _downcast_float(series):
+    values = series.to_numpy()
+    if values.dtype != np.float64:
+        return series
+    with np.errstate(over='ignore'):
+        narrow = values.astype(np.float32)
+    # Only when no value changes, so results are the same as with the float64 column
+    if not np.array_equal(narrow.astype(np.float64), values, equal_nan=True):
+        return series
+    return pd.Series(narrow, index=series.index, name=series.name)
+
+
+def _to_category(series, max_ratio):
+    if len(series) == 0 or pd.api.types.infer_dtype(series, skipna=True) != 'string':
+        return series
+    if series.nunique(dropna=False) > max_ratio * len(series):
+        return series
+    return series.astype('category')
+
+
+def compact_frame(df, category_max_ratio=CATEGORY_MAX_RATIO):
+    """Return (compacted df, {'before_bytes', 'after_bytes', 'dtypes'}) for a freshly loaded df.
+
+    'dtypes' maps each changed column to its (old, new) dtype names.
+    """
+    before = frame_nbytes(df)
+    columns = {}
+    changed = {}
+    for name in df.columns:
+        series = df[name]
+        dtype = series.dtype
+        if isinstance(dtype, np.dtype) and dtype.kind in 'iu':
+            compacted = _downcast_integer(series)
+        elif isinstance(dtype, np.dtype) and dtype.kind == 'f':
+            compacted = _downcast_float(series)
+        elif dtype == object or pd.api.types.is_string_dtype(dtype):
+            compacted = _to_category(series, category_max_ratio)
+        else:
+            # bool, datetime, already categorical and other extension types stay as they are
+            compacted = series
+        if compacted.dtype != dtype:
+            changed[str(name)] = (str(dtype), str(compacted.dtype))
+        columns[name] = compacted
+    result = pd.DataFrame(columns, index=df.index, columns=df.columns, copy=False)
+    return result, {'before_bytes': before, 'after_bytes': frame_nbytes(result), 'dtypes': changed}
+
+
+def label_dtype(n_clusters):
+    """Narrowest integer type that holds the labels 0..n_clusters-1"""
+    return np.min_scalar_type(max(int(n_clusters) - 1, 0))
+
+
+def compact_labels(labels, n_clusters=None):
+    """Cluster labels as an array of the narrowest integer type for K"""
+    labels = np.asarray(labels)
+    if n_clusters is None:
+        n_clusters = int(labels.max()) + 1 if len(labels) else 1
+    return labels.astype(label_dtype(n_clusters), copy=False)
+
+
+def format_bytes(n_bytes):
+    """Human-readable size, e.g. '12.3 MB'"""
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if abs(n_bytes) < 1024 or unit == 'GB':
+            return f'{n_bytes:.0f} {unit}' if unit == 'B' else f'{n_bytes:.1f} {unit}'
+        n_bytes /= 1024
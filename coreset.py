@@ -0,0 +1,89 @@
+"""
+Coreset seeding for K-Means on large datasets.
+
+Full seeding runs k-means++ n_init times over every row, which dominates the
+fit at large row counts. Coreset seeding instead:
+
+  1. builds a lightweight coreset (Bachem, Lucic and Krause, 2018) of at most
+     CORESET_SIZE weighted rows in one O(n*d) pass: rows are sampled with
+     probability half uniform, half proportional to their squared distance
+     from the data mean, and weighted by the inverse of that probability, so
+     the weighted K-Means cost of the coreset estimates the cost on all rows;
+  2. runs all n_init k-means++ restarts on the coreset only;
+  3. refines the best coreset centers with a few Lloyd iterations over the
+     full data (REFINE_ITER), using the selected engine.
+
+Datasets that are not much larger than the coreset are fitted with full
+seeding, since there is nothing to save.
+"""
+
+import os
+
+import numpy as np
+
+from kmeans_engine import get_engine
+from metrics import timed
+
+SEEDING_METHODS = ('full', 'coreset')
+CORESET_SIZE = int(os.environ.get('KMEANS_CORESET_SIZE', 20_000))
+REFINE_ITER = 5
+
+
+def coreset_size(n_samples, n_clusters, size=None):
+    """Number of coreset rows for a dataset, or 0 when full seeding should be used"""
+    size = max(size or CORESET_SIZE, 50 * n_clusters)
+    return size if n_samples > 2 * size else 0
+
+
+def lightweight_coreset(X, size, rng):
+    """Sample a weighted coreset of size rows; returns (rows, weights)"""
+    mean = X.mean(axis=0, dtype=np.float64)
+    # Squared distance to the mean without an n x d temporary: |x|^2 - 2 x.mu + |mu|^2
+    dist = np.einsum('ij,ij->i', X, X, dtype=np.float64)
+    dist -= 2 * (X @ mean.astype(X.dtype))
+    dist += mean @ mean
+    np.maximum(dist, 0, out=dist)
+    total = dist.sum()
+    q = np.full(len(X), 0.5 / len(X))
+    if total > 0:
+        q += 0.5 * dist / total
+    else:
+        q *= 2
+    index = rng.choice(len(X), size=size, p=q)
+    return X[index], 1.0 / (size * q[index])
+
+
+def fit_coreset_kmeans(X, n_clusters, engine='sklearn', random_state=42, n_init=10, size=None,
+                       refine_iter=REFINE_ITER, callback=None):
+    """Fit K-Means seeded on a coreset; returns (model, report).
+
+    callback follows the full-data fit (the refinement), as in the engines.
+    """
+    from sklearn.cluster import KMeans
+
+    size = coreset_size(len(X), n_clusters, size)
+    if not size:
+        return get_engine(engine).fit(X, n_clusters, random_state=random_state, n_init=n_init,
+                                      callback=callback), \
+            {'method': 'full', 'reason': 'dataset is too small for a coreset to help'}
+
+    rng = np.random.default_rng(random_state)
+    with timed('coreset'):
+        rows, weights = lightweight_coreset(X, size, rng)
+        # Weighted restarts run in scikit-learn whatever the engine; the coreset is small
+        seeded = KMeans(n_clusters=n_clusters, n_init=n_init, random_state=random_state)
+        seeded.fit(rows, sample_weight=weights)
+    with timed('refine'):
+        model = get_engine(engine, max_iter=refine_iter).fit(
+            X, n_clusters, random_state=random_state, init=seeded.cluster_centers_, callback=callback
+        )
+    return model, {
+        'method': 'coreset',
+        'coreset_size': size,
+        # Weighted coreset cost: an estimate of the full-data inertia before refinement
+        'coreset_inertia': float(seeded.inertia_),
+        # The restarts ran on the coreset; the refinement stops after refine_iter by design
+        'coreset_iter': int(seeded.n_iter_),
+        'converged': bool(seeded.n_iter_ < seeded.max_iter),
+        'refine_iter': int(model.n_iter_),
+    }
@@ -0,0 +1,202 @@
+"""
+Per-session dataset store for the web app.
+
+Datasets are keyed by an opaque ID. On ingest every dataset is written to
+the columnar format in columnar_store, so it can be reopened after a
+restart or from another worker process without parsing CSV again. At most
+a configurable memory budget of datasets is kept resident; when it is
+exceeded the least-recently-used datasets are dropped from memory and
+transparently reopened from disk on their next access.
+
+Only the uploaded frame is kept resident. Cluster labels live in a separate
+array and the "current" dataset is a shallow copy of the original with the
+labels attached, so resetting a dataset simply discards the labels.
+
+Several server processes can share one storage directory: the files are the
+source of truth, so a resident dataset is dropped once another process has
+deleted it and its labels are reloaded once another process has changed
+them. Datasets are reference counted across processes (see shared_state);
+the upload holds one reference, and every running job and every stored
+clustering result another.
+"""
+
+import os
+import re
+import threading
+import uuid
+from collections import OrderedDict
+
+from columnar_store import write_dataset, open_dataset, is_dataset
+from compaction import compact_labels
+from shared_state import RefCounter
+from feature_cache import dataset_fingerprint
+
+_DATASET_ID = re.compile(r'[0-9a-f]{32}')
+
+
+class DatasetEntry:
+    """A resident dataset: the uploaded frame plus an optional label array"""
+
+    def __init__(self, handle, labels=None):
+        self.handle = handle
+        self.original = handle.to_frame()
+        self.labels = labels
+        self.labels_version = handle.labels_version()
+        self._original_nbytes = int(self.original.memory_usage(index=True, deep=True).sum())
+        self._content_hash = None
+
+    @property
+    def content_hash(self):
+        """Fingerprint of the uploaded data, computed on first use"""
+        if self._content_hash is None:
+            self._content_hash = dataset_fingerprint(self.original)
+        return self._content_hash
+
+    @property
+    def nbytes(self):
+        size = self._original_nbytes
+        if self.labels is not None:
+            size += self.labels.nbytes
+        return size
+
+    @property
+    def current(self):
+        """The original frame with a Cluster column, sharing its column data"""
+        if self.labels is None:
+            return self.original
+        view = self.original.copy(deep=False)
+        view['Cluster'] = self.labels
+        return view
+
+
+class DatasetStore:
+    """Thread-safe LRU store of datasets bounded by total memory"""
+
+    def __init__(self, memory_budget, storage_dir):
+        self.memory_budget = memory_budget
+        self.storage_dir = storage_dir
+        self._resident = OrderedDict()
+        self._sizes = {}
+        self._lock = threading.RLock()
+        os.makedirs(storage_dir, exist_ok=True)
+
+    def _directory(self, dataset_id):
+        # IDs come from clients, so never let one escape the storage directory
+        if not isinstance(dataset_id, str) or not _DATASET_ID.fullmatch(dataset_id):
+            raise KeyError(dataset_id)
+        return os.path.join(self.storage_dir, dataset_id)
+
+    def add(self, df, holder='upload'):
+        """Persist a new dataset in columnar form, held by holder, and return its ID"""
+        dataset_id = uuid.uuid4().hex
+        handle = write_dataset(df, self._directory(dataset_id))
+        self.acquire(dataset_id, holder)
+        with self._lock:
+            self._put(dataset_id, DatasetEntry(handle))
+        return dataset_id
+
+    def acquire(self, dataset_id, holder):
+        """Take a reference on a dataset; raises KeyError if it is gone"""
+        RefCounter(self._directory(dataset_id)).acquire(holder)
+
+    def holders(self, dataset_id):
+        """Names of the current holders of a dataset; empty once it is gone"""
+        try:
+            return RefCounter(self._directory(dataset_id)).holders()
+        except KeyError:
+            return []
+
+    def release(self, dataset_id, holder):
+        """Drop a reference; the dataset is deleted when no holder is left"""
+        try:
+            directory = self._directory(dataset_id)
+        except KeyError:
+            return
+        RefCounter(directory).release(holder, on_last=lambda: self.remove(dataset_id))
+
+    def get(self, dataset_id):
+        """Return the entry for dataset_id, reopening it from disk if not resident"""
+        with self._lock:
+            directory = self._directory(dataset_id)
+            if not is_dataset(directory):
+                # Possibly deleted by another process while resident here
+                self._resident.pop(dataset_id, None)
+                self._sizes.pop(dataset_id, None)
+                raise KeyError(dataset_id)
+            if dataset_id in self._resident:
+                self._resident.move_to_end(dataset_id)
+                entry = self._resident[dataset_id]
+                version = entry.handle.labels_version()
+                if version != entry.labels_version:
+                    # Labels were saved or reset by another process
+                    entry.labels = entry.handle.load_labels()
+                    entry.labels_version = version
+                    self._sizes[dataset_id] = entry.nbytes
+                return entry
+            handle = open_dataset(directory)
+            entry = DatasetEntry(handle, handle.load_labels())
+            self._put(dataset_id, entry)
+            return entry
+
+    def __contains__(self, dataset_id):
+        try:
+            return is_dataset(self._directory(dataset_id))
+        except KeyError:
+            return False
+
+    def set_labels(self, dataset_id, labels):
+        """Attach cluster labels to a dataset"""
+        with self._lock:
+            entry = self.get(dataset_id)
+            entry.labels = compact_labels(labels)
+            entry.handle.save_labels(entry.labels)
+            entry.labels_version = entry.handle.labels_version()
+            self._sizes[dataset_id] = entry.nbytes
+            self._evict(keep=dataset_id)
+
+    def reset(self, dataset_id):
+        """Drop cluster labels so the dataset is back to its uploaded state"""
+        with self._lock:
+            entry = self.get(dataset_id)
+            entry.labels = None
+            entry.handle.save_labels(None)
+            entry.labels_version = None
+            self._sizes[dataset_id] = entry.nbytes
+
+    def remove(self, dataset_id):
+        """Forget a dataset and delete its files"""
+        with self._lock:
+            self._resident.pop(dataset_id, None)
+            self._sizes.pop(dataset_id, None)
+            try:
+                directory = self._directory(dataset_id)
+            except KeyError:
+                return
+            if is_dataset(directory):
+                open_dataset(directory).delete()
+
+    def memory_usage(self):
+        """Return resident bytes, budget and dataset counts"""
+        with self._lock:
+            stored = sum(1 for name in os.listdir(self.storage_dir) if _DATASET_ID.fullmatch(name))
+            return {
+                'resident_bytes': sum(self._sizes.values()),
+                'budget_bytes': self.memory_budget,
+                'resident_datasets': len(self._resident),
+                'spilled_datasets': stored - len(self._resident),
+            }
+
+    def _put(self, dataset_id, entry):
+        self._resident[dataset_id] = entry
+        self._sizes[dataset_id] = entry.nbytes
+        self._evict(keep=dataset_id)
+
+    def _evict(self, keep):
+        # The dataset being used always stays resident, even if it alone exceeds the budget.
+        # Evicted datasets are already on disk, so dropping them loses nothing.
+        while sum(self._sizes.values()) > self.memory_budget:
+            victim = next((k for k in self._resident if k != keep), None)
+            if victim is None:
+                break
+            del self._resident[victim]
+            del self._sizes[victim]
@@ -0,0 +1,364 @@
+"""
+Sharded (map-reduce) K-Means over a CSV file with a coordinator and workers.
+
+The coordinator splits the file into byte-range shards on line boundaries,
+so it never parses the data itself, and hands one shard to each worker.
+Workers keep their shard's feature columns in memory and answer requests
+over a multiprocessing.connection socket:
+
+  load    parse the shard, return its row count and per-column moments
+  scale   impute and standardize the shard with the global mean/scale
+  sample  return a random sample of rows (for k-means++ seeding)
+  step    assign rows to the given centers, return per-cluster sums, counts
+          and the inertia
+  write   write the shard with a Cluster column to a part file and return
+          the shard's ClusterProfile, merged by the coordinator
+
+Each Lloyd iteration is one 'step' broadcast plus a reduction of the sums
+and counts, so only O(k*d) numbers cross the wire per worker and iteration.
+Workers can run locally (the default) or on other hosts that see the same
+file path: start them with `clustering_tool.py worker --connect HOST:PORT`
+and the same KMEANS_AUTHKEY as the coordinator, which waits for them for at
+most connect_timeout seconds.
+
+Shards are cut at newlines, so quoted fields must not contain line breaks.
+"""
+
+import io
+import os
+import select
+import shutil
+import time
+import traceback
+import multiprocessing
+from multiprocessing.connection import Listener, Client
+
+import numpy as np
+import pandas as pd
+from threadpoolctl import threadpool_limits
+
+from cluster_profile import ClusterProfile
+from kmeans_engine import nearest_two, cluster_sums, kmeans_plusplus
+from streaming import (DEFAULT_CHUNKSIZE, chunk_moments, merge_moments, scaling_from_moments,
+                       scale_chunk, validate_columns)
+
+# Rows drawn from all shards together for k-means++ seeding
+SEED_SAMPLE_ROWS = 100_000
+# How long the coordinator waits for all workers to connect
+CONNECT_TIMEOUT_SECONDS = 300
+ACCEPT_POLL_SECONDS = 0.5
+
+
+def plan_shards(file_path, n_shards):
+    """Split a CSV into at most n_shards byte ranges that start and end on line boundaries.
+
+    Returns (header bytes, [(start, end), ...]); the ranges cover every data row once.
+    """
+    size = os.path.getsize(file_path)
+    with open(file_path, 'rb') as f:
+        header = f.readline()
+        data_start = f.tell()
+        boundaries = [data_start]
+        for i in range(1, n_shards):
+            cut = data_start + (size - data_start) * i // n_shards
+            if cut <= boundaries[-1]:
+                continue
+            # The shard boundary is the start of the first line beginning at or after cut
+            f.seek(cut - 1)
+            f.readline()
+            boundaries.append(f.tell())
+        boundaries.append(size)
+    ranges = [(start, end) for start, end in zip(boundaries, boundaries[1:]) if end > start]
+    return header, ranges
+
+
+class _ByteRange(io.RawIOBase):
+    """Read-only view of bytes [start, end) of a file"""
+
+    def __init__(self, file_path, start, end):
+        self._file = open(file_path, 'rb')
+        self._file.seek(start)
+        self._remaining = end - start
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        size = min(len(buffer), self._remaining)
+        if size <= 0:
+            return 0
+        n = self._file.readinto(memoryview(buffer)[:size])
+        self._remaining -= n
+        return n
+
+    def close(self):
+        self._file.close()
+        super().close()
+
+
+def read_shard(file_path, names, shard, chunksize, columns=None):
+    """Yield DataFrame chunks of one shard; names is the CSV header"""
+    with io.BufferedReader(_ByteRange(file_path, *shard)) as f:
+        reader = pd.read_csv(f, header=None, names=names, usecols=columns, chunksize=chunksize)
+        for chunk in reader:
+            yield chunk if columns is None else chunk[columns]
+
+
+class ShardWorker:
+    """Worker-side state: one shard's feature matrix and the handlers for each request"""
+
+    def __init__(self):
+        self.X = None
+        self.x_sq = None
+
+    def load(self, file_path, names, shard, columns, chunksize):
+        self.file_path, self.names, self.shard = file_path, names, shard
+        self.columns, self.chunksize = columns, chunksize
+        parts = []
+        for chunk in read_shard(file_path, names, shard, chunksize, columns):
+            for col in columns:
+                if not pd.api.types.is_numeric_dtype(chunk[col]):
+                    raise ValueError(f'Column "{col}" is not numeric')
+            parts.append(chunk.to_numpy(dtype=np.float64))
+        self.X = np.vstack(parts) if parts else np.empty((0, len(columns)))
+        return len(self.X), chunk_moments(self.X)
+
+    def scale(self, stats):
+        self.X = scale_chunk(pd.DataFrame(self.X), stats)
+        self.x_sq = np.einsum('ij,ij->i', self.X, self.X)
+        return True
+
+    def sample(self, n, seed):
+        rng = np.random.default_rng(seed)
+        return self.X[rng.choice(len(self.X), size=min(n, len(self.X)), replace=False)]
+
+    def step(self, centers):
+        labels, nearest, _ = nearest_two(self.X, centers, self.x_sq)
+        n_clusters = len(centers)
+        return (cluster_sums(self.X, labels, n_clusters),
+                np.bincount(labels, minlength=n_clusters),
+                float(np.sum(nearest ** 2)))
+
+    def write(self, centers, part_path, header):
+        """Write the shard's full rows plus a Cluster column; the header only for shard 0"""
+        labels, nearest, _ = nearest_two(self.X, centers, self.x_sq)
+        # self.X is scaled and imputed, so the profile is built from the rows being written
+        profile = ClusterProfile(self.columns, len(centers))
+        offset = 0
+        with open(part_path, 'w', newline='') as out:
+            for chunk in read_shard(self.file_path, self.names, self.shard, self.chunksize):
+                chunk_labels = labels[offset:offset + len(chunk)]
+                profile.update(chunk[self.columns], chunk_labels)
+                chunk['Cluster'] = chunk_labels
+                chunk.to_csv(out, index=False, header=header and offset == 0)
+                offset += len(chunk)
+        return profile, float(np.sum(nearest ** 2))
+
+
+def run_worker(address, authkey, n_threads=1):
+    """Connect to a coordinator and serve its requests until told to stop"""
+    threadpool_limits(limits=n_threads)
+    worker = ShardWorker()
+    with Client(address, authkey=authkey) as conn:
+        while True:
+            command, args = conn.recv()
+            if command == 'stop':
+                return
+            try:
+                conn.send(('ok', getattr(worker, command)(*args)))
+            except Exception:
+                conn.send(('error', traceback.format_exc()))
+
+
+class Coordinator:
+    """Accepts worker connections and broadcasts requests to them.
+
+    Without an authkey a random one is used, which only local workers know.
+    """
+
+    def __init__(self, address=('127.0.0.1', 0), authkey=None):
+        self.authkey = authkey or os.urandom(16)
+        self.listener = Listener(address, authkey=self.authkey)
+        self.connections = []
+        self.processes = []
+
+    @property
+    def address(self):
+        return self.listener.address
+
+    def start_local_workers(self, n_workers):
+        for _ in range(n_workers):
+            process = multiprocessing.Process(target=run_worker, args=(self.address, self.authkey),
+                                              daemon=True)
+            process.start()
+            self.processes.append(process)
+
+    def accept(self, n_workers, timeout=CONNECT_TIMEOUT_SECONDS):
+        """Wait until n_workers workers are connected; raises TimeoutError after timeout seconds"""
+        deadline = time.monotonic() + timeout
+        # Listener.accept() has no timeout, so its socket is polled until a worker knocks
+        sock = self.listener._listener._socket
+        while len(self.connections) < n_workers:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                host, port = self.address[:2]
+                raise TimeoutError(f'Only {len(self.connections)} of {n_workers} workers connected '
+                                   f'within {timeout:g}s; check that they can reach {host}:{port} '
+                                   f'and use the same KMEANS_AUTHKEY')
+            exited = [process for process in self.processes if process.exitcode is not None]
+            if exited:
+                raise RuntimeError(f'{len(exited)} local worker(s) exited before connecting')
+            ready, _, _ = select.select([sock], [], [], min(remaining, ACCEPT_POLL_SECONDS))
+            if not ready:
+                continue
+            try:
+                self.connections.append(self.listener.accept())
+            except multiprocessing.AuthenticationError:
+                # A client with another key is turned away; the run keeps waiting for real workers
+                continue
+
+    def call(self, requests):
+        """Send one (command, args) per worker, then gather all replies in worker order"""
+        for conn, request in zip(self.connections, requests):
+            conn.send(request)
+        replies = []
+        for conn in self.connections[:len(requests)]:
+            status, value = conn.recv()
+            if status == 'error':
+                raise RuntimeError(f'Worker failed:\n{value}')
+            replies.append(value)
+        return replies
+
+    def broadcast(self, command, *args):
+        return self.call([(command, args)] * len(self.connections))
+
+    def release(self, n_workers):
+        """Stop and disconnect the last n_workers workers"""
+        if n_workers <= 0:
+            return
+        for conn in self.connections[-n_workers:]:
+            conn.send(('stop', ()))
+            conn.close()
+        del self.connections[-n_workers:]
+
+    def close(self):
+        for conn in self.connections:
+            try:
+                conn.send(('stop', ()))
+                conn.close()
+            except OSError:
+                pass
+        for process in self.processes:
+            process.join(timeout=5)
+        self.listener.close()
+
+
+def _reduce(replies):
+    sums = sum(reply[0] for reply in replies)
+    counts = sum(reply[1] for reply in replies)
+    inertia = sum(reply[2] for reply in replies)
+    return sums, counts, inertia
+
+
+def cluster_csv_distributed(file_path, columns, n_clusters, output_path='clustered_dataset.csv',
+                            n_workers=None, max_iter=300, tol=1e-4, chunksize=DEFAULT_CHUNKSIZE,
+                            listen=None, remote_workers=0, seed=42,
+                            connect_timeout=CONNECT_TIMEOUT_SECONDS):
+    """Cluster a CSV with sharded Lloyd iterations and return a summary of the result.
+
+    n_workers local processes are started; remote_workers more are awaited on listen
+    (host, port) for at most connect_timeout seconds before work begins. Remote
+    workers need the secret in KMEANS_AUTHKEY.
+    """
+    if n_clusters < 2:
+        raise ValueError('Number of clusters must be at least 2')
+    if not columns:
+        raise ValueError('Please select at least one column')
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(file_path)
+    validate_columns(file_path, columns)
+    n_workers = os.cpu_count() if n_workers is None else n_workers
+    total_workers = n_workers + remote_workers
+    if total_workers < 1:
+        raise ValueError('At least one worker is required')
+    authkey = os.environ.get('KMEANS_AUTHKEY', '').encode()
+    if remote_workers and not authkey:
+        # Otherwise the coordinator would pick a random key that no remote worker can know
+        raise ValueError('Set KMEANS_AUTHKEY to a shared secret to use remote workers')
+
+    header, shards = plan_shards(file_path, total_workers)
+    names = pd.read_csv(io.BytesIO(header), nrows=0).columns.tolist()
+    coordinator = Coordinator(listen or ('127.0.0.1', 0), authkey or None)
+    try:
+        coordinator.start_local_workers(n_workers)
+        coordinator.accept(total_workers, connect_timeout)
+        # A small file can yield fewer shards than workers; spare workers are released
+        coordinator.release(len(coordinator.connections) - len(shards))
+
+        # Map: parse shards and compute moments; reduce: global mean/scale
+        loaded = coordinator.call([('load', (file_path, names, shard, columns, chunksize))
+                                   for shard in shards])
+        n_rows = sum(n for n, _ in loaded)
+        if n_rows < n_clusters:
+            raise ValueError(f'Need at least {n_clusters} rows to form {n_clusters} clusters')
+        moments = loaded[0][1]
+        for _, shard_moments in loaded[1:]:
+            moments = merge_moments(moments, shard_moments)
+        stats = scaling_from_moments(moments, n_rows)
+        coordinator.broadcast('scale', stats)
+
+        # Seed with k-means++ on a sample drawn from every shard in proportion to its size
+        sample_rows = max(SEED_SAMPLE_ROWS, 20 * n_clusters)
+        sample = np.vstack(coordinator.call([
+            ('sample', (int(np.ceil(sample_rows * n / n_rows)), seed + i))
+            for i, (n, _) in enumerate(loaded)
+        ]))
+        rng = np.random.default_rng(seed)
+        centers = kmeans_plusplus(sample, n_clusters, rng, np.einsum('ij,ij->i', sample, sample))
+
+        # Same convergence threshold as scikit-learn: relative to the mean variance of the
+        # scaled data (1 per column, 0 for constant columns)
+        tol = tol * float(np.mean(moments[2] / n_rows / stats['scale'] ** 2))
+        n_iter = 0
+        for n_iter in range(1, max_iter + 1):
+            sums, counts, _ = _reduce(coordinator.broadcast('step', centers))
+            new_centers = centers.copy()
+            filled = counts > 0
+            new_centers[filled] = sums[filled] / counts[filled, None]
+            # Empty clusters are reseeded with random sample points
+            empty = np.flatnonzero(~filled)
+            if len(empty):
+                new_centers[empty] = sample[rng.choice(len(sample), size=len(empty), replace=False)]
+            shift = float(np.sum((new_centers - centers) ** 2))
+            centers = new_centers
+            if shift <= tol:
+                break
+
+        # Final assignment: every worker writes a part file, concatenated in shard order
+        part_paths = [f'{output_path}.part{i}' for i in range(len(shards))]
+        written = coordinator.call([('write', (centers, path, i == 0))
+                                    for i, path in enumerate(part_paths)])
+        profile = written[0][0]
+        for shard_profile, _ in written[1:]:
+            profile.merge(shard_profile)
+        inertia = sum(reply[1] for reply in written)
+    finally:
+        coordinator.close()
+
+    with open(output_path, 'wb') as out:
+        for path in part_paths:
+            with open(path, 'rb') as part:
+                shutil.copyfileobj(part, out)
+            os.remove(path)
+
+    return {
+        'n_rows': n_rows,
+        'output_path': output_path,
+        'cluster_stats': {int(c): int(n) for c, n in enumerate(profile.sizes)},
+        'profile': profile,
+        'inertia': float(inertia),
+        'n_iter': n_iter,
+        'n_workers': len(shards),
+        'scaling': {'mean': stats['mean'].tolist(), 'scale': stats['scale'].tolist()},
+        'cluster_centers': centers,
+    }
@@ -0,0 +1,139 @@
+"""
+Streaming export of clustered datasets.
+
+Exports are generated on demand from the stored frame plus the label array,
+one chunk at a time, so nothing is written to disk on the clustering path
+and a download never needs the whole serialized file in memory.
+
+Pages of rows for browsing are cut the same way: select_rows() projects the
+requested columns and slices the matching rows without copying the rest of
+the frame, and a page is encoded as JSON records, as JSON columns (one list
+per column, much faster for wide pages) or as an .npz archive.
+"""
+
+import zipfile
+import zlib
+
+import numpy as np
+import pandas as pd
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'csv.gz': ('application/gzip', 'csv.gz'),
+    'npz': ('application/octet-stream', 'npz'),
+}
+CHUNK_ROWS = 50_000
+ROW_FORMATS = ('records', 'columns', 'npz')
+
+
+def iter_csv(df, labels, chunk_rows=CHUNK_ROWS):
+    """Yield the dataset with a Cluster column as CSV text, chunk by chunk"""
+    for start in range(0, max(len(df), 1), chunk_rows):
+        chunk = df.iloc[start:start + chunk_rows].copy(deep=False)
+        if labels is not None:
+            chunk['Cluster'] = labels[start:start + chunk_rows]
+        yield chunk.to_csv(index=False, header=start == 0).encode()
+
+
+def iter_gzip(chunks, level=6):
+    """Gzip-compress a stream of byte chunks"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits=31: gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+class _ChunkSink:
+    """Write-only, non-seekable file object that hands written bytes to a generator"""
+
+    def __init__(self):
+        self._parts = []
+        self._offset = 0
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._offset
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._parts)
+        self._parts.clear()
+        return data
+
+
+def _column_array(series):
+    if isinstance(series.dtype, np.dtype) and series.dtype.kind in 'iufbmM':
+        return series.to_numpy()
+    # Text and extension columns are stored as fixed-width unicode so no pickling is needed
+    return series.astype(str).to_numpy(dtype=str)
+
+
+def iter_npz(df, labels):
+    """Yield a NumPy .npz archive with one array per column, one column at a time"""
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, mode='w', compression=zipfile.ZIP_STORED) as archive:
+        arrays = [(str(name), df[name]) for name in df.columns]
+        if labels is not None:
+            arrays.append(('Cluster', pd.Series(labels)))
+        for name, series in arrays:
+            with archive.open(f'{name}.npy', mode='w', force_zip64=True) as member:
+                np.lib.format.write_array(member, _column_array(series), allow_pickle=False)
+            yield sink.drain()
+    yield sink.drain()
+
+
+def iter_export(df, labels, fmt):
+    """Yield the export of df plus labels in one of EXPORT_FORMATS"""
+    if fmt == 'csv':
+        return iter_csv(df, labels)
+    if fmt == 'csv.gz':
+        return iter_gzip(iter_csv(df, labels))
+    if fmt == 'npz':
+        return iter_npz(df, labels)
+    raise ValueError(f"Export format must be one of {', '.join(EXPORT_FORMATS)}")
+
+
+def select_rows(df, labels, offset=0, limit=100, columns=None, clusters=None):
+    """Return (page with a Cluster column if labels is given, row positions, total matching rows).
+
+    columns restricts the page to those columns; clusters keeps only rows in those clusters.
+    """
+    if columns is not None:
+        df = df[columns]
+    if clusters is not None:
+        positions = np.flatnonzero(np.isin(labels, clusters))
+        total = len(positions)
+        positions = positions[offset:offset + limit]
+        page = df.iloc[positions]
+    else:
+        total = len(df)
+        positions = np.arange(min(offset, total), min(offset + limit, total))
+        page = df.iloc[offset:offset + limit]
+    page = page.copy(deep=False)
+    if labels is not None:
+        page['Cluster'] = labels[positions]
+    return page, positions, total
+
+
+def _json_values(series):
+    """Column values as a list of JSON-safe Python objects, with None for missing values"""
+    values = series.to_numpy(dtype=object)
+    values[pd.isna(series).to_numpy()] = None
+    return values.tolist()
+
+
+def page_to_json(page, fmt='records'):
+    """Encode a page as a list of row dicts ('records') or a dict of column lists ('columns')"""
+    data = {str(name): _json_values(page[name]) for name in page.columns}
+    if fmt == 'columns':
+        return data
+    names = list(data)
+    return [dict(zip(names, row)) for row in zip(*data.values())]
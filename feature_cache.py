@@ -0,0 +1,94 @@
+"""
+Content-addressed cache of preprocessed feature matrices.
+
+Entries are keyed by a hash of the dataset content, the selected columns and
+the preprocessing options, and hold the scaled float matrix together with the
+fitted scaler. Re-running clustering on the same data with a different K can
+then skip imputation and scaling entirely.
+"""
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# Preprocessing applied by prepare_features; part of every cache key
+DEFAULT_OPTIONS = {'impute': 'mean', 'scale': 'standard'}
+
+
+def dataset_fingerprint(df):
+    """Hash the content, column names and dtypes of a DataFrame"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(json.dumps([str(c) for c in df.columns]).encode())
+    digest.update(json.dumps(df.dtypes.astype(str).tolist()).encode())
+    row_hashes = pd.util.hash_pandas_object(df, index=False).to_numpy()
+    digest.update(np.ascontiguousarray(row_hashes).tobytes())
+    return digest.hexdigest()
+
+
+def make_key(content_hash, columns, options=None):
+    """Build a cache key from a dataset hash, selected columns and options"""
+    options = dict(DEFAULT_OPTIONS, **(options or {}))
+    return (content_hash, tuple(columns), json.dumps(options, sort_keys=True))
+
+
+class FeatureCache:
+    """Thread-safe LRU cache of (X_scaled, scaler) pairs bounded by total bytes"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Return the cached (X_scaled, scaler) for key, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, X_scaled, scaler):
+        """Store a scaled matrix; entries larger than the whole cache are not kept"""
+        size = X_scaled.nbytes
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[0].nbytes
+            # Cached matrices are shared between callers and must never be modified
+            X_scaled.setflags(write=False)
+            self._entries[key] = (X_scaled, scaler)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self._bytes -= evicted.nbytes
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
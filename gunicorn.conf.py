@@ -0,0 +1,34 @@
+"""
+Gunicorn settings for serving app.py with several worker processes.
+
+    gunicorn -c gunicorn.conf.py app:app
+
+Workers share uploads, clustering results and job state through files under
+uploads/ (see shared_state.py), so any worker can answer any request.
+"""
+
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+# Threads per worker keep job polling and downloads from queueing behind uploads. Each open
+# /jobs/<id>/events stream holds one thread until its job ends; app.py lets at most
+# MAX_EVENT_STREAMS of them stream at once, so keep WEB_THREADS well above that
+threads = int(os.environ.get('WEB_THREADS', 16))
+os.environ.setdefault('MAX_EVENT_STREAMS', str(max(1, threads // 2)))
+# Uploads of large CSVs are parsed inside the request
+timeout = int(os.environ.get('WEB_TIMEOUT', 120))
+
+# Every web worker runs its own clustering process pool; split the cores between them
+# instead of giving each worker half of all cores
+os.environ.setdefault('CLUSTER_WORKERS', str(max(1, multiprocessing.cpu_count() // workers)))
+# Parallel K-Means restarts of one job get that job's share of the cores
+os.environ.setdefault('KMEANS_RESTART_WORKERS', str(max(
+    1, multiprocessing.cpu_count() // (workers * int(os.environ['CLUSTER_WORKERS'])))))
+
+
+def post_worker_init(worker):
+    # scikit-learn and Matplotlib load in the background while the worker starts answering
+    from startup import prewarm
+    prewarm()
@@ -0,0 +1,322 @@
+"""
+Background job manager for long-running clustering work.
+
+Jobs run in a bounded process pool so heavy fits never block the request
+threads. Submissions beyond the pool size wait in a bounded queue; once
+that is full new jobs are rejected so clients can back off and retry.
+
+With a state_dir, every job's status and final result are also written to
+<state_dir>/<job_id>.json, so any server worker process can report on a job
+submitted through another one. Cancelling creates <job_id>.cancel, which
+the owning process checks before it stores the result.
+
+Jobs submitted with progress=True receive a ProgressReporter as their
+progress keyword argument. Calling it records the job's current stage and
+counters in <job_id>.progress and raises JobCancelled once the job has been
+cancelled, so a job that reports between iterations stops there instead of
+running to completion. Reading a job's progress through watch() marks it as
+watched for WATCH_SECONDS; jobs can ask progress.watched() to skip progress
+that is costly to produce when nobody looks at it.
+"""
+
+import contextlib
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, CancelledError
+
+_JOB_ID = re.compile(r'[0-9a-f]{32}')
+# Shortest time between two writes of a job's progress file within one stage
+PROGRESS_INTERVAL = 0.2
+# How long a job counts as watched after its progress was last read
+WATCH_SECONDS = 10
+
+
+class JobQueueFull(Exception):
+    """Raised when the pool and its waiting queue are both saturated"""
+
+
+class JobCancelled(Exception):
+    """Raised inside a running job once it has been cancelled"""
+
+
+class Job:
+    """Bookkeeping for one submitted job"""
+
+    def __init__(self, job_id, kind):
+        self.id = job_id
+        self.kind = kind
+        self.state = 'queued'
+        self.submitted_at = time.time()
+        self.finished_at = None
+        self.result = None
+        self.error = None
+        self.future = None
+
+    def to_dict(self):
+        state = self.state
+        if state == 'queued' and self.future is not None and self.future.running():
+            state = 'running'
+        info = {
+            'job_id': self.id,
+            'kind': self.kind,
+            'status': state,
+            'submitted_at': self.submitted_at,
+            'finished_at': self.finished_at,
+        }
+        if self.error is not None:
+            info['error'] = self.error
+        return info
+
+    def to_record(self):
+        return dict(self.to_dict(), result=self.result)
+
+    @classmethod
+    def from_record(cls, record):
+        job = cls(record['job_id'], record['kind'])
+        job.state = record['status']
+        job.submitted_at = record['submitted_at']
+        job.finished_at = record['finished_at']
+        job.result = record.get('result')
+        job.error = record.get('error')
+        return job
+
+
+def _write_record(path, record, dumps=json.dumps):
+    tmp_path = f'{path}.tmp-{uuid.uuid4().hex[:8]}'
+    with open(tmp_path, 'w') as f:
+        f.write(dumps(record))
+    os.replace(tmp_path, path)
+
+
+def _read_record(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+class ProgressReporter:
+    """Passed to a job as progress; progress(stage, **counters) records where the job is.
+
+    Picklable, so it travels to the pool process with the job's arguments.
+    """
+
+    def __init__(self, path, cancel_path, watch_path=None, interval=PROGRESS_INTERVAL):
+        self.path = path
+        self.cancel_path = cancel_path
+        self.watch_path = watch_path
+        self.interval = interval
+        self._stage = None
+        self._written_at = 0.0
+
+    def raise_if_cancelled(self):
+        if os.path.exists(self.cancel_path):
+            raise JobCancelled()
+
+    def watched(self):
+        """Whether a client read this job's progress within the last WATCH_SECONDS"""
+        if self.watch_path is None:
+            return False
+        try:
+            return time.time() - os.path.getmtime(self.watch_path) < WATCH_SECONDS
+        except FileNotFoundError:
+            return False
+
+    def __call__(self, stage, **counters):
+        self.raise_if_cancelled()
+        now = time.time()
+        # Stage changes are always written; updates within a stage are throttled
+        if stage != self._stage or now - self._written_at >= self.interval:
+            _write_record(self.path, {'stage': stage, **counters, 'updated_at': now})
+            self._stage, self._written_at = stage, now
+
+
+def _run_job(record_path, fn, *args, **kwargs):
+    """Pool-side wrapper that marks the shared record as running before calling fn"""
+    # The pool hands a queued job to a worker early, when its future can no longer be
+    # cancelled; the marker still keeps a job cancelled while queued from starting
+    if os.path.exists(os.path.splitext(record_path)[0] + '.cancel'):
+        raise JobCancelled()
+    record = _read_record(record_path)
+    if record is not None and record['status'] == 'queued':
+        record['status'] = 'running'
+        _write_record(record_path, record)
+    return fn(*args, **kwargs)
+
+
+class JobManager:
+    """Submit callables to a process pool and track their state by job ID"""
+
+    def __init__(self, max_workers, max_queued, retention=3600, state_dir=None, dumps=json.dumps):
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self.retention = retention
+        self.state_dir = state_dir
+        # Serializes job results (which must be JSON-compatible) into the shared records
+        self.dumps = dumps
+        self._executor = None
+        self._jobs = {}
+        self._lock = threading.Lock()
+        if state_dir is not None:
+            os.makedirs(state_dir, exist_ok=True)
+
+    def _record_path(self, job_id, suffix='.json'):
+        # IDs come from clients, so never let one escape the state directory
+        if self.state_dir is None or not _JOB_ID.fullmatch(job_id):
+            return None
+        return os.path.join(self.state_dir, job_id + suffix)
+
+    def _save(self, job):
+        path = self._record_path(job.id)
+        if path is not None:
+            _write_record(path, job.to_record(), self.dumps)
+
+    def _get_executor(self):
+        # Created on first use so importing the app does not fork workers
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._executor
+
+    def active_count(self):
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if job.finished_at is None)
+
+    def submit(self, kind, fn, *args, on_success=None, on_done=None, progress=False):
+        """Queue fn(*args) in the pool and return the new job ID.
+
+        on_success(result) runs in the parent process when the job finishes,
+        and its return value becomes the job's stored result. on_done() runs
+        after it however the job ended (done, failed or cancelled), e.g. to
+        release what the job used. With progress (and a state_dir), fn is
+        also called with a ProgressReporter as progress.
+        """
+        with self._lock:
+            self._prune()
+            active = sum(1 for job in self._jobs.values() if job.finished_at is None)
+            if active >= self.max_workers + self.max_queued:
+                raise JobQueueFull(f'{active} jobs already running or queued')
+
+            job = Job(uuid.uuid4().hex, kind)
+            self._jobs[job.id] = job
+            path = self._record_path(job.id)
+            if path is None:
+                job.future = self._get_executor().submit(fn, *args)
+            else:
+                self._save(job)
+                kwargs = {}
+                if progress:
+                    kwargs['progress'] = ProgressReporter(self._record_path(job.id, '.progress'),
+                                                          self._record_path(job.id, '.cancel'),
+                                                          self._record_path(job.id, '.watch'))
+                job.future = self._get_executor().submit(_run_job, path, fn, *args, **kwargs)
+
+        job.future.add_done_callback(lambda future: self._finish(job, future, on_success, on_done))
+        return job.id
+
+    def _cancel_requested(self, job_id):
+        path = self._record_path(job_id, '.cancel')
+        return path is not None and os.path.exists(path)
+
+    def _finish(self, job, future, on_success, on_done=None):
+        try:
+            result = future.result()
+            if self._cancel_requested(job.id):
+                job.state = 'cancelled'
+            if job.state != 'cancelled':
+                job.result = on_success(result) if on_success else result
+                job.state = 'done'
+        except (CancelledError, JobCancelled):
+            job.state = 'cancelled'
+        except Exception as e:
+            job.error = str(e)
+            job.state = 'failed'
+        finally:
+            if on_done is not None:
+                try:
+                    on_done()
+                except Exception as e:
+                    job.error = job.error or f'Could not clean up after the job: {e}'
+        job.finished_at = time.time()
+        try:
+            self._save(job)
+        except Exception as e:
+            # A result that cannot be shared is still served by this worker
+            job.error = f'Could not share job result: {e}'
+
+    def _prune(self):
+        cutoff = time.time() - self.retention
+        for job_id in [j.id for j in self._jobs.values()
+                       if j.finished_at is not None and j.finished_at < cutoff]:
+            del self._jobs[job_id]
+        if self.state_dir is not None:
+            for name in os.listdir(self.state_dir):
+                path = os.path.join(self.state_dir, name)
+                with contextlib.suppress(FileNotFoundError):
+                    if (name.endswith(('.json', '.cancel', '.progress', '.watch'))
+                            and os.path.getmtime(path) < cutoff):
+                        os.remove(path)
+
+    def get(self, job_id):
+        """Return a job submitted by this process or, with a state_dir, by any other"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None:
+            # Cancelled through another process
+            if job.finished_at is None and job.state != 'cancelled' and self._cancel_requested(job_id):
+                if not job.future.cancel():
+                    job.state = 'cancelled'
+            return job
+        path = self._record_path(job_id)
+        record = _read_record(path) if path is not None else None
+        if record is None:
+            return None
+        job = Job.from_record(record)
+        if job.finished_at is None and self._cancel_requested(job_id):
+            job.state = 'cancelled'
+        return job
+
+    def progress(self, job_id):
+        """Latest progress a job reported ({'stage', counters..., 'updated_at'}), or None"""
+        path = self._record_path(job_id, '.progress')
+        return _read_record(path) if path is not None else None
+
+    def watch(self, job_id):
+        """Latest progress of a job, like progress(), and mark the job as watched"""
+        path = self._record_path(job_id, '.watch')
+        if path is not None:
+            with open(path, 'a'):
+                os.utime(path)
+        return self.progress(job_id)
+
+    def cancel(self, job_id):
+        """Cancel a job. Queued jobs never start; running jobs stop at their next progress report.
+
+        The result of a running job that does not report progress is discarded.
+        """
+        job = self.get(job_id)
+        if job is None:
+            return False
+        if job.finished_at is not None:
+            return job.state == 'cancelled'
+        marker = self._record_path(job_id, '.cancel')
+        if marker is not None:
+            open(marker, 'a').close()
+        # Only the process that submitted the job holds its future
+        if job.future is not None and not job.future.cancel():
+            job.state = 'cancelled'
+        return True
+
+    def stats(self):
+        with self._lock:
+            states = [job.to_dict()['status'] for job in self._jobs.values()]
+        return {
+            'max_workers': self.max_workers,
+            'max_queued': self.max_queued,
+            **{state: states.count(state)
+               for state in ('queued', 'running', 'done', 'failed', 'cancelled')},
+        }
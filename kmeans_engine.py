@@ -0,0 +1,419 @@
+"""
+Pluggable K-Means engines.
+
+Every engine exposes fit(X, n_clusters, random_state, n_init, init, callback) and
+returns a fitted model with the scikit-learn attributes used elsewhere in
+this project (cluster_centers_, labels_, inertia_, n_iter_ and predict()).
+With init (an array of starting centers) the engine runs once from those
+centers instead of seeding n_init times with k-means++. With callback, the
+engine calls callback(restart, n_init, iteration, inertia) after every
+iteration (restart counts from 1); an exception raised by the callback
+stops the fit, which is how running jobs are cancelled. Engines whose
+costly_callback is true pay for the callback on every iteration (an extra
+pass over the rows), so callers only pass one when someone is watching.
+
+  sklearn  scikit-learn's KMeans (the default)
+  numpy    a pure NumPy implementation of Hamerly's algorithm. Per-point
+           upper/lower distance bounds skip most distance computations once
+           clusters settle, the remaining ones are computed as BLAS matrix
+           products in row tiles of bounded size, and the whole fit can run
+           in float32 to halve memory traffic. It only beats scikit-learn
+           for many clusters in few dimensions (`benchmark.py --suite engines`).
+
+Nearest-centroid assignment (in the numpy engine and when scoring rows with a
+saved model) is either brute force or a KD-tree query over the centers. The
+tree wins when there are many centers in few dimensions; 'auto' picks it from
+the crossover points measured with `benchmark.py --suite assignment`.
+"""
+
+import contextlib
+import io
+import os
+import re
+import sys
+import threading
+
+import numpy as np
+
+ENGINES = {}
+
+# Upper bound on the size of one tile of the distance matrix
+TILE_BYTES = 16 * 1024 * 1024
+
+ASSIGNMENT_METHODS = ('auto', 'brute', 'kdtree')
+DEFAULT_ASSIGNMENT = os.environ.get('KMEANS_ASSIGNMENT', 'auto')
+# (max features, min clusters) from which a KD-tree over the centers beats brute force
+KDTREE_CROSSOVER = ((4, 256), (8, 2048))
+
+
+def register_engine(cls):
+    ENGINES[cls.name] = cls
+    return cls
+
+
+def get_engine(name, **options):
+    """Return an engine instance by name; options (max_iter, tol) go to its constructor"""
+    try:
+        cls = ENGINES[name]
+    except KeyError:
+        raise ValueError(f"Unknown engine '{name}'. Choose one of: {', '.join(sorted(ENGINES))}")
+    return cls(**options)
+
+
+def resolve_dtype(dtype):
+    """Map 'float32'/'float64' (or None) to a NumPy float dtype"""
+    dtype = np.dtype(dtype or np.float64)
+    if dtype not in (np.float32, np.float64):
+        raise ValueError('dtype must be float32 or float64')
+    return dtype
+
+
+class _ThreadStdout(io.TextIOBase):
+    """Stands in for sys.stdout and sends writes from capturing threads to their own target.
+
+    Other threads keep writing to the original stream, unlike with
+    contextlib.redirect_stdout, which swaps sys.stdout for the whole process.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        target = getattr(self.local, 'target', None)
+        return (self.stream if target is None else target).write(text)
+
+    def flush(self):
+        target = getattr(self.local, 'target', None)
+        (self.stream if target is None else target).flush()
+
+
+_stdout_lock = threading.Lock()
+_capturing = 0
+
+
+@contextlib.contextmanager
+def _capture_stdout(target):
+    """Send what this thread prints to target while the block runs"""
+    global _capturing
+    with _stdout_lock:
+        if not isinstance(sys.stdout, _ThreadStdout):
+            sys.stdout = _ThreadStdout(sys.stdout)
+        stdout = sys.stdout
+        _capturing += 1
+    previous = getattr(stdout.local, 'target', None)
+    stdout.local.target = target
+    try:
+        yield
+    finally:
+        stdout.local.target = previous
+        with _stdout_lock:
+            _capturing -= 1
+            # Put the original stream back once no thread captures, unless someone replaced it since
+            if _capturing == 0 and sys.stdout is stdout:
+                sys.stdout = stdout.stream
+
+
+class _VerboseProgress(io.TextIOBase):
+    """Turns scikit-learn's verbose K-Means output into progress callbacks.
+
+    Verbose output is the only per-iteration hook KMeans offers; it is printed
+    from Python between iterations, so an exception raised by the callback
+    propagates out of fit().
+    """
+
+    _ITERATION = re.compile(r'Iteration (\d+), inertia ([^ ]+?)\.?$')
+
+    def __init__(self, callback, n_init):
+        self.callback = callback
+        self.n_init = n_init
+        self.restart = 0
+        self._pending = ''
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        lines = (self._pending + text).split('\n')
+        self._pending = lines.pop()
+        for line in lines:
+            if line.startswith('Initialization complete'):
+                self.restart += 1
+                continue
+            match = self._ITERATION.match(line)
+            if match:
+                self.callback(max(self.restart, 1), self.n_init, int(match[1]) + 1, float(match[2]))
+        return len(text)
+
+
+@register_engine
+class SklearnEngine:
+    name = 'sklearn'
+    # Iterations are only reported in verbose mode, which computes the inertia every iteration
+    costly_callback = True
+
+    def __init__(self, max_iter=300, tol=1e-4):
+        self.max_iter = max_iter
+        self.tol = tol
+
+    def fit(self, X, n_clusters, random_state=42, n_init=10, init=None, callback=None):
+        from sklearn.cluster import KMeans
+        if init is not None:
+            init, n_init = np.asarray(init, dtype=X.dtype), 1
+        kmeans = KMeans(n_clusters=n_clusters, init='k-means++' if init is None else init,
+                        n_init=n_init, max_iter=self.max_iter, tol=self.tol,
+                        random_state=random_state, verbose=int(callback is not None))
+        if callback is None:
+            return kmeans.fit(X)
+        # Verbose mode also computes the inertia of every iteration, so only with a callback
+        with _capture_stdout(_VerboseProgress(callback, n_init)):
+            return kmeans.fit(X)
+
+
+def choose_assignment(n_clusters, n_features, method='auto'):
+    """Resolve an assignment method, picking brute force or a KD-tree for 'auto'"""
+    if method not in ASSIGNMENT_METHODS:
+        raise ValueError(f"Assignment must be one of {', '.join(ASSIGNMENT_METHODS)}")
+    if method != 'auto':
+        return method
+    for max_features, min_clusters in KDTREE_CROSSOVER:
+        if n_features <= max_features and n_clusters >= min_clusters:
+            return 'kdtree'
+    return 'brute'
+
+
+def _tile_rows(n_clusters, itemsize):
+    return max(1, TILE_BYTES // (max(n_clusters, 1) * itemsize))
+
+
+def squared_distances(X, centers, x_sq=None, c_sq=None):
+    """Squared Euclidean distances between rows of X and centers via one matrix product"""
+    if x_sq is None:
+        x_sq = np.einsum('ij,ij->i', X, X)
+    if c_sq is None:
+        c_sq = np.einsum('ij,ij->i', centers, centers)
+    dist = X @ centers.T
+    dist *= -2
+    dist += x_sq[:, None]
+    dist += c_sq[None, :]
+    np.maximum(dist, 0, out=dist)
+    return dist
+
+
+def _nearest_two_kdtree(X, centers, rows):
+    from scipy.spatial import cKDTree
+
+    tree = cKDTree(centers)
+    labels = np.empty(len(rows), dtype=np.int32)
+    first = np.empty(len(rows), dtype=X.dtype)
+    second = np.empty(len(rows), dtype=X.dtype)
+    step = _tile_rows(2, 8 * X.shape[1])
+    for start in range(0, len(rows), step):
+        distances, indices = tree.query(X[rows[start:start + step]], k=2)
+        labels[start:start + step] = indices[:, 0]
+        first[start:start + step] = distances[:, 0]
+        second[start:start + step] = distances[:, 1]
+    return labels, first, second
+
+
+def nearest_two(X, centers, x_sq, rows=None, method='auto'):
+    """Return (nearest index, nearest distance, second-nearest distance) for rows of X.
+
+    The work is done in tiles so the temporary distance matrix never exceeds
+    TILE_BYTES, whatever the number of rows.
+    """
+    rows = np.arange(len(X)) if rows is None else rows
+    if len(centers) >= 2 and choose_assignment(len(centers), X.shape[1], method) == 'kdtree':
+        return _nearest_two_kdtree(X, centers, rows)
+    labels = np.empty(len(rows), dtype=np.int32)
+    first = np.empty(len(rows), dtype=X.dtype)
+    second = np.empty(len(rows), dtype=X.dtype)
+    c_sq = np.einsum('ij,ij->i', centers, centers)
+    step = _tile_rows(len(centers), X.itemsize)
+    for start in range(0, len(rows), step):
+        idx = rows[start:start + step]
+        tile = np.arange(len(idx))
+        # ||x||^2 is the same for every center of a row, so it is only added to the
+        # two distances kept rather than to the whole tile
+        partial = X[idx] @ centers.T
+        partial *= -2
+        partial += c_sq
+        best = np.argmin(partial, axis=1)
+        labels[start:start + step] = best
+        first[start:start + step] = partial[tile, best]
+        partial[tile, best] = np.inf
+        second[start:start + step] = partial.min(axis=1)
+    first += x_sq[rows]
+    second += x_sq[rows]
+    return labels, np.sqrt(np.maximum(first, 0)), np.sqrt(np.maximum(second, 0))
+
+
+def cluster_sums(X, labels, n_clusters):
+    """Per-cluster column sums in float64, one bincount per feature"""
+    sums = np.empty((n_clusters, X.shape[1]))
+    for j in range(X.shape[1]):
+        sums[:, j] = np.bincount(labels, weights=X[:, j], minlength=n_clusters)
+    return sums
+
+
+def kmeans_plusplus(X, n_clusters, rng, x_sq):
+    """k-means++ seeding with a few greedy local trials per center"""
+    n_samples = len(X)
+    n_trials = 2 + int(np.log(n_clusters))
+    centers = np.empty((n_clusters, X.shape[1]), dtype=X.dtype)
+    centers[0] = X[rng.integers(n_samples)]
+    closest = squared_distances(X, centers[:1], x_sq).ravel()
+    for c in range(1, n_clusters):
+        potential = closest.sum()
+        if potential <= 0:
+            candidates = rng.integers(n_samples, size=n_trials)
+        else:
+            cumulative = np.cumsum(closest, dtype=np.float64)
+            candidates = np.searchsorted(cumulative, rng.random(n_trials) * cumulative[-1])
+            candidates = np.minimum(candidates, n_samples - 1)
+        candidate_dist = np.minimum(closest[:, None],
+                                    squared_distances(X, X[candidates], x_sq))
+        best = int(np.argmin(candidate_dist.sum(axis=0, dtype=np.float64)))
+        centers[c] = X[candidates[best]]
+        closest = candidate_dist[:, best]
+    return centers
+
+
+class NumpyKMeansModel:
+    """Fitted result of the NumPy engine, mirroring scikit-learn's KMeans attributes"""
+
+    def __init__(self, cluster_centers, labels, inertia, n_iter, max_iter, assignment='auto'):
+        self.cluster_centers_ = cluster_centers
+        self.labels_ = labels
+        self.inertia_ = inertia
+        self.n_iter_ = n_iter
+        self.max_iter = max_iter
+        self.assignment = assignment
+        self.n_clusters = len(cluster_centers)
+
+    def predict(self, X):
+        X = np.asarray(X, dtype=self.cluster_centers_.dtype)
+        x_sq = np.einsum('ij,ij->i', X, X)
+        return nearest_two(X, self.cluster_centers_, x_sq, method=self.assignment)[0]
+
+    def fit_predict(self, X):
+        return self.labels_
+
+
+def _restart_callback(callback, restart, n_init):
+    """Bind the restart number of an engine callback for one single run"""
+    if callback is None:
+        return None
+    return lambda n_iter, inertia: callback(restart, n_init, n_iter, inertia)
+
+
+@register_engine
+class NumpyEngine:
+    name = 'numpy'
+    # The inertia comes from the running cluster sums, without another pass
+    costly_callback = False
+
+    def __init__(self, max_iter=300, tol=1e-4, assignment=None):
+        self.max_iter = max_iter
+        self.tol = tol
+        self.assignment = assignment or DEFAULT_ASSIGNMENT
+
+    def fit(self, X, n_clusters, random_state=42, n_init=10, init=None, callback=None):
+        # float32 input stays float32 end to end; anything else is computed in float64
+        X = np.asarray(X)
+        X = np.ascontiguousarray(X, dtype=X.dtype if X.dtype == np.float32 else np.float64)
+        if len(X) < n_clusters:
+            raise ValueError(f'n_samples={len(X)} should be >= n_clusters={n_clusters}')
+        self.method = choose_assignment(n_clusters, X.shape[1], self.assignment)
+        x_sq = np.einsum('ij,ij->i', X, X)
+        # Same convergence threshold as scikit-learn: relative to the data's mean variance
+        tol = self.tol * float(np.mean(np.var(X, axis=0, dtype=np.float64)))
+
+        if init is not None:
+            centers = np.array(init, dtype=X.dtype)
+            return self._fit_single(X, x_sq, n_clusters, np.random.default_rng(random_state), tol,
+                                    centers, callback=_restart_callback(callback, 1, 1))
+        seeds = np.random.RandomState(random_state).randint(np.iinfo(np.int32).max, size=n_init)
+        best = None
+        for restart, seed in enumerate(seeds, 1):
+            model = self._fit_single(X, x_sq, n_clusters, np.random.default_rng(seed), tol,
+                                     callback=_restart_callback(callback, restart, n_init))
+            if best is None or model.inertia_ < best.inertia_:
+                best = model
+        return best
+
+    def _fit_single(self, X, x_sq, n_clusters, rng, tol, centers=None, callback=None):
+        """One Lloyd/Hamerly run; callback(n_iter, inertia) follows every iteration"""
+        n_samples = len(X)
+        if centers is None:
+            centers = kmeans_plusplus(X, n_clusters, rng, x_sq)
+        labels, upper, lower = nearest_two(X, centers, x_sq, method=self.method)
+
+        # Sums are accumulated in float64 even in float32 mode to avoid drift
+        sums = cluster_sums(X, labels, n_clusters)
+        counts = np.bincount(labels, minlength=n_clusters)
+        x_sq_total = float(np.sum(x_sq, dtype=np.float64)) if callback is not None else None
+
+        n_iter = 0
+        for n_iter in range(1, self.max_iter + 1):
+            # Move centers to the mean of their points; empty clusters take the worst-fit point
+            new_centers = centers.copy()
+            filled = counts > 0
+            new_centers[filled] = (sums[filled] / counts[filled, None]).astype(X.dtype)
+            empty = np.flatnonzero(~filled)
+            if len(empty):
+                new_centers[empty] = X[np.argsort(upper)[::-1][:len(empty)]]
+
+            shift = np.sqrt(((new_centers - centers) ** 2).sum(axis=1))
+            centers = new_centers
+            if callback is not None:
+                # Inertia of the current labels around their means, from the running sums:
+                # sum |x|^2 - sum_k |S_k|^2 / n_k, without another pass over the data
+                callback(n_iter, float(x_sq_total - np.sum(sums[filled] ** 2 / counts[filled, None])))
+            if float((shift.astype(np.float64) ** 2).sum()) <= tol:
+                break
+
+            # Hamerly bound updates: the assigned center moved by shift[label], any other by
+            # at most the largest shift among the remaining centers
+            upper += shift[labels]
+            order = np.argsort(shift)
+            largest, runner_up = shift[order[-1]], shift[order[-2]]
+            lower -= np.where(labels == order[-1], runner_up, largest)
+
+            # Points whose upper bound is below max(half the gap to the nearest other
+            # center, lower bound) cannot change cluster and are skipped entirely
+            # The second-nearest center of a center is its nearest other center
+            c_sq = np.einsum('ij,ij->i', centers, centers)
+            half_gap = 0.5 * nearest_two(centers, centers, c_sq, method=self.method)[2]
+            bound = np.maximum(half_gap[labels], lower)
+            candidates = np.flatnonzero(upper > bound)
+            if len(candidates) == 0:
+                continue
+
+            # Tighten the upper bound exactly before paying for a full distance row
+            diff = X[candidates] - centers[labels[candidates]]
+            upper[candidates] = np.sqrt(np.einsum('ij,ij->i', diff, diff))
+            candidates = candidates[upper[candidates] > bound[candidates]]
+            if len(candidates) == 0:
+                continue
+
+            new_labels, new_upper, new_lower = nearest_two(X, centers, x_sq, candidates, self.method)
+            upper[candidates] = new_upper
+            lower[candidates] = new_lower
+            moved = new_labels != labels[candidates]
+            if moved.any():
+                rows = candidates[moved]
+                old, new = labels[rows], new_labels[moved]
+                sums -= cluster_sums(X[rows], old, n_clusters)
+                sums += cluster_sums(X[rows], new, n_clusters)
+                counts -= np.bincount(old, minlength=n_clusters)
+                counts += np.bincount(new, minlength=n_clusters)
+                labels[rows] = new
+
+        # Final assignment and exact inertia against the final centers
+        labels, nearest, _ = nearest_two(X, centers, x_sq, method=self.method)
+        inertia = float(np.sum(nearest.astype(np.float64) ** 2))
+        return NumpyKMeansModel(centers, labels, inertia, n_iter, self.max_iter, self.method)
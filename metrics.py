@@ -0,0 +1,231 @@
+"""
+Lightweight in-process metrics with Prometheus text exposition.
+
+Pipeline stages are wrapped in timed(stage), which records the wall time
+and the change in resident memory of the process into histograms, and adds
+the time to the breakdown of the request (or job) being handled on this
+thread, if one is being collected. Worker processes collect their own
+breakdown and send it back with the job result, where record_breakdown()
+folds it into the web process's histograms.
+"""
+
+import contextlib
+import math
+import os
+import threading
+import time
+
+# Latency buckets from 1ms to 5 minutes
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30,
+                   60, 120, 300)
+BYTES_BUCKETS = tuple(2 ** p for p in range(10, 35, 2))  # 1KB .. 16GB
+ROWS_BUCKETS = tuple(10 ** p for p in range(1, 9))
+ITERATION_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 300, 500)
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def current_rss():
+    """Resident set size of this process in bytes, or None where /proc is unavailable"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    parts = []
+    for name, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{name}="{value}"')
+    return '{' + ','.join(parts) + '}'
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.total += 1
+        self.sum += value
+
+
+class MetricsRegistry:
+    """Thread-safe collection of labelled counters, gauges and histograms"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def _series(self, name, kind, help_text, labels):
+        metric = self._metrics.setdefault(name, {'kind': kind, 'help': help_text, 'series': {}})
+        return metric['series'], tuple(sorted(labels.items()))
+
+    def inc(self, name, help_text, value=1, **labels):
+        with self._lock:
+            series, key = self._series(name, 'counter', help_text, labels)
+            series[key] = series.get(key, 0) + value
+
+    def set(self, name, help_text, value, **labels):
+        with self._lock:
+            series, key = self._series(name, 'gauge', help_text, labels)
+            series[key] = value
+
+    def observe(self, name, help_text, value, buckets=SECONDS_BUCKETS, **labels):
+        with self._lock:
+            series, key = self._series(name, 'histogram', help_text, labels)
+            if key not in series:
+                series[key] = Histogram(buckets)
+            series[key].observe(value)
+
+    def register_callback(self, callback):
+        """Call callback(registry) before every render, to refresh gauges read from elsewhere"""
+        self._callbacks.append(callback)
+
+    def render(self):
+        """Return all metrics in the Prometheus text exposition format"""
+        for callback in self._callbacks:
+            callback(self)
+        lines = []
+        with self._lock:
+            for name in sorted(self._metrics):
+                metric = self._metrics[name]
+                lines.append(f"# HELP {name} {metric['help']}")
+                lines.append(f"# TYPE {name} {metric['kind']}")
+                for key, value in sorted(metric['series'].items()):
+                    if metric['kind'] != 'histogram':
+                        lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(value.buckets + (math.inf,), value.counts + [0]):
+                        cumulative += count
+                        le = key + (('le', _format_value(bound)),)
+                        lines.append(f"{name}_bucket{_format_labels(le)} "
+                                     f"{value.total if bound == math.inf else cumulative}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {_format_value(value.sum)}")
+                    lines.append(f"{name}_count{_format_labels(key)} {value.total}")
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+_local = threading.local()
+
+
+class Breakdown:
+    """Per-request (or per-job) record of the time and memory growth of each stage"""
+
+    def __init__(self):
+        self.seconds = {}
+        self.rss_delta = {}
+
+    def add(self, stage, seconds, rss_delta=None):
+        self.seconds[stage] = self.seconds.get(stage, 0.0) + seconds
+        if rss_delta is not None:
+            self.rss_delta[stage] = self.rss_delta.get(stage, 0) + rss_delta
+
+    def to_dict(self):
+        return {'seconds': dict(self.seconds), 'rss_delta_bytes': dict(self.rss_delta)}
+
+    def server_timing(self):
+        """Format the stage times as a Server-Timing header value"""
+        return ', '.join(f'{stage.replace(".", "_")};dur={seconds * 1000:.1f}'
+                         for stage, seconds in self.seconds.items())
+
+
+def start_breakdown():
+    """Start collecting stage timings on this thread and return the breakdown"""
+    _local.breakdown = Breakdown()
+    return _local.breakdown
+
+
+def stop_breakdown():
+    breakdown = getattr(_local, 'breakdown', None)
+    _local.breakdown = None
+    return breakdown
+
+
+@contextlib.contextmanager
+def collect_breakdown():
+    """Collect the stages run inside the block, restoring any outer breakdown afterwards"""
+    outer = getattr(_local, 'breakdown', None)
+    breakdown = start_breakdown()
+    try:
+        yield breakdown
+    finally:
+        _local.breakdown = outer
+
+
+def record_stage(stage, seconds, rss_delta=None):
+    """Record one run of a stage in the histograms and the current breakdown"""
+    registry.observe('kmeans_stage_seconds', 'Wall time of each pipeline stage', seconds,
+                     stage=stage)
+    if rss_delta is not None:
+        # Memory handed back to the OS during a stage is not interesting here; growth is
+        registry.observe('kmeans_stage_rss_growth_bytes', 'Growth of process RSS during each stage',
+                         max(rss_delta, 0), buckets=BYTES_BUCKETS, stage=stage)
+    breakdown = getattr(_local, 'breakdown', None)
+    if breakdown is not None:
+        breakdown.add(stage, seconds, rss_delta)
+
+
+@contextlib.contextmanager
+def timed(stage):
+    """Time a block as one run of stage"""
+    rss_before = current_rss()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        rss_after = current_rss() if rss_before is not None else None
+        record_stage(stage, seconds, rss_after - rss_before if rss_after is not None else None)
+
+
+def timed_iter(stage, iterable):
+    """Time the full consumption of an iterable (e.g. a streamed response) as one stage"""
+    rss_before = current_rss()
+    start = time.perf_counter()
+    try:
+        yield from iterable
+    finally:
+        rss_after = current_rss() if rss_before is not None else None
+        record_stage(stage, time.perf_counter() - start,
+                     rss_after - rss_before if rss_after is not None else None)
+
+
+def record_breakdown(timings):
+    """Fold a breakdown produced in another process (Breakdown.to_dict()) into the histograms"""
+    rss_delta = timings.get('rss_delta_bytes', {})
+    for stage, seconds in timings.get('seconds', {}).items():
+        record_stage(stage, seconds, rss_delta.get(stage))
+
+
+def record_fit(engine, n_iter, converged):
+    registry.observe('kmeans_fit_iterations', 'Lloyd iterations of the best K-Means run', n_iter,
+                     buckets=ITERATION_BUCKETS, engine=engine)
+    registry.inc('kmeans_fits_total', 'K-Means fits by engine and convergence', engine=engine,
+                 converged=str(bool(converged)).lower())
+
+
+def record_dataset(n_rows, n_bytes):
+    registry.observe('kmeans_dataset_rows', 'Rows of uploaded datasets', n_rows,
+                     buckets=ROWS_BUCKETS)
+    registry.observe('kmeans_dataset_bytes', 'In-memory size of uploaded datasets', n_bytes,
+                     buckets=BYTES_BUCKETS)
@@ -0,0 +1,200 @@
+"""
+Registry of fitted clustering models.
+
+A model is everything needed to score new rows without refitting: the
+feature columns, the standardization parameters and the cluster centers.
+Each save creates a new immutable version under <root>/<name>/v<N>, holding
+a JSON manifest and one .npy file per array. Arrays are opened as memory
+maps, so loading a model is a few small reads and any process can load it.
+
+Scoring fills missing values with the training means (exactly what
+preprocessing did at fit time), standardizes, and assigns every row to its
+nearest center with tiled matrix products.
+"""
+
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from kmeans_engine import nearest_two, DEFAULT_ASSIGNMENT
+
+MANIFEST = 'manifest.json'
+ARRAYS = ('mean', 'scale', 'centers')
+# Shared by the web app and the CLI, so models trained in one can be scored in the other
+DEFAULT_MODEL_DIR = os.environ.get('MODEL_DIR', os.path.join('uploads', 'models'))
+
+_MODEL_NAME = re.compile(r'[A-Za-z0-9][A-Za-z0-9_.-]{0,63}')
+_VERSION_DIR = re.compile(r'v(\d+)')
+
+
+def check_model_name(name):
+    """Raise ValueError unless name is a valid model name"""
+    # Names come from clients, so never let one escape the registry directory
+    if not isinstance(name, str) or not _MODEL_NAME.fullmatch(name):
+        raise ValueError(f"Invalid model name '{name}': use up to 64 letters, digits, '.', '_' or '-'")
+    return name
+
+
+class ClusterModel:
+    """A loaded model version that assigns rows to clusters"""
+
+    def __init__(self, name, version, manifest, mean, scale, centers):
+        self.name = name
+        self.version = version
+        self.manifest = manifest
+        self.mean = mean
+        self.scale = scale
+        self.centers = centers
+
+    @property
+    def columns(self):
+        return self.manifest['columns']
+
+    @property
+    def n_clusters(self):
+        return len(self.centers)
+
+    def info(self):
+        return {'name': self.name, 'version': self.version, **self.manifest}
+
+    def transform(self, X):
+        """Standardize X like the training data, filling missing values with training means"""
+        if isinstance(X, pd.DataFrame):
+            missing = [col for col in self.columns if col not in X.columns]
+            if missing:
+                raise ValueError(f"Missing columns: {', '.join(map(str, missing))}")
+            X = X[self.columns].to_numpy(dtype=self.centers.dtype)
+        else:
+            X = np.array(X, dtype=self.centers.dtype, ndmin=2)
+            if X.shape[1] != len(self.columns):
+                raise ValueError(f'Expected {len(self.columns)} features, got {X.shape[1]}')
+        X = (X - self.mean) / self.scale
+        # A missing value standardizes to 0, the same as imputing the training mean
+        X[np.isnan(X)] = 0
+        return np.ascontiguousarray(X, dtype=self.centers.dtype)
+
+    def predict(self, X, method=None):
+        """Return (labels, distance to the assigned center) for every row of X.
+
+        method is 'brute', 'kdtree' or 'auto' (chosen from the number of clusters and features).
+        """
+        X_scaled = self.transform(X)
+        x_sq = np.einsum('ij,ij->i', X_scaled, X_scaled)
+        labels, distances, _ = nearest_two(X_scaled, np.asarray(self.centers), x_sq,
+                                           method=method or DEFAULT_ASSIGNMENT)
+        return labels, distances
+
+
+class ModelRegistry:
+    """Versioned on-disk store of ClusterModels"""
+
+    def __init__(self, root, keep_versions=None):
+        self.root = root
+        self.keep_versions = keep_versions
+        self._loaded = {}
+        self._lock = threading.Lock()
+
+    def _model_dir(self, name):
+        return os.path.join(self.root, check_model_name(name))
+
+    def versions(self, name):
+        """Return the saved versions of a model, oldest first"""
+        directory = self._model_dir(name)
+        if not os.path.isdir(directory):
+            return []
+        found = (_VERSION_DIR.fullmatch(entry) for entry in os.listdir(directory))
+        return sorted(int(match.group(1)) for match in found if match)
+
+    def list(self):
+        """Return {name: [versions]} for every saved model"""
+        if not os.path.isdir(self.root):
+            return {}
+        names = (name for name in os.listdir(self.root) if _MODEL_NAME.fullmatch(name))
+        return {name: versions for name in sorted(names) if (versions := self.versions(name))}
+
+    def save(self, name, columns, mean, scale, centers, metadata=None):
+        """Save a new version of a model and return its version number"""
+        directory = self._model_dir(name)
+        os.makedirs(directory, exist_ok=True)
+        centers = np.asarray(centers)
+        tmp_dir = os.path.join(directory, f'.tmp-{uuid.uuid4().hex[:8]}')
+        os.makedirs(tmp_dir)
+        try:
+            # Scaling parameters stay float64 even for a float32 model: rounding them would
+            # shift every standardized value, and they are only a few numbers per column
+            for array_name, values, dtype in zip(ARRAYS, (mean, scale, centers),
+                                                 (np.float64, np.float64, centers.dtype)):
+                np.save(os.path.join(tmp_dir, f'{array_name}.npy'), np.asarray(values, dtype=dtype))
+            manifest = {
+                'columns': list(columns),
+                'n_clusters': len(centers),
+                'dtype': centers.dtype.name,
+                'created_at': time.time(),
+                **(metadata or {}),
+            }
+            with open(os.path.join(tmp_dir, MANIFEST), 'w') as f:
+                json.dump(manifest, f)
+
+            # Claim the next version number; a concurrent save that got there first just
+            # pushes this one to the following number
+            while True:
+                existing = self.versions(name)
+                version = existing[-1] + 1 if existing else 1
+                try:
+                    os.rename(tmp_dir, os.path.join(directory, f'v{version}'))
+                    break
+                except OSError:
+                    if not os.path.isdir(os.path.join(directory, f'v{version}')):
+                        raise
+        except Exception:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+        if self.keep_versions:
+            for old in self.versions(name)[:-self.keep_versions]:
+                self.delete(name, old)
+        return version
+
+    def save_fitted(self, name, columns, scaler, kmeans, metadata=None):
+        """Save a fitted StandardScaler and K-Means model"""
+        return self.save(name, columns, scaler.mean_, scaler.scale_, kmeans.cluster_centers_,
+                         metadata)
+
+    def load(self, name, version=None):
+        """Load a model version (the latest by default); raises KeyError if it does not exist"""
+        if version is None:
+            versions = self.versions(name)
+            if not versions:
+                raise KeyError(name)
+            version = versions[-1]
+        version = int(version)
+        key = (name, version)
+        with self._lock:
+            if key in self._loaded:
+                return self._loaded[key]
+
+        path = os.path.join(self._model_dir(name), f'v{version}')
+        if not os.path.isfile(os.path.join(path, MANIFEST)):
+            raise KeyError(f'{name} v{version}')
+        with open(os.path.join(path, MANIFEST)) as f:
+            manifest = json.load(f)
+        arrays = [np.load(os.path.join(path, f'{array_name}.npy'), mmap_mode='r')
+                  for array_name in ARRAYS]
+        model = ClusterModel(name, version, manifest, *arrays)
+
+        # Versions never change once written, so a loaded model can be reused as is
+        with self._lock:
+            self._loaded[key] = model
+        return model
+
+    def delete(self, name, version):
+        with self._lock:
+            self._loaded.pop((name, int(version)), None)
+        shutil.rmtree(os.path.join(self._model_dir(name), f'v{int(version)}'), ignore_errors=True)
@@ -0,0 +1,170 @@
+"""
+Cluster scatter plots that stay fast for large point counts.
+
+Below PLOT_POINT_LIMIT points every point is drawn. Above it the plot is
+either a stratified per-cluster subsample or a density raster, in which
+each pixel takes the color of its most common cluster and its opacity from
+the number of points that fall into it. The raster costs one pass over the
+data regardless of how many points there are.
+
+Matplotlib takes a large share of the web app's start-up time, so it is
+imported on first use rather than with this module.
+"""
+
+import io
+import base64
+import threading
+from collections import OrderedDict
+import numpy as np
+
+PLOT_POINT_LIMIT = 50_000
+PLOT_MODES = ('auto', 'scatter', 'sample', 'density')
+RASTER_SIZE = 400
+
+
+def cluster_colors(n_clusters):
+    import matplotlib
+
+    return matplotlib.colormaps['Set1'](np.linspace(0, 1, max(n_clusters, 1)))
+
+
+def stratified_sample(labels, max_points, seed=42):
+    """Return row indices keeping each cluster's share, with every cluster represented"""
+    if len(labels) <= max_points:
+        return np.arange(len(labels))
+    rng = np.random.default_rng(seed)
+    _, counts = np.unique(labels, return_counts=True)
+    quotas = np.maximum(1, np.floor(counts * max_points / len(labels)).astype(int))
+    order = np.argsort(labels, kind='stable')
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    picks = [order[start + rng.choice(count, size=min(quota, count), replace=False)]
+             for start, count, quota in zip(starts, counts, quotas)]
+    return np.sort(np.concatenate(picks))
+
+
+def density_raster(x, y, labels, n_clusters, size=RASTER_SIZE):
+    """Bin points into a size x size RGBA image colored by each pixel's dominant cluster"""
+    x_min, x_max = float(np.min(x)), float(np.max(x))
+    y_min, y_max = float(np.min(y)), float(np.max(y))
+    x_span = (x_max - x_min) or 1.0
+    y_span = (y_max - y_min) or 1.0
+    ix = np.minimum(((x - x_min) / x_span * size).astype(np.int64), size - 1)
+    iy = np.minimum(((y - y_min) / y_span * size).astype(np.int64), size - 1)
+    pixel = iy * size + ix
+
+    # Count (pixel, cluster) pairs, then keep the largest count per pixel
+    pairs, pair_counts = np.unique(pixel * n_clusters + labels, return_counts=True)
+    pair_pixel, pair_label = np.divmod(pairs, n_clusters)
+    order = np.lexsort((pair_counts, pair_pixel))
+    last_of_pixel = np.r_[pair_pixel[order][1:] != pair_pixel[order][:-1], True]
+    dominant = order[last_of_pixel]
+
+    density = np.bincount(pixel, minlength=size * size)
+    image = np.zeros((size * size, 4))
+    image[pair_pixel[dominant]] = cluster_colors(n_clusters)[pair_label[dominant]]
+    occupied = density > 0
+    image[occupied, 3] = 0.25 + 0.75 * np.log1p(density[occupied]) / np.log1p(density.max())
+    return image.reshape(size, size, 4), (x_min, x_min + x_span, y_min, y_min + y_span)
+
+
+def resolve_mode(mode, n_points, point_limit=PLOT_POINT_LIMIT):
+    if mode not in PLOT_MODES:
+        raise ValueError(f"Plot mode must be one of {', '.join(PLOT_MODES)}")
+    if mode == 'auto':
+        return 'scatter' if n_points <= point_limit else 'density'
+    return mode
+
+
+def draw_clusters(ax, x, y, labels, mode='auto', point_limit=PLOT_POINT_LIMIT, s=None,
+                  legend_kwargs=None):
+    """Draw clusters on a Matplotlib Axes and return the mode actually used"""
+    legend_kwargs = legend_kwargs or {}
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    labels = np.asarray(labels)
+    finite = np.isfinite(x) & np.isfinite(y)
+    x, y, labels = x[finite], y[finite], labels[finite]
+
+    mode = resolve_mode(mode, len(labels), point_limit)
+    unique_clusters = np.unique(labels)
+    n_clusters = int(unique_clusters.max()) + 1 if len(unique_clusters) else 1
+    colors = cluster_colors(n_clusters)
+
+    if mode == 'density':
+        from matplotlib.patches import Patch
+
+        image, extent = density_raster(x, y, labels, n_clusters)
+        ax.imshow(image, extent=extent, origin='lower', aspect='auto', interpolation='nearest')
+        ax.legend(handles=[Patch(color=colors[c], label=f'Cluster {c}') for c in unique_clusters],
+                  **legend_kwargs)
+        return mode
+
+    if mode == 'sample':
+        keep = stratified_sample(labels, point_limit)
+        x, y, labels = x[keep], y[keep], labels[keep]
+
+    for cluster in unique_clusters:
+        mask = labels == cluster
+        ax.scatter(x[mask], y[mask], c=[colors[cluster]], label=f'Cluster {cluster}',
+                   alpha=0.7, s=s)
+    ax.legend(**legend_kwargs)
+    return mode
+
+
+def render_cluster_plot(x, y, labels, feature_names, mode='auto', title='K-Means Clustering Results',
+                        dpi=150):
+    """Render a cluster plot to PNG bytes"""
+    # The object-oriented Figure API renders off-screen without touching pyplot's global
+    # state, so rendering here never changes the backend of an interactive caller
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(10, 8))
+    ax = fig.subplots()
+    mode = draw_clusters(ax, x, y, labels, mode)
+    ax.set_xlabel(feature_names[0])
+    ax.set_ylabel(feature_names[1])
+    ax.set_title(title if mode == 'scatter' else f'{title} ({mode})')
+    ax.grid(True, alpha=0.3)
+
+    img_buffer = io.BytesIO()
+    fig.savefig(img_buffer, format='png', dpi=dpi, bbox_inches='tight')
+    return img_buffer.getvalue()
+
+
+def create_cluster_plot(X, cluster_labels, feature_names):
+    """Create a scatter plot of the first two features colored by cluster"""
+    try:
+        png = render_cluster_plot(X.iloc[:, 0], X.iloc[:, 1], cluster_labels, feature_names)
+        return base64.b64encode(png).decode()
+    except Exception as e:
+        print(f"Error creating plot: {e}")
+        return None
+
+
+class PlotCache:
+    """LRU cache of rendered PNGs keyed by (result ID, axes, mode), bounded by total bytes"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            png = self._entries.get(key)
+            if png is not None:
+                self._entries.move_to_end(key)
+            return png
+
+    def put(self, key, png):
+        if len(png) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= len(self._entries.pop(key))
+            self._entries[key] = png
+            self._bytes += len(png)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
@@ -0,0 +1,203 @@
+"""
+Optional dimensionality reduction between scaling and K-Means.
+
+Every K-Means iteration computes distances whose cost grows with the number
+of columns, so wide datasets fit faster in fewer dimensions. After
+StandardScaler the features can be reduced with
+
+  pca         PCA, keeping n_components components or the fewest that
+              explain a share of the variance (DEFAULT_VARIANCE when neither
+              is given); randomized PCA above COVARIANCE_MAX_FEATURES columns;
+  projection  a sparse random projection, for very wide data: one sparse
+              matrix product that preserves pairwise distances within a
+              small relative error (Johnson-Lindenstrauss), with no fit.
+
+The first two principal components double as the coordinates of the
+cluster plot (after a projection, those of a 2-component PCA of the
+projected rows), so plots of wide datasets show the directions that spread
+the data most instead of the first two selected columns.
+
+Saved models keep their centers in the full standardized space, so new rows
+are scored without the reducer. For PCA the centers are mapped back onto the
+kept subspace, which assigns every row exactly as in the reduced space; for
+a projection they are the cluster means of the standardized rows.
+"""
+
+import time
+
+import numpy as np
+
+from kmeans_engine import cluster_sums
+
+REDUCTION_METHODS = ('none', 'pca', 'projection')
+DEFAULT_VARIANCE = 0.9
+# Components fitted when only a variance threshold is given
+MAX_COMPONENTS = 256
+# Widest data whose principal components come from the covariance matrix
+COVARIANCE_MAX_FEATURES = 1000
+# Distortion allowed when a projection's dimension is derived from the row count
+PROJECTION_EPS = 0.5
+METHOD_NAMES = {'pca': 'PCA', 'projection': 'Random projection'}
+
+
+def parse_reduction(method='none', n_components=None, variance=None):
+    """Validate reduction options; returns None or the keyword arguments of reduce_features"""
+    if method in (None, 'none'):
+        return None
+    if method not in REDUCTION_METHODS:
+        raise ValueError(f"Reduction must be one of {', '.join(REDUCTION_METHODS)}")
+    if n_components is not None:
+        n_components = int(n_components)
+        if n_components < 1:
+            raise ValueError('Number of components must be at least 1')
+    if variance is not None:
+        variance = float(variance)
+        if not 0 < variance <= 1:
+            raise ValueError('Variance threshold must be in (0, 1]')
+        if method == 'projection':
+            raise ValueError('A variance threshold only applies to PCA')
+        if n_components is not None:
+            raise ValueError('Give either a number of components or a variance threshold, not both')
+    return {'method': method, 'n_components': n_components, 'variance': variance}
+
+
+class ReducedFeatures:
+    """Reduced rows, their 2-D plot coordinates and a JSON-friendly report"""
+
+    def __init__(self, X, plot_xy, axes, report, components=None, mean=None):
+        self.X = X
+        self.plot_xy = plot_xy
+        self.axes = axes
+        self.report = report
+        # PCA only: rows of the kept components and the mean they are centered on
+        self.components = components
+        self.mean = mean
+
+    def full_centers(self, X_scaled, labels, centers):
+        """Centers of the fitted clusters in the full standardized space"""
+        if self.components is not None:
+            return (centers @ self.components + self.mean).astype(X_scaled.dtype)
+        n_clusters = len(centers)
+        counts = np.bincount(labels, minlength=n_clusters)
+        means = cluster_sums(X_scaled, labels, n_clusters) / np.maximum(counts, 1)[:, None]
+        return means.astype(X_scaled.dtype)
+
+
+def full_space_inertia(X_scaled, labels, n_clusters):
+    """Inertia of labels around their cluster means in the full standardized space.
+
+    Uses sum |x|^2 - sum_k |S_k|^2 / n_k, so it costs one pass over the rows.
+    """
+    counts = np.bincount(labels, minlength=n_clusters)
+    sums = cluster_sums(X_scaled, labels, n_clusters)
+    filled = counts > 0
+    total = float(np.einsum('ij,ij->', X_scaled, X_scaled, dtype=np.float64))
+    return total - float(np.sum(sums[filled] ** 2 / counts[filled, None]))
+
+
+def principal_components(X, n_components, random_state=42):
+    """(components, explained variance ratios, mean) of the n_components leading components.
+
+    Up to COVARIANCE_MAX_FEATURES columns the exact components come from the
+    eigendecomposition of the d x d covariance matrix, which costs one matrix
+    product over the rows; wider data uses randomized PCA.
+    """
+    n_samples, n_features = X.shape
+    if n_features <= COVARIANCE_MAX_FEATURES:
+        mean = X.mean(axis=0, dtype=np.float64)
+        covariance = (X.T @ X).astype(np.float64) / n_samples - np.outer(mean, mean)
+        variances, vectors = np.linalg.eigh(covariance)
+        order = np.argsort(variances)[::-1][:n_components]
+        variances = np.maximum(variances, 0)
+        return vectors[:, order].T, variances[order] / variances.sum(), mean
+    from sklearn.decomposition import PCA
+
+    pca = PCA(n_components=n_components, svd_solver='randomized', random_state=random_state)
+    pca.fit(X)
+    return pca.components_, pca.explained_variance_ratio_, pca.mean_
+
+
+def _project(X, components, mean):
+    # (X - mean) @ components.T without an n x d temporary
+    Z = X @ components.T.astype(X.dtype)
+    Z -= (mean @ components.T).astype(X.dtype)
+    return Z
+
+
+def _fit_pca(X_scaled, n_components, variance, random_state):
+    n_samples, n_features = X_scaled.shape
+    if n_components is None:
+        variance = variance or DEFAULT_VARIANCE
+        n_fit = min(n_samples, n_features, MAX_COMPONENTS)
+    else:
+        n_fit = min(n_samples, n_features, n_components)
+    # At least two components, so the plot coordinates come from the same fit
+    components, ratio, mean = principal_components(X_scaled, min(max(n_fit, 2), n_features),
+                                                   random_state)
+    if variance is not None:
+        # Fewest components reaching the threshold (all fitted ones if it is out of reach)
+        n_keep = min(int(np.searchsorted(np.cumsum(ratio), variance - 1e-12)) + 1, n_fit)
+    else:
+        n_keep = n_fit
+    Z = _project(X_scaled, components[:max(n_keep, 2)], mean)
+    axes = [f'PC{i + 1} ({ratio[i]:.1%})' for i in range(min(2, Z.shape[1]))]
+    return ReducedFeatures(np.ascontiguousarray(Z[:, :n_keep]), Z[:, :2], axes,
+                           {'variance_retained': float(ratio[:n_keep].sum())},
+                           components=components[:n_keep], mean=mean)
+
+
+def _fit_projection(X_scaled, n_components, random_state):
+    from sklearn.random_projection import SparseRandomProjection, johnson_lindenstrauss_min_dim
+
+    n_samples, n_features = X_scaled.shape
+    if n_components is None:
+        n_components = int(johnson_lindenstrauss_min_dim(n_samples, eps=PROJECTION_EPS))
+    n_components = min(n_components, n_features)
+    projection = SparseRandomProjection(n_components=n_components, random_state=random_state)
+    Z = np.asarray(projection.fit_transform(X_scaled), dtype=X_scaled.dtype)
+    # Projections preserve squared norms in expectation: a ratio near 1 means little distortion
+    retained = float(np.var(Z, axis=0).sum() / max(np.var(X_scaled, axis=0).sum(), 1e-300))
+    retained = min(retained, 1.0)
+    if n_components < 2:
+        return ReducedFeatures(Z, Z, None, {'variance_retained': retained})
+    components, _, mean = principal_components(Z, 2, random_state)
+    return ReducedFeatures(Z, _project(Z, components, mean), ['PC1', 'PC2'],
+                           {'variance_retained': retained})
+
+
+def reduce_features(X_scaled, method='pca', n_components=None, variance=None, random_state=42):
+    """Reduce a standardized matrix; returns ReducedFeatures.
+
+    The report holds the method, input and output dimensions, the share of
+    the total variance retained and the seconds the reduction took.
+    """
+    start = time.perf_counter()
+    if method == 'pca':
+        reduced = _fit_pca(X_scaled, n_components, variance, random_state)
+    elif method == 'projection':
+        reduced = _fit_projection(X_scaled, n_components, random_state)
+    else:
+        raise ValueError(f"Reduction must be one of {', '.join(REDUCTION_METHODS[1:])}")
+    if reduced.plot_xy.shape[1] < 2:
+        # A single input column has no second axis to plot
+        reduced.plot_xy, reduced.axes = None, None
+    else:
+        reduced.plot_xy = np.asarray(reduced.plot_xy, dtype=np.float32)
+    reduced.report.update({
+        'method': method,
+        'input_dim': int(X_scaled.shape[1]),
+        'output_dim': int(reduced.X.shape[1]),
+        'seconds': time.perf_counter() - start,
+    })
+    return reduced
+
+
+def describe_reduction(report):
+    """One-line summary of a reduction report"""
+    text = (f"{METHOD_NAMES[report['method']]} {report['input_dim']} -> {report['output_dim']} dimensions, "
+            f"{report['variance_retained']:.1%} of the variance retained, "
+            f"reduced in {report['seconds']:.2f}s, fitted in {report['fit_seconds']:.2f}s")
+    if 'time_saved_seconds' in report:
+        text += (f"; {report['time_saved_seconds']:+.2f}s saved vs fitting all columns "
+                 f"({report['full_fit_seconds']:.2f}s), inertia {report['inertia_gap']:+.2%}")
+    return text
@@ -0,0 +1,230 @@
+"""
+Parallel K-Means restarts with early abandonment.
+
+n_init restarts from different k-means++ seeds guard against poor local
+minima, but most of them are visibly losing after a few iterations. The
+scheduler runs all restarts in stages that end at the iteration counts in
+CHECKPOINTS, spread over worker processes that map one shared-memory copy
+of the scaled matrix. After every stage it takes the lowest inertia any
+restart has reached, which bounds the final inertia of the winner since
+Lloyd iterations never increase inertia, and abandons each restart whose
+inertia, extrapolated from its gains over the last iterations (generously,
+see ABANDON_SLACK), cannot get below that bound.
+
+Every stage is a separate engine fit, which repeats the engine's passes
+over the data before its first iteration, so there are few stages: one
+probe of CHECKPOINTS[0] iterations, then the survivors run to convergence.
+
+Decisions are only taken between stages, on inertias that depend on the
+seeds alone, so the result does not depend on the number of workers or on
+their timing: a fixed random_state gives the same model as a run in a
+single process (up to the rounding of multithreaded engines, whose sums
+depend on the thread count). Each stage resumes a restart from its
+centers, which continues the same Lloyd iterations with any engine.
+"""
+
+import contextlib
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from kmeans_engine import NumpyKMeansModel, get_engine, nearest_two
+
+RESTART_METHODS = ('sequential', 'parallel')
+# Iteration counts after which the restarts are compared; the last stage runs up to max_iter
+CHECKPOINTS = (8,)
+# Factor on the extrapolated remaining gain before a restart is written off
+ABANDON_SLACK = 2.0
+# Iterations per gain when extrapolating, which smooths out single noisy iterations
+GAIN_WINDOW = 2
+# Default worker processes; servers set it to each job's share of the cores
+RESTART_WORKERS = int(os.environ.get('KMEANS_RESTART_WORKERS', 0)) or None
+
+# (shared memory, array view) of the scaled matrix inside a worker process
+_shared = None
+
+
+def _attach_shared(name, shape, dtype, n_threads):
+    from multiprocessing import shared_memory
+    from threadpoolctl import threadpool_limits
+
+    global _shared
+    shm = shared_memory.SharedMemory(name=name)
+    _shared = (shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf))
+    # Keep OpenMP/BLAS threads per worker in check so the workers do not oversubscribe cores
+    threadpool_limits(limits=n_threads)
+
+
+def _run_stage(engine, n_clusters, seed, centers, n_iter, record, progress, X=None):
+    """Run one restart for up to n_iter more iterations; returns (centers, inertia, n_iter, trajectory)
+
+    With record, trajectory holds the inertia of every iteration as reported
+    to engine callbacks (otherwise it is empty). progress(iteration, inertia)
+    follows every iteration when given; an exception raised by it stops the stage.
+    """
+    X = _shared[1] if X is None else X
+    trajectory = []
+
+    def callback(restart, n_init, iteration, inertia):
+        if record:
+            trajectory.append(inertia)
+        if progress is not None:
+            progress(iteration, inertia)
+
+    model = get_engine(engine, max_iter=n_iter).fit(
+        X, n_clusters, random_state=seed, n_init=1, init=centers,
+        callback=callback if record or progress is not None else None)
+    return model.cluster_centers_, float(model.inertia_), int(model.n_iter_), trajectory
+
+
+class _StageProgress:
+    """Picklable progress(iteration, inertia) that reports a restart to a fit callback"""
+
+    def __init__(self, callback, restart, n_init, offset):
+        self.callback = callback
+        self.restart = restart
+        self.n_init = n_init
+        self.offset = offset
+
+    def __call__(self, iteration, inertia):
+        self.callback(self.restart, self.n_init, self.offset + iteration, inertia)
+
+
+def _run_stage_task(task):
+    return _run_stage(*task)
+
+
+@contextlib.contextmanager
+def _stage_runner(X, n_jobs, n_threads):
+    """Yield run(tasks), which returns the results of _run_stage in order.
+
+    Tasks run in this process, or on n_jobs processes with n_threads OpenMP/BLAS threads each.
+    """
+    if n_jobs <= 1:
+        yield lambda tasks: [_run_stage(*task, X=X) for task in tasks]
+        return
+
+    from multiprocessing import shared_memory
+
+    X = np.ascontiguousarray(X)
+    shm = shared_memory.SharedMemory(create=True, size=max(X.nbytes, 1))
+    try:
+        np.ndarray(X.shape, dtype=X.dtype, buffer=shm.buf)[...] = X
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=_attach_shared,
+                                 initargs=(shm.name, X.shape, X.dtype.str, n_threads)) as executor:
+            try:
+                yield lambda tasks: list(executor.map(_run_stage_task, tasks))
+            except BaseException:
+                # Cancelled (or failed): stages that have not started never will
+                executor.shutdown(wait=True, cancel_futures=True)
+                raise
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def may_still_win(trajectory, best, slack=ABANDON_SLACK, window=GAIN_WINDOW):
+    """Whether a restart whose inertia went through trajectory (one value per iteration) may end below best.
+
+    Gains shrink as a restart converges; the remaining gain is extrapolated
+    as a geometric series from the gains over the last two windows of
+    iterations and multiplied by slack.
+    """
+    current = trajectory[-1]
+    if current <= best or len(trajectory) <= 2 * window:
+        return True
+    gain = trajectory[-1 - window] - current
+    previous_gain = trajectory[-1 - 2 * window] - trajectory[-1 - window]
+    if gain <= 0:
+        return False
+    if gain >= previous_gain:
+        return True
+    ratio = gain / previous_gain
+    return current - slack * gain * ratio / (1 - ratio) < best
+
+
+class _Restart:
+    def __init__(self, number, seed):
+        self.number = number
+        self.seed = seed
+        self.centers = None
+        self.inertia = None
+        self.n_iter = 0
+        self.trajectory = []
+        self.state = 'running'
+
+
+def default_workers(n_jobs=None):
+    """Cores for the restarts: n_jobs, else KMEANS_RESTART_WORKERS, else all of them"""
+    return max(1, n_jobs or RESTART_WORKERS or os.cpu_count() or 1)
+
+
+def fit_restarts(X, n_clusters, engine='sklearn', random_state=42, n_init=10, max_iter=300,
+                 n_jobs=None, callback=None):
+    """Fit n_init k-means++ restarts with early abandonment; returns (model, report).
+
+    Up to n_jobs worker processes (one per restart at most, see
+    default_workers) share the matrix; callers that already run several fits
+    at once pass their share of the cores.
+    callback(restart, n_init, iteration, inertia) follows every iteration of
+    every restart and stops the fit by raising; with more than one worker it
+    runs in the workers, so it has to be picklable. The model holds the
+    winning restart's centers, inertia and iteration count, with labels from
+    one assignment pass against those centers.
+    """
+    start = time.perf_counter()
+    seeds = np.random.RandomState(random_state).randint(np.iinfo(np.int32).max, size=n_init)
+    restarts = [_Restart(number, int(seed)) for number, seed in enumerate(seeds, 1)]
+    # Cores beyond one per restart go to the engine's threads
+    cores = default_workers(n_jobs)
+    n_jobs = min(cores, n_init)
+    checkpoints = [c for c in CHECKPOINTS if c < max_iter] + [max_iter]
+
+    with _stage_runner(X, n_jobs, max(1, cores // n_jobs)) as run:
+        for stage, checkpoint in enumerate(checkpoints):
+            live = [r for r in restarts if r.state == 'running']
+            if not live:
+                break
+            # Inertia trajectories only matter while there are decisions left to take
+            record = stage < len(checkpoints) - 1
+            results = run([(engine, n_clusters, r.seed, r.centers, checkpoint - r.n_iter, record,
+                            None if callback is None else _StageProgress(callback, r.number, n_init, r.n_iter))
+                           for r in live])
+            for restart, (centers, inertia, n_iter, trajectory) in zip(live, results):
+                if n_iter < checkpoint - restart.n_iter:
+                    restart.state = 'converged'
+                restart.centers, restart.inertia = centers, inertia
+                restart.n_iter += n_iter
+                restart.trajectory += trajectory
+            if not record:
+                break
+            best = min(r.trajectory[-1] for r in restarts if r.state != 'abandoned')
+            for restart in live:
+                if restart.state == 'running' and not may_still_win(restart.trajectory, best):
+                    restart.state = 'abandoned'
+
+    winner = min((r for r in restarts if r.state != 'abandoned'),
+                 key=lambda r: (r.inertia, r.number))
+    # Labels of the winner's own centers, without moving them another iteration
+    centers = np.asarray(winner.centers, dtype=X.dtype)
+    labels = nearest_two(X, centers, np.einsum('ij,ij->i', X, X))[0]
+    model = NumpyKMeansModel(centers, labels, winner.inertia, winner.n_iter, max_iter)
+    return model, {
+        'method': 'parallel',
+        'workers': n_jobs,
+        'n_init': n_init,
+        'abandoned': sum(r.state == 'abandoned' for r in restarts),
+        # Iterations run over all restarts, against n_init * iterations without abandonment
+        'iterations': sum(r.n_iter for r in restarts),
+        'best_restart': winner.number,
+        'seconds': time.perf_counter() - start,
+    }
+
+
+def describe_restarts(report):
+    """One-line summary of a parallel restarts report"""
+    return (f"{report['n_init']} restarts on {report['workers']} worker(s), "
+            f"{report['abandoned']} abandoned early, {report['iterations']} iterations in total, "
+            f"best from restart {report['best_restart']} in {report['seconds']:.2f}s")
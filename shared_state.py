@@ -0,0 +1,207 @@
+"""
+State shared by all web server worker processes through the filesystem.
+
+Under gunicorn every worker is a separate process, so anything a later
+request may need (datasets, clustering results, job outcomes, the session
+signing key) lives in files under the uploads directory rather than in a
+worker's memory. Arrays are .npy files opened as memory maps: every worker
+that attaches a dataset or a result maps the same page-cache pages instead
+of holding its own copy. Point the directory at tmpfs (e.g. /dev/shm) to
+keep everything in RAM.
+
+Shared files are reference counted across processes. Each holder of a
+dataset (the session that uploaded it, every job running on it and every
+clustering result built on it) owns one empty file in the dataset's refs/ directory, and the dataset
+is deleted when the last holder releases it. Workers that still have the
+files mapped keep reading them safely until they let go, since unlinking a
+mapped file does not invalidate the mapping.
+"""
+
+import contextlib
+import json
+import os
+import re
+import shutil
+import time
+import uuid
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: only the single-process development server is supported
+    fcntl = None
+
+REFS_DIR = 'refs'
+LOCK_FILE = '.lock'
+
+_RESULT_ID = re.compile(r'[0-9a-f]{32}')
+_HOLDER = re.compile(r'[A-Za-z0-9_.-]{1,100}')
+
+
+def load_secret_key(path):
+    """Return the session signing key stored at path, creating it on first use.
+
+    Every worker must sign sessions with the same key, or a session cookie set
+    by one worker is rejected by the others.
+    """
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        # Another worker may still be writing it
+        for _ in range(50):
+            with open(path, 'rb') as f:
+                key = f.read()
+            if key:
+                return key
+            time.sleep(0.01)
+        raise RuntimeError(f'Secret key file {path} is empty')
+    key = os.urandom(24)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(key)
+    return key
+
+
+class RefCounter:
+    """Cross-process reference counts on a directory, one empty file per holder"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.refs_dir = os.path.join(directory, REFS_DIR)
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """Hold the lock; raises FileNotFoundError if the directory no longer exists"""
+        if not os.path.isdir(self.refs_dir):
+            # mkdir, not makedirs: a deleted directory must not be brought back
+            with contextlib.suppress(FileExistsError):
+                os.mkdir(self.refs_dir)
+        with open(os.path.join(self.refs_dir, LOCK_FILE), 'a') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def holders(self):
+        try:
+            return sorted(name for name in os.listdir(self.refs_dir) if name != LOCK_FILE)
+        except FileNotFoundError:
+            return []
+
+    def acquire(self, holder):
+        """Add a holder; raises KeyError if the directory has already been deleted"""
+        if not _HOLDER.fullmatch(holder):
+            raise ValueError(f'Invalid holder name {holder!r}')
+        try:
+            with self._locked():
+                # The last holder may have deleted the directory while this one waited
+                if not os.path.isdir(self.refs_dir):
+                    raise KeyError(self.directory)
+                open(os.path.join(self.refs_dir, holder), 'a').close()
+        except FileNotFoundError:
+            raise KeyError(self.directory)
+
+    def release(self, holder, on_last=None):
+        """Drop a holder; when none are left, call on_last() while still holding the lock.
+
+        Returns the number of remaining holders.
+        """
+        try:
+            with self._locked():
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(os.path.join(self.refs_dir, holder))
+                remaining = len(self.holders())
+                if remaining == 0 and on_last is not None:
+                    on_last()
+                return remaining
+        except FileNotFoundError:
+            return 0
+
+
+class ResultStore:
+    """Clustering results (dataset ID, feature columns, labels and, after a
+    dimensionality reduction, the 2-D projection of the rows) shared by all workers.
+
+    Each result holds a reference on its dataset, so the data stays available
+    for plots and downloads after the session moves on to another upload.
+    Only the newest max_per_dataset results of each dataset are kept, so
+    re-clustering one upload never evicts the results of another; max_results
+    bounds the results of all datasets together.
+    """
+
+    def __init__(self, directory, dataset_store, max_per_dataset, max_results):
+        self.directory = directory
+        self.dataset_store = dataset_store
+        self.max_per_dataset = max_per_dataset
+        self.max_results = max_results
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, result_id):
+        # IDs come from clients, so never let one escape the results directory
+        if not isinstance(result_id, str) or not _RESULT_ID.fullmatch(result_id):
+            raise KeyError(result_id)
+        return os.path.join(self.directory, result_id)
+
+    def add(self, dataset_id, columns, labels, projection=None, axes=None):
+        """Persist a result and return its ID; projection is an (n, 2) array named by axes"""
+        result_id = uuid.uuid4().hex
+        self.dataset_store.acquire(dataset_id, f'result-{result_id}')
+        tmp_dir = os.path.join(self.directory, f'.tmp-{result_id}')
+        os.makedirs(tmp_dir)
+        np.save(os.path.join(tmp_dir, 'labels.npy'), np.asarray(labels))
+        if projection is not None:
+            np.save(os.path.join(tmp_dir, 'projection.npy'), np.asarray(projection))
+        with open(os.path.join(tmp_dir, 'result.json'), 'w') as f:
+            json.dump({'dataset_id': dataset_id, 'columns': list(columns), 'axes': axes,
+                       'created_at': time.time()}, f)
+        os.replace(tmp_dir, self._path(result_id))
+        self._evict(dataset_id)
+        return result_id
+
+    def get(self, result_id):
+        """Return {'dataset_id', 'columns', 'labels', 'projection', 'axes'} or None.
+
+        Arrays are memory-mapped; projection and axes are None without a reduction.
+        """
+        try:
+            path = self._path(result_id)
+            with open(os.path.join(path, 'result.json')) as f:
+                result = json.load(f)
+            result['labels'] = np.load(os.path.join(path, 'labels.npy'), mmap_mode='r')
+            result.setdefault('axes', None)
+            result['projection'] = None
+            if result['axes'] is not None:
+                result['projection'] = np.load(os.path.join(path, 'projection.npy'), mmap_mode='r')
+        except (KeyError, FileNotFoundError, ValueError):
+            return None
+        return result
+
+    def remove(self, result_id):
+        result = self.get(result_id)
+        shutil.rmtree(self._path(result_id), ignore_errors=True)
+        if result is not None:
+            self.dataset_store.release(result['dataset_id'], f'result-{result_id}')
+
+    def _oldest_first(self, result_ids):
+        stored = []
+        for result_id in result_ids:
+            with contextlib.suppress(FileNotFoundError):
+                stored.append((os.stat(os.path.join(self.directory, result_id)).st_mtime_ns, result_id))
+        return [result_id for _, result_id in sorted(stored)]
+
+    def _evict(self, dataset_id):
+        # The dataset's holders name its results, so no other result has to be opened
+        own = [holder[len('result-'):] for holder in self.dataset_store.holders(dataset_id)
+               if holder.startswith('result-')]
+        own = self._oldest_first(result_id for result_id in own if _RESULT_ID.fullmatch(result_id))
+        for result_id in own[:max(len(own) - self.max_per_dataset, 0)]:
+            self.remove(result_id)
+        stored = self._oldest_first(name for name in os.listdir(self.directory) if _RESULT_ID.fullmatch(name))
+        for result_id in stored[:max(len(stored) - self.max_results, 0)]:
+            self.remove(result_id)
+
+    def __len__(self):
+        return sum(1 for name in os.listdir(self.directory) if _RESULT_ID.fullmatch(name))
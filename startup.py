@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+Cold-start helpers for the web app.
+
+app.py only imports what serving the page and uploads needs (Flask, NumPy,
+pandas); scikit-learn, SciPy and Matplotlib are imported by the functions
+that use them. prewarm() then loads them in a background thread once the
+server is accepting requests, so the first clustering request usually
+finds them ready without the first page load having waited for them.
+
+Run this module to measure start-up in fresh interpreters:
+
+    python startup.py                   # import-time breakdown and time to first response
+    python startup.py --server gunicorn
+    python startup.py --max-seconds 1   # exit with status 1 when the first response is slower
+
+The import breakdown comes from `python -X importtime -c "import app"`,
+summed per top-level package. Time to first response runs from launching
+the server until GET / answers. Both run in a scratch working directory so
+the measurement never touches this checkout's uploads/.
+"""
+
+import argparse
+import importlib
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import metrics
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+PREWARM_MODULES = (
+    'sklearn.preprocessing',
+    'sklearn.cluster',
+    'sklearn.metrics',
+    'threadpoolctl',
+    'scipy.spatial',
+    'matplotlib.figure',
+    'matplotlib.patches',
+)
+
+_prewarm_thread = None
+_prewarm_lock = threading.Lock()
+
+
+def _import_all(modules):
+    start = time.perf_counter()
+    for name in modules:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            # Optional extras (e.g. SciPy) are simply loaded later, or never
+            pass
+    metrics.registry.set('kmeans_prewarm_seconds', 'Time spent importing heavy modules after start-up',
+                         time.perf_counter() - start)
+
+
+def prewarm(modules=PREWARM_MODULES):
+    """Import modules in a background thread; returns the thread, or None when disabled.
+
+    Set PREWARM_IMPORTS=0 to load everything on first use instead.
+    """
+    global _prewarm_thread
+    if os.environ.get('PREWARM_IMPORTS', '1').lower() in ('0', 'false', 'no'):
+        return None
+    with _prewarm_lock:
+        if _prewarm_thread is None:
+            _prewarm_thread = threading.Thread(target=_import_all, args=(modules,),
+                                               name='prewarm-imports', daemon=True)
+            # A child forked while the thread holds a module's import lock would find that
+            # lock held forever, so the job pool's workers are only forked once it is done
+            if hasattr(os, 'register_at_fork'):
+                os.register_at_fork(before=wait_for_prewarm)
+            _prewarm_thread.start()
+    return _prewarm_thread
+
+
+def wait_for_prewarm(timeout=None):
+    """Block until a running prewarm() has finished"""
+    thread = _prewarm_thread
+    if thread is not None and thread is not threading.current_thread():
+        thread.join(timeout)
+
+
+def _scratch_env(workdir):
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [APP_DIR, env.get('PYTHONPATH')]))
+    env.setdefault('MPLBACKEND', 'Agg')
+    return env
+
+
+def import_breakdown(module='app', workdir=None):
+    """Import module in a fresh interpreter; returns (total seconds, {top-level package: seconds})"""
+    workdir = workdir or APP_DIR
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            cwd=workdir, env=_scratch_env(workdir), capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f'Importing {module} failed:\n{result.stderr[-2000:]}')
+    packages = {}
+    for line in result.stderr.splitlines():
+        # "import time: self [us] | cumulative | imported package", nested names indented
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, _, name = line[len('import time:'):].split('|')
+        package = name.strip().split('.')[0]
+        packages[package] = packages.get(package, 0.0) + int(self_us) / 1e6
+    ranked = dict(sorted(packages.items(), key=lambda item: item[1], reverse=True))
+    return sum(ranked.values()), ranked
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def server_command(server='flask'):
+    if server == 'gunicorn':
+        return [sys.executable, '-m', 'gunicorn', '-c', os.path.join(APP_DIR, 'gunicorn.conf.py'),
+                'app:app']
+    return [sys.executable, os.path.join(APP_DIR, 'app.py')]
+
+
+def time_to_first_response(server='flask', path='/', workdir=None, timeout=120):
+    """Seconds from launching the server until GET path answers successfully"""
+    workdir = workdir or APP_DIR
+    port = _free_port()
+    env = _scratch_env(workdir)
+    env['PORT'] = str(port)
+    url = f'http://127.0.0.1:{port}{path}'
+    start = time.perf_counter()
+    process = subprocess.Popen(server_command(server), cwd=workdir, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while True:
+            try:
+                with urllib.request.urlopen(url, timeout=timeout) as response:
+                    response.read()
+                return time.perf_counter() - start
+            except urllib.error.HTTPError as e:
+                raise RuntimeError(f'GET {path} answered {e.code}')
+            except (urllib.error.URLError, ConnectionError):
+                if process.poll() is not None:
+                    raise RuntimeError(f'Server exited with status {process.returncode}')
+                if time.perf_counter() - start > timeout:
+                    raise TimeoutError(f'No response from {url} after {timeout}s')
+                time.sleep(0.01)
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Measure the web app\'s start-up time.')
+    parser.add_argument('--server', choices=['flask', 'gunicorn'], default='flask',
+                        help='server to launch for the time to first response (default: flask)')
+    parser.add_argument('--runs', type=int, default=3, help='server launches to time (default: 3)')
+    parser.add_argument('--top', type=int, default=10, help='packages to list in the import breakdown')
+    parser.add_argument('--max-seconds', type=float, default=None,
+                        help='fail when the median time to first response exceeds this')
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    workdir = tempfile.mkdtemp(prefix='kmeans-startup-')
+    try:
+        total, packages = import_breakdown('app', workdir)
+        print(f"📦 Importing app: {total:.3f}s")
+        for package, seconds in list(packages.items())[:args.top]:
+            print(f"   {package:<24} {seconds:.3f}s")
+        timings = [time_to_first_response(args.server, workdir=workdir) for _ in range(args.runs)]
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    median = statistics.median(timings)
+    print(f"⏱️  Time to first response ({args.server}): median {median:.3f}s, "
+          f"min {min(timings):.3f}s over {len(timings)} runs")
+    if args.max_seconds is not None and median > args.max_seconds:
+        print(f"❌ Slower than {args.max_seconds:.3f}s")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,217 @@
+"""
+Out-of-core K-Means clustering for CSV files that do not fit in memory.
+
+The input is read in chunks three times:
+  1. a single pass computes per-column mean/std for imputation and scaling,
+  2. a MiniBatchKMeans model is fitted incrementally with partial_fit,
+  3. labels are predicted chunk-by-chunk and appended to the output CSV.
+Peak memory depends on the chunk size, not on the size of the file.
+
+The input may be gzip- or zstd-compressed (pass compression, as pandas
+understands it). The web app runs the pipeline as a job (run_streaming_job)
+on a file spooled to disk or assembled by a chunked upload.
+"""
+
+import os
+import numpy as np
+import pandas as pd
+
+from metrics import collect_breakdown, timed
+
+DEFAULT_CHUNKSIZE = 100_000
+
+
+def _no_progress(stage, **counters):
+    """Stands in for a job's progress reporter when nobody is listening"""
+
+
+def read_chunks(file_path, chunksize, columns=None, compression=None):
+    """Yield DataFrame chunks of a CSV file, optionally restricted to columns"""
+    with pd.read_csv(file_path, usecols=columns, chunksize=chunksize,
+                     compression=compression) as reader:
+        for chunk in reader:
+            yield chunk if columns is None else chunk[columns]
+
+
+def validate_columns(file_path, columns, compression=None):
+    """Check that the selected columns exist in the CSV header"""
+    header = pd.read_csv(file_path, nrows=0, compression=compression).columns
+    for col in columns:
+        if col not in header:
+            raise ValueError(f'Column "{col}" not found')
+
+
+def chunk_moments(values):
+    """Return (count, mean, m2) of the non-missing values of each column"""
+    n_features = values.shape[1]
+    count = np.sum(~np.isnan(values), axis=0)
+    present = count > 0
+    mean = np.zeros(n_features)
+    mean[present] = np.nanmean(values[:, present], axis=0)
+    m2 = np.nansum((values - mean) ** 2, axis=0)
+    return count, mean, m2
+
+
+def merge_moments(a, b):
+    """Merge two (count, mean, m2) triples with Chan's parallel update"""
+    count_a, mean_a, m2_a = a
+    count_b, mean_b, m2_b = b
+    total = count_a + count_b
+    delta = mean_b - mean_a
+    safe_total = np.where(total > 0, total, 1)
+    mean = mean_a + delta * count_b / safe_total
+    m2 = m2_a + m2_b + delta ** 2 * count_a * count_b / safe_total
+    return total, mean, m2
+
+
+def scaling_from_moments(moments, n_rows):
+    """Turn merged moments into the mean/scale used for imputation and scaling"""
+    if n_rows == 0:
+        raise ValueError('The CSV file contains no rows')
+    _, mean, m2 = moments
+    # Imputed values sit exactly on the mean, so they add rows but no variance
+    std = np.sqrt(m2 / n_rows)
+    scale = np.where(std > 0, std, 1.0)
+    return {'mean': mean, 'scale': scale, 'n_rows': n_rows}
+
+
+def compute_scaling_stats(file_path, columns, chunksize=DEFAULT_CHUNKSIZE, compression=None,
+                          progress=_no_progress):
+    """Compute column means and standard deviations in one pass over the file.
+
+    Partial moments of each chunk are merged with Chan's parallel update, so
+    the result matches StandardScaler fitted on mean-imputed data.
+    """
+    n_features = len(columns)
+    moments = (np.zeros(n_features), np.zeros(n_features), np.zeros(n_features))
+    n_rows = 0
+
+    for chunk in read_chunks(file_path, chunksize, columns, compression):
+        for col in columns:
+            if not pd.api.types.is_numeric_dtype(chunk[col]):
+                raise ValueError(f'Column "{col}" is not numeric')
+        values = chunk.to_numpy(dtype=np.float64)
+        n_rows += len(values)
+        moments = merge_moments(moments, chunk_moments(values))
+        progress('scaling', rows=n_rows)
+
+    return scaling_from_moments(moments, n_rows)
+
+
+def scale_chunk(chunk, stats):
+    """Mean-impute and standardize one chunk of feature columns"""
+    values = chunk.to_numpy(dtype=np.float64, copy=True)
+    missing = np.isnan(values)
+    if missing.any():
+        values[missing] = np.take(stats['mean'], np.nonzero(missing)[1])
+    return (values - stats['mean']) / stats['scale']
+
+
+def fit_streaming_kmeans(file_path, columns, n_clusters, stats,
+                         chunksize=DEFAULT_CHUNKSIZE, n_epochs=1, compression=None,
+                         progress=_no_progress):
+    """Fit MiniBatchKMeans incrementally over the file, one chunk at a time"""
+    from sklearn.cluster import MiniBatchKMeans
+
+    kmeans = MiniBatchKMeans(n_clusters=n_clusters, random_state=42,
+                             batch_size=min(chunksize, 4096), n_init=3)
+    pending = None
+    for epoch in range(n_epochs):
+        rows = 0
+        for chunk in read_chunks(file_path, chunksize, columns, compression):
+            rows += len(chunk)
+            progress('fit', epoch=epoch + 1, rows=rows, total=stats['n_rows'])
+            X_scaled = scale_chunk(chunk, stats)
+            # partial_fit needs at least n_clusters rows to initialise centers
+            if pending is not None:
+                X_scaled = np.vstack([pending, X_scaled])
+                pending = None
+            if len(X_scaled) < n_clusters:
+                pending = X_scaled
+                continue
+            kmeans.partial_fit(X_scaled)
+
+    if not hasattr(kmeans, 'cluster_centers_'):
+        raise ValueError(f'Need at least {n_clusters} rows to form {n_clusters} clusters')
+    if pending is not None:
+        kmeans.partial_fit(pending)
+    return kmeans
+
+
+def write_clustered_csv(file_path, columns, kmeans, stats, output_path,
+                        chunksize=DEFAULT_CHUNKSIZE, compression=None, progress=_no_progress):
+    """Append a Cluster column to every chunk and stream it to output_path.
+
+    Returns (ClusterProfile of the raw feature values, inertia).
+    """
+    # cluster_profile imports merge_moments from this module
+    from cluster_profile import ClusterProfile
+
+    profile = ClusterProfile(columns, kmeans.n_clusters)
+    inertia = 0.0
+    rows = 0
+    header = True
+    with open(output_path, 'w', newline='') as out:
+        for chunk in read_chunks(file_path, chunksize, compression=compression):
+            X_scaled = scale_chunk(chunk[columns], stats)
+            labels = kmeans.predict(X_scaled)
+            inertia -= kmeans.score(X_scaled)
+            profile.update(chunk[columns], labels)
+            chunk['Cluster'] = labels
+            chunk.to_csv(out, index=False, header=header)
+            header = False
+            rows += len(chunk)
+            progress('write', rows=rows, total=stats['n_rows'])
+    return profile, inertia
+
+
+def cluster_csv_streaming(file_path, columns, n_clusters, output_path='clustered_dataset.csv',
+                          chunksize=DEFAULT_CHUNKSIZE, n_epochs=1, compression=None,
+                          progress=None):
+    """Run the full out-of-core pipeline and return a summary of the result.
+
+    progress (a job's ProgressReporter) is told the pass and the rows read so
+    far after every chunk; it stops the job there once the job is cancelled.
+    """
+    report = progress or _no_progress
+    if n_clusters < 2:
+        raise ValueError('Number of clusters must be at least 2')
+    if not columns:
+        raise ValueError('Please select at least one column')
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(file_path)
+
+    validate_columns(file_path, columns, compression)
+    stats = compute_scaling_stats(file_path, columns, chunksize, compression, report)
+    kmeans = fit_streaming_kmeans(file_path, columns, n_clusters, stats,
+                                  chunksize, n_epochs, compression, report)
+    profile, inertia = write_clustered_csv(file_path, columns, kmeans, stats,
+                                           output_path, chunksize, compression, report)
+
+    return {
+        'n_rows': stats['n_rows'],
+        'output_path': output_path,
+        'cluster_stats': {int(c): int(n) for c, n in enumerate(profile.sizes)},
+        'inertia': float(inertia),
+        'scaling': {'mean': stats['mean'].tolist(), 'scale': stats['scale'].tolist()},
+        'kmeans': kmeans,
+        'profile': profile,
+    }
+
+
+def run_streaming_job(file_path, columns, n_clusters, output_path, chunksize=DEFAULT_CHUNKSIZE,
+                      compression=None, progress=None):
+    """Worker entry point: cluster file_path into output_path and return a JSON-friendly summary"""
+    with collect_breakdown() as breakdown:
+        with timed('stream_cluster'):
+            result = cluster_csv_streaming(file_path, columns, n_clusters, output_path,
+                                           chunksize, compression=compression, progress=progress)
+    return {
+        'n_rows': result['n_rows'],
+        'cluster_stats': result['cluster_stats'],
+        'cluster_profile': result['profile'].to_dict(),
+        'inertia': result['inertia'],
+        'model': {'mean': result['scaling']['mean'], 'scale': result['scaling']['scale'],
+                  'centers': result['kmeans'].cluster_centers_.tolist()},
+        'timings': breakdown.to_dict(),
+    }
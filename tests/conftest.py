@@ -0,0 +1,44 @@
+import os
+import sys
+import time
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The modules live at the top of the repository rather than in a package
+sys.path.insert(0, REPO_DIR)
+os.environ.setdefault('MPLBACKEND', 'Agg')
+
+
+@pytest.fixture(scope='session')
+def app_dir(tmp_path_factory):
+    """Working directory of the web app under test, which keeps uploads/ relative to it"""
+    return tmp_path_factory.mktemp('app')
+
+
+@pytest.fixture
+def web_app(app_dir, monkeypatch):
+    """The app module, imported and run in app_dir"""
+    monkeypatch.chdir(app_dir)
+    import app
+    return app
+
+
+@pytest.fixture
+def client(web_app):
+    return web_app.app.test_client()
+
+
+@pytest.fixture
+def run_job(client):
+    """Submit a job to an endpoint and return the response of its finished result"""
+    def run(path, timeout=60, **kwargs):
+        response = client.post(path, **kwargs)
+        assert response.status_code == 202, response.get_json()
+        result_url = response.get_json()['result_url']
+        deadline = time.monotonic() + timeout
+        while (response := client.get(result_url)).status_code == 202:
+            assert time.monotonic() < deadline, f'{path} did not finish in {timeout}s'
+            time.sleep(0.05)
+        return response
+    return run
@@ -0,0 +1,69 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from clustering_tool import cli, expand_inputs, output_stems
+
+
+def _write_blobs(path, seed):
+    rng = np.random.default_rng(seed)
+    points = np.vstack([rng.normal(center, 0.5, size=(50, 2)) for center in ([0, 0], [6, 6], [0, 6])])
+    frame = pd.DataFrame(points, columns=['x', 'y'])
+    frame['name'] = [f'r{i}' for i in range(len(frame))]
+    frame.to_csv(path, index=False)
+    return frame
+
+
+def test_inputs_expand_in_order_without_duplicates(tmp_path):
+    for name in ('b.csv', 'a.csv', 'notes.txt'):
+        (tmp_path / name).write_text('x\n1\n')
+    (tmp_path / 'sub').mkdir()
+    (tmp_path / 'sub' / 'a.csv').write_text('x\n1\n')
+
+    paths = expand_inputs([str(tmp_path), str(tmp_path / '*.csv'), str(tmp_path / 'sub')])
+    assert [os.path.relpath(p, tmp_path) for p in paths] == ['a.csv', 'b.csv', os.path.join('sub', 'a.csv')]
+    # Files with the same name in different directories get distinct outputs
+    assert output_stems(paths) == ['a', 'b', 'a_2']
+    with pytest.raises(ValueError, match='No CSV files'):
+        expand_inputs([str(tmp_path / 'missing*.csv')])
+
+
+def test_batch_clusters_every_file_and_writes_a_summary(tmp_path):
+    inputs = tmp_path / 'in'
+    inputs.mkdir()
+    frames = {name: _write_blobs(inputs / f'{name}.csv', seed) for seed, name in enumerate(['one', 'two'])}
+    output_dir = tmp_path / 'out'
+
+    cli(['batch', str(inputs), '-k', '3', '--output-dir', str(output_dir), '--jobs', '1', '--no-plot'])
+
+    with open(output_dir / 'batch_summary.json') as f:
+        summary = json.load(f)
+    assert summary['succeeded'] == 2 and summary['failed'] == 0
+    assert summary['rows'] == 300
+    assert [os.path.basename(r['file']) for r in summary['results']] == ['one.csv', 'two.csv']
+    for name, frame in frames.items():
+        clustered = pd.read_csv(output_dir / f'{name}_clustered.csv')
+        assert clustered['name'].tolist() == frame['name'].tolist()
+        # Each blob of 50 rows ends up in a cluster of its own
+        assert sorted(clustered['Cluster'].value_counts()) == [50, 50, 50]
+    assert not list(output_dir.glob('*.png'))
+
+
+def test_a_failing_file_is_reported_without_stopping_the_rest(tmp_path, capsys):
+    _write_blobs(tmp_path / 'good.csv', 0)
+    pd.DataFrame({'name': ['a', 'b', 'c']}).to_csv(tmp_path / 'text.csv', index=False)
+    output_dir = tmp_path / 'out'
+
+    with pytest.raises(SystemExit) as exit_info:
+        cli(['batch', str(tmp_path), '-k', '3', '--output-dir', str(output_dir), '--jobs', '1', '--no-plot'])
+
+    assert exit_info.value.code == 1
+    assert '1 of 2 files failed' in capsys.readouterr().out
+    with open(output_dir / 'batch_summary.json') as f:
+        summary = json.load(f)
+    assert summary['failures'][0]['file'].endswith('text.csv')
+    assert 'numeric' in summary['failures'][0]['error']
+    assert (output_dir / 'good_clustered.csv').exists()
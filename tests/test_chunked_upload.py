@@ -0,0 +1,138 @@
+import gzip
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from chunked_upload import UploadStore, MIN_PART_SIZE, fcntl
+from dataset_store import DatasetStore
+
+PART_SIZE = MIN_PART_SIZE
+
+
+@pytest.fixture
+def dataset_store(tmp_path):
+    return DatasetStore(memory_budget=64 * 1024 * 1024, storage_dir=str(tmp_path / 'datasets'))
+
+
+def _store(tmp_path, dataset_store, **kwargs):
+    # A new store over the same directory stands in for another worker, or a restarted server
+    return UploadStore(str(tmp_path / 'incoming'), dataset_store, max_bytes=64 * 1024 * 1024,
+                       max_part_size=1024 * 1024, **kwargs)
+
+
+@pytest.fixture
+def frame():
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({'a': rng.normal(size=50000).round(6), 'b': rng.integers(0, 1000, 50000),
+                         'city': rng.choice(['NY', 'LA', 'SF'], 50000)})
+
+
+def _parts(data):
+    return [data[start:start + PART_SIZE] for start in range(0, len(data), PART_SIZE)]
+
+
+def _load(dataset_store):
+    def load(chunks, options, holder):
+        return {'dataset_id': dataset_store.add(pd.concat(chunks, ignore_index=True), holder)}
+    return load
+
+
+@pytest.mark.parametrize('filename, compress', [('data.csv', lambda b: b),
+                                                ('data.csv.gz', gzip.compress)])
+def test_parts_assemble_in_any_order(tmp_path, dataset_store, frame, filename, compress):
+    data = compress(frame.to_csv(index=False).encode())
+    parts = _parts(data)
+    assert len(parts) >= 3
+    store = _store(tmp_path, dataset_store)
+    upload_id = store.create(filename, len(data), part_size=PART_SIZE)
+
+    for index in reversed(range(len(parts))):
+        store.write_part(upload_id, index, parts[index])
+    result = store.complete(upload_id, _load(dataset_store), 'upload', timeout=30)
+
+    stored = dataset_store.get(result['dataset_id']).original
+    assert list(stored.columns) == list(frame.columns)
+    for column in frame.columns:
+        np.testing.assert_array_equal(np.asarray(stored[column]), frame[column].to_numpy())
+    assert store.meta(upload_id) is None
+
+
+def test_interrupted_upload_resumes_with_the_missing_parts(tmp_path, dataset_store, frame):
+    data = frame.to_csv(index=False).encode()
+    parts = _parts(data)
+    store = _store(tmp_path, dataset_store)
+    upload_id = store.create('data.csv', len(data), part_size=PART_SIZE)
+    for index in range(0, len(parts), 2):
+        store.write_part(upload_id, index, parts[index])
+
+    with pytest.raises(ValueError, match='missing'):
+        store.complete(upload_id, _load(dataset_store), 'upload', timeout=30)
+
+    resumed = _store(tmp_path, dataset_store)
+    status = resumed.status(upload_id)
+    assert status['state'] == 'receiving'
+    assert status['missing_parts'] == list(range(1, len(parts), 2))
+    for index in status['missing_parts']:
+        resumed.write_part(upload_id, index, parts[index])
+    # Sending a part again is harmless
+    resumed.write_part(upload_id, 0, parts[0])
+    assert resumed.status(upload_id)['state'] == 'received'
+
+    result = resumed.complete(upload_id, _load(dataset_store), 'upload', timeout=30)
+    assert len(dataset_store.get(result['dataset_id']).original) == len(frame)
+
+
+def test_background_parser_follows_the_parts(tmp_path, dataset_store, frame):
+    data = frame.to_csv(index=False).encode()
+    parts = _parts(data)
+    store = _store(tmp_path, dataset_store)
+    upload_id = store.create('data.csv', len(data), part_size=PART_SIZE)
+
+    parser = store.start_parsing(upload_id, _load(dataset_store))
+    for index in [1, 0] + list(range(2, len(parts))):
+        store.write_part(upload_id, index, parts[index])
+    result = store.complete(upload_id, _load(dataset_store), 'upload', timeout=30)
+    if parser is not None:
+        parser.join(timeout=30)
+
+    assert len(dataset_store.get(result['dataset_id']).original) == len(frame)
+
+
+@pytest.mark.skipif(fcntl is None, reason='uploads are only parsed on completion without file locks')
+def test_uploads_past_the_parser_limit_are_parsed_on_completion(tmp_path, dataset_store, frame):
+    data = frame.to_csv(index=False).encode()
+    parts = _parts(data)
+    store = _store(tmp_path, dataset_store, max_parsers=1)
+    first, second = (store.create('data.csv', len(data), part_size=PART_SIZE) for _ in range(2))
+
+    parser = store.start_parsing(first, _load(dataset_store))
+    assert parser is not None
+    assert store.start_parsing(second, _load(dataset_store)) is None
+    for upload_id in (first, second):
+        for index, part in enumerate(parts):
+            store.write_part(upload_id, index, part)
+    results = [store.complete(upload_id, _load(dataset_store), 'upload', timeout=30)
+               for upload_id in (first, second)]
+    parser.join(timeout=30)
+
+    assert [len(dataset_store.get(r['dataset_id']).original) for r in results] == [len(frame)] * 2
+    # The finished parser gives its slot back
+    third = store.create('data.csv', len(data), part_size=PART_SIZE)
+    parser = store.start_parsing(third, _load(dataset_store))
+    assert parser is not None
+    store.remove(third)
+    parser.join(timeout=30)
+    assert not parser.is_alive()
+
+
+def test_parts_of_the_wrong_size_are_rejected(tmp_path, dataset_store):
+    store = _store(tmp_path, dataset_store)
+    upload_id = store.create('data.csv', 3 * PART_SIZE, part_size=PART_SIZE)
+
+    with pytest.raises(ValueError):
+        store.write_part(upload_id, 0, b'x' * (PART_SIZE - 1))
+    with pytest.raises(ValueError):
+        store.write_part(upload_id, 3, b'x' * PART_SIZE)
+    with pytest.raises(KeyError):
+        store.write_part('0' * 32, 0, b'x' * PART_SIZE)
@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from cluster_profile import ClusterProfile, profile_clusters, RELATIVE_ACCURACY
+
+
+@pytest.fixture
+def data():
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({'age': rng.normal(40, 12, 5000), 'income': rng.lognormal(10, 1, 5000)})
+    df.loc[rng.integers(5000, size=50), 'income'] = np.nan
+    labels = rng.integers(4, size=5000)
+    return df, labels
+
+
+def test_merged_chunk_profiles_match_the_whole(data):
+    df, labels = data
+    whole = profile_clusters(df, labels, 4)
+    merged = ClusterProfile(df.columns, 4)
+    for start in range(0, len(df), 1300):
+        merged.merge(profile_clusters(df.iloc[start:start + 1300], labels[start:start + 1300], 4))
+
+    np.testing.assert_array_equal(merged.sizes, whole.sizes)
+    np.testing.assert_array_equal(merged.count, whole.count)
+    np.testing.assert_allclose(merged.mean, whole.mean)
+    np.testing.assert_allclose(merged.std, whole.std)
+    np.testing.assert_array_equal(merged.min, whole.min)
+    np.testing.assert_array_equal(merged.max, whole.max)
+    # Sketches add bucket counts, so merged quantiles are exactly those of the whole
+    np.testing.assert_array_equal(merged.quantiles(), whole.quantiles())
+
+
+def test_profile_matches_pandas(data):
+    df, labels = data
+    profile = profile_clusters(df, labels, 4)
+    grouped = df.groupby(labels)
+
+    np.testing.assert_allclose(profile.mean, grouped.mean().to_numpy())
+    np.testing.assert_allclose(profile.std, grouped.std().to_numpy())
+    np.testing.assert_array_equal(profile.count, grouped.count().to_numpy())
+    medians = profile.quantiles((0.5,))[0]
+    # Quantiles come from the sketch: within its relative accuracy, give or take a rank
+    np.testing.assert_allclose(medians, grouped.median().to_numpy(), rtol=3 * RELATIVE_ACCURACY)
+
+
+def test_merge_rejects_other_columns_or_k(data):
+    df, labels = data
+    profile = profile_clusters(df, labels, 4)
+    with pytest.raises(ValueError):
+        profile.merge(profile_clusters(df[['age']], labels, 4))
+    with pytest.raises(ValueError):
+        profile.merge(profile_clusters(df, labels, 5))
+
+
+def test_empty_clusters_have_no_statistics(data):
+    df, labels = data
+    result = profile_clusters(df, labels, 6).to_dict()
+
+    assert result['5']['size'] == 0
+    assert result['5']['columns']['age'] == {'count': 0, 'mean': None, 'std': None, 'min': None,
+                                             'max': None, 'p25': None, 'p50': None, 'p75': None}
@@ -0,0 +1,84 @@
+import pickle
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from columnar_store import is_dataset, open_dataset, write_dataset
+
+
+def _assert_frames_equal(left, right):
+    # Mapped columns hold the same values, but as np.memmap rather than plain ndarrays
+    unmapped = pd.DataFrame({name: np.asarray(series) if isinstance(series.values, np.memmap) else series
+                             for name, series in left.items()})
+    pd.testing.assert_frame_equal(unmapped, right)
+
+
+@pytest.fixture
+def frame():
+    return pd.DataFrame({
+        'age': np.array([31, 45, 27, 60], dtype=np.int16),
+        'score': [0.5, np.nan, 2.25, 1.0],
+        'when': pd.to_datetime(['2024-01-01', '2024-02-01', '2024-03-01', '2024-04-01']),
+        'city': pd.Categorical(['NY', 'LA', 'NY', 'SF']),
+        'name': ['a', 'b', None, 'd'],
+        'maybe': pd.array([1, None, 3, 4], dtype='Int64'),
+    })
+
+
+def test_round_trip_keeps_values_and_dtypes(tmp_path, frame):
+    write_dataset(frame, str(tmp_path / 'ds'))
+    reopened = open_dataset(str(tmp_path / 'ds'))
+
+    assert reopened.n_rows == 4
+    assert reopened.columns == list(frame.columns)
+    _assert_frames_equal(reopened.to_frame(), frame)
+
+
+def test_numeric_columns_reopen_as_memory_maps(tmp_path, frame):
+    write_dataset(frame, str(tmp_path / 'ds'))
+    dataset = open_dataset(str(tmp_path / 'ds'))
+
+    age = dataset.column('age')
+    assert isinstance(age, np.memmap)
+    assert age.dtype == np.int16
+    # Copy-on-write mapping: changes stay in this process
+    age[0] = 99
+    assert open_dataset(str(tmp_path / 'ds')).column('age')[0] == 31
+    with pytest.raises(KeyError):
+        dataset.column('city')
+
+
+def test_subset_handle_survives_pickling(tmp_path, frame):
+    dataset = write_dataset(frame, str(tmp_path / 'ds'))
+    subset = pickle.loads(pickle.dumps(dataset.subset(['score', 'age'])))
+
+    assert subset.columns == ['score', 'age']
+    _assert_frames_equal(subset.to_frame(), frame[['score', 'age']])
+    with pytest.raises(KeyError):
+        dataset.subset(['missing'])
+
+
+def test_labels_are_saved_replaced_and_removed(tmp_path, frame):
+    dataset = write_dataset(frame, str(tmp_path / 'ds'))
+    assert dataset.load_labels() is None
+    assert dataset.labels_version() is None
+
+    dataset.save_labels(np.array([0, 1, 0, 2], dtype=np.uint8))
+    first = dataset.labels_version()
+    np.testing.assert_array_equal(open_dataset(dataset.directory).load_labels(), [0, 1, 0, 2])
+    dataset.save_labels(np.array([1, 1, 0, 0], dtype=np.uint8))
+    assert dataset.labels_version() != first
+
+    dataset.save_labels(None)
+    assert dataset.load_labels() is None
+
+
+def test_delete_removes_the_directory(tmp_path, frame):
+    dataset = write_dataset(frame, str(tmp_path / 'ds'))
+    assert is_dataset(dataset.directory)
+    dataset.delete()
+    assert not is_dataset(dataset.directory)
+    assert list(tmp_path.iterdir()) == []
+    # Deleting twice, e.g. from two processes, is harmless
+    dataset.delete()
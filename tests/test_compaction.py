@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from compaction import compact_frame, compact_labels, format_bytes, frame_nbytes, label_dtype
+
+
+@pytest.fixture
+def frame():
+    n = 1000
+    return pd.DataFrame({
+        'small': np.arange(n) % 100,
+        'negative': np.arange(n) - 500,
+        'wide': np.arange(n) * 1_000_000,
+        'halves': np.arange(n) / 2,
+        'precise': np.arange(n) / 3,
+        'missing': np.where(np.arange(n) % 7 == 0, np.nan, 1.5),
+        'city': np.array(['north', 'south', 'east'], dtype=object)[np.arange(n) % 3],
+        'name': [f'row{i}' for i in range(n)],
+        'flag': np.arange(n) % 2 == 0,
+    })
+
+
+def test_columns_get_the_narrowest_lossless_type(frame):
+    compacted, memory = compact_frame(frame)
+
+    assert compacted['small'].dtype == np.uint8
+    assert compacted['negative'].dtype == np.int16
+    assert compacted['wide'].dtype == np.uint32
+    assert compacted['halves'].dtype == np.float32
+    assert compacted['missing'].dtype == np.float32
+    # Thirds are not exact in float32, so the column keeps its precision
+    assert compacted['precise'].dtype == np.float64
+    assert isinstance(compacted['city'].dtype, pd.CategoricalDtype)
+    # Mostly distinct strings gain nothing from a categorical
+    assert compacted['name'].dtype == frame['name'].dtype
+    assert compacted['flag'].dtype == bool
+    assert memory['dtypes']['small'] == ('int64', 'uint8')
+    assert 'precise' not in memory['dtypes'] and 'name' not in memory['dtypes']
+
+
+def test_values_and_memory_accounting(frame):
+    compacted, memory = compact_frame(frame)
+
+    pd.testing.assert_frame_equal(compacted, frame, check_dtype=False, check_categorical=False)
+    assert memory['before_bytes'] == frame_nbytes(frame)
+    assert memory['after_bytes'] == frame_nbytes(compacted)
+    assert memory['after_bytes'] < memory['before_bytes']
+
+
+def test_empty_and_out_of_range_columns_are_left_alone():
+    frame = pd.DataFrame({'empty': pd.Series([], dtype=np.int64)})
+    assert compact_frame(frame)[1]['dtypes'] == {}
+
+    big = pd.DataFrame({'x': [1e300, 2.0]})
+    assert compact_frame(big)[0]['x'].dtype == np.float64
+
+
+@pytest.mark.parametrize('n_clusters, dtype', [(1, np.uint8), (2, np.uint8), (256, np.uint8),
+                                                (257, np.uint16), (70_000, np.uint32)])
+def test_label_dtype_holds_every_label(n_clusters, dtype):
+    assert label_dtype(n_clusters) == dtype
+
+
+def test_compact_labels_keeps_values():
+    labels = np.array([0, 3, 2, 3], dtype=np.int64)
+    compacted = compact_labels(labels)
+    assert compacted.dtype == np.uint8
+    np.testing.assert_array_equal(compacted, labels)
+    assert compact_labels(labels, 300).dtype == np.uint16
+    assert compact_labels(np.array([], dtype=np.int32)).dtype == np.uint8
+
+
+@pytest.mark.parametrize('n_bytes, text', [(512, '512 B'), (2048, '2.0 KB'), (5 * 1024 ** 2, '5.0 MB'),
+                                           (3 * 1024 ** 4, '3072.0 GB')])
+def test_format_bytes(n_bytes, text):
+    assert format_bytes(n_bytes) == text
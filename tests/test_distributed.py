@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.cluster import KMeans
+from sklearn.metrics import adjusted_rand_score
+from sklearn.preprocessing import StandardScaler
+
+from distributed import Coordinator, cluster_csv_distributed, plan_shards
+
+
+@pytest.fixture
+def csv_path(tmp_path):
+    rng = np.random.default_rng(0)
+    centers = np.array([[0.0, 0.0, 0.0], [8.0, 8.0, 0.0], [0.0, 8.0, 8.0], [8.0, 0.0, 8.0]])
+    points = np.vstack([rng.normal(center, 1.0, size=(300, 3)) for center in centers])
+    frame = pd.DataFrame(points[rng.permutation(len(points))], columns=['a', 'b', 'c'])
+    frame['name'] = [f'row{i}' for i in range(len(frame))]
+    path = tmp_path / 'data.csv'
+    frame.to_csv(path, index=False)
+    return str(path)
+
+
+def test_shards_cover_every_row_once(csv_path):
+    header, shards = plan_shards(csv_path, 4)
+    with open(csv_path, 'rb') as f:
+        content = f.read()
+
+    assert content.startswith(header)
+    assert shards[0][0] == len(header) and shards[-1][1] == len(content)
+    assert all(end == start for (_, end), (start, _) in zip(shards, shards[1:]))
+    assert all(content[start - 1:start] == b'\n' for start, _ in shards)
+    assert sum(content[start:end].count(b'\n') for start, end in shards) == 1200
+
+
+def test_local_workers_match_a_single_process_fit(csv_path, tmp_path):
+    output = str(tmp_path / 'out.csv')
+    result = cluster_csv_distributed(csv_path, ['a', 'b', 'c'], 4, output, n_workers=2)
+
+    frame = pd.read_csv(csv_path)
+    X = StandardScaler().fit_transform(frame[['a', 'b', 'c']])
+    reference = KMeans(n_clusters=4, n_init=3, random_state=0).fit(X)
+    clustered = pd.read_csv(output)
+
+    assert result['n_rows'] == 1200 and result['n_workers'] == 2
+    assert clustered['name'].tolist() == frame['name'].tolist()
+    assert adjusted_rand_score(reference.labels_, clustered['Cluster']) > 0.999
+    assert result['inertia'] == pytest.approx(reference.inertia_, rel=1e-3)
+    assert sum(result['cluster_stats'].values()) == 1200
+
+
+def test_remote_workers_need_a_shared_key(csv_path, tmp_path, monkeypatch):
+    monkeypatch.delenv('KMEANS_AUTHKEY', raising=False)
+    with pytest.raises(ValueError, match='KMEANS_AUTHKEY'):
+        cluster_csv_distributed(csv_path, ['a'], 2, str(tmp_path / 'out.csv'),
+                                n_workers=0, remote_workers=1)
+
+
+def test_accept_gives_up_when_workers_never_connect():
+    coordinator = Coordinator()
+    try:
+        with pytest.raises(TimeoutError, match='0 of 1 workers'):
+            coordinator.accept(1, timeout=0.3)
+    finally:
+        coordinator.close()
@@ -0,0 +1,102 @@
+import gzip
+import io
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from exporting import iter_csv, iter_export, iter_gzip, iter_npz
+
+
+@pytest.fixture
+def frame():
+    return pd.DataFrame({
+        'age': np.arange(10, dtype=np.int16),
+        'score': np.linspace(0, 1, 10),
+        'city': pd.Categorical(list('abcabcabca')),
+        'name': [f'n{i}' for i in range(10)],
+    })
+
+
+@pytest.fixture
+def labels():
+    return np.array([0, 1, 2, 0, 1, 2, 0, 1, 2, 0], dtype=np.uint8)
+
+
+def _expected(frame, labels):
+    return frame.assign(Cluster=labels)
+
+
+def test_csv_chunks_join_into_the_whole_frame(frame, labels):
+    chunks = list(iter_csv(frame, labels, chunk_rows=3))
+    assert len(chunks) == 4
+    exported = pd.read_csv(io.BytesIO(b''.join(chunks)))
+
+    expected = _expected(frame, labels)
+    assert list(exported.columns) == list(expected.columns)
+    np.testing.assert_array_equal(exported['Cluster'], labels)
+    np.testing.assert_allclose(exported['score'], frame['score'])
+    assert exported['city'].tolist() == frame['city'].tolist()
+
+
+def test_gzip_stream_decompresses_to_the_csv(frame, labels):
+    plain = b''.join(iter_csv(frame, labels, chunk_rows=4))
+    packed = b''.join(iter_gzip(iter_csv(frame, labels, chunk_rows=4)))
+    assert gzip.decompress(packed) == plain
+
+
+def test_npz_holds_one_array_per_column(frame, labels):
+    archive = np.load(io.BytesIO(b''.join(iter_npz(frame, labels))), allow_pickle=False)
+
+    assert archive.files == ['age', 'score', 'city', 'name', 'Cluster']
+    np.testing.assert_array_equal(archive['age'], frame['age'])
+    assert archive['age'].dtype == np.int16
+    np.testing.assert_array_equal(archive['score'], frame['score'])
+    assert archive['city'].tolist() == list('abcabcabca')
+    np.testing.assert_array_equal(archive['Cluster'], labels)
+
+
+def test_empty_frame_exports_its_header(frame):
+    exported = b''.join(iter_export(frame.iloc[:0], np.array([], dtype=np.uint8), 'csv'))
+    assert exported.decode().strip() == 'age,score,city,name,Cluster'
+
+
+def test_unknown_format_is_rejected(frame, labels):
+    with pytest.raises(ValueError, match='Export format'):
+        iter_export(frame, labels, 'xlsx')
+
+
+def test_download_streams_the_clustered_result(client, run_job):
+    frame = pd.DataFrame({'a': np.arange(200.0), 'b': np.arange(200.0) % 13})
+    client.post('/upload', data={'file': (io.BytesIO(frame.to_csv(index=False).encode()), 'data.csv')})
+    result = run_job('/cluster', json={'columns': ['a', 'b'], 'n_clusters': 3}).get_json()
+
+    csv = pd.read_csv(io.BytesIO(client.get(result['download_url']).data))
+    packed = client.get(result['download_url'] + '&format=csv.gz')
+    assert packed.headers['Content-Disposition'].endswith('clustered_dataset.csv.gz')
+    pd.testing.assert_frame_equal(pd.read_csv(io.BytesIO(gzip.decompress(packed.data))), csv)
+    assert csv['Cluster'].value_counts().to_dict() == {int(k): v for k, v in result['cluster_stats'].items()}
+    assert client.get(result['download_url'] + '&format=xlsx').status_code == 400
+    assert client.get('/download?result_id=' + '0' * 32).status_code == 404
+
+
+def test_prune_exports_drops_expired_then_oldest(web_app, monkeypatch):
+    folder = web_app.EXPORT_FOLDER
+    for name in os.listdir(folder):
+        os.remove(os.path.join(folder, name))
+    now = time.time()
+    ages = {'expired': 7200, 'old': 300, 'newer': 200, 'kept': 100, 'newest': 0}
+    for name, age in ages.items():
+        path = os.path.join(folder, f'{name}.csv')
+        with open(path, 'wb') as f:
+            f.write(b'x' * 100)
+        os.utime(path, (now - age, now - age))
+    monkeypatch.setattr(web_app, 'EXPORT_TTL_SECONDS', 3600)
+    monkeypatch.setattr(web_app, 'MAX_EXPORT_BYTES', 250)
+
+    web_app.prune_exports(keep=os.path.join(folder, 'kept.csv'))
+
+    # The run that was just written survives even though it is not the newest
+    assert sorted(os.listdir(folder)) == ['kept.csv', 'newest.csv']
@@ -0,0 +1,77 @@
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from feature_cache import FeatureCache, dataset_fingerprint, make_key
+
+
+@pytest.fixture
+def frame():
+    return pd.DataFrame({'a': [1.0, 2.0, np.nan, 4.0], 'b': [1, 2, 3, 4], 'city': list('xyxz')})
+
+
+def test_fingerprint_follows_content_names_and_dtypes(frame):
+    assert dataset_fingerprint(frame) == dataset_fingerprint(frame.copy())
+    changed = frame.copy()
+    changed.loc[3, 'b'] = 5
+    assert dataset_fingerprint(changed) != dataset_fingerprint(frame)
+    assert dataset_fingerprint(frame.rename(columns={'a': 'x'})) != dataset_fingerprint(frame)
+    assert dataset_fingerprint(frame.astype({'b': 'float64'})) != dataset_fingerprint(frame)
+    # The index is not content
+    assert dataset_fingerprint(frame.set_axis([10, 11, 12, 13])) == dataset_fingerprint(frame)
+
+
+def test_keys_include_columns_and_options():
+    assert make_key('h', ['a', 'b']) == make_key('h', ('a', 'b'), {'impute': 'mean'})
+    assert make_key('h', ['a', 'b']) != make_key('h', ['b', 'a'])
+    assert make_key('h', ['a']) != make_key('h', ['a'], {'dtype': 'float32'})
+
+
+def test_hit_on_the_same_key_and_cached_matrices_are_read_only():
+    cache = FeatureCache(max_bytes=1024)
+    X = np.ones((4, 2))
+    cache.put(make_key('h', ['a', 'b']), X, 'scaler')
+
+    X_cached, scaler = cache.get(make_key('h', ['a', 'b']))
+    assert X_cached is X and scaler == 'scaler'
+    assert not X_cached.flags.writeable
+    assert cache.get(make_key('other', ['a', 'b'])) is None
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 1
+    assert cache.stats()['hit_rate'] == 0.5
+
+
+def test_least_recently_used_entries_go_first():
+    cache = FeatureCache(max_bytes=3 * 80)
+    for name in 'abc':
+        cache.put(name, np.zeros(10), name)
+    cache.get('a')
+    cache.put('d', np.zeros(10), 'd')
+
+    assert cache.get('b') is None
+    assert [cache.get(name)[1] for name in 'acd'] == ['a', 'c', 'd']
+    assert cache.stats()['evictions'] == 1
+    assert cache.stats()['bytes'] == 240
+
+
+def test_entries_larger_than_the_cache_are_not_kept():
+    cache = FeatureCache(max_bytes=100)
+    cache.put('big', np.zeros(100), None)
+    assert cache.get('big') is None
+    assert cache.stats()['entries'] == 0
+
+
+def test_same_content_uploaded_again_reuses_the_features(client, run_job):
+    rng = np.random.default_rng(0)
+    data = pd.DataFrame(rng.normal(size=(300, 3)), columns=['p', 'q', 'r']).to_csv(index=False).encode()
+    before = client.get('/cache').get_json()
+
+    for _ in range(2):
+        client.post('/upload', data={'file': (io.BytesIO(data), 'data.csv')})
+        assert run_job('/cluster', json={'columns': ['p', 'q'], 'n_clusters': 3}).status_code == 200
+    after = client.get('/cache').get_json()
+
+    assert after['misses'] - before['misses'] == 1
+    assert after['hits'] - before['hits'] == 1
@@ -0,0 +1,132 @@
+import io
+import time
+
+import pandas as pd
+import pytest
+
+from jobs import JobManager, JobQueueFull
+from shared_state import RefCounter
+
+
+def _wait_for(condition, timeout=30):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.02)
+
+
+def _sleep(seconds):
+    time.sleep(seconds)
+    return seconds
+
+
+def _report_until_cancelled(progress=None):
+    # Runs until the progress reporter raises JobCancelled
+    for iteration in range(100_000):
+        progress('loop', iteration=iteration)
+        time.sleep(0.01)
+    return 'finished'
+
+
+def _fail():
+    raise ValueError('bad input')
+
+
+def _touch(path):
+    open(path, 'a').close()
+
+
+@pytest.fixture
+def manager(tmp_path):
+    manager = JobManager(max_workers=1, max_queued=1, state_dir=str(tmp_path / 'jobs'))
+    yield manager
+    if manager._executor is not None:
+        manager._executor.shutdown(wait=True, cancel_futures=True)
+
+
+def test_result_goes_through_on_success_and_is_shared(manager):
+    done = []
+    job_id = manager.submit('sleep', _sleep, 0.01, on_success=lambda seconds: {'slept': seconds},
+                            on_done=lambda: done.append(True))
+    job = manager.get(job_id)
+    _wait_for(lambda: job.finished_at is not None)
+
+    assert job.state == 'done'
+    assert job.result == {'slept': 0.01}
+    assert done == [True]
+    other = JobManager(max_workers=1, max_queued=1, state_dir=manager.state_dir)
+    assert other.get(job_id).to_record() == job.to_record()
+
+
+def test_failed_job_keeps_its_error(manager):
+    done = []
+    job_id = manager.submit('fail', _fail, on_done=lambda: done.append(True))
+    job = manager.get(job_id)
+    _wait_for(lambda: job.finished_at is not None)
+
+    assert job.state == 'failed'
+    assert job.error == 'bad input'
+    assert done == [True]
+
+
+def test_running_job_stops_at_its_next_progress_report(manager):
+    done = []
+    job_id = manager.submit('loop', _report_until_cancelled, progress=True,
+                            on_done=lambda: done.append(True))
+    _wait_for(lambda: (manager.progress(job_id) or {}).get('iteration', 0) > 0)
+
+    assert manager.cancel(job_id)
+    job = manager.get(job_id)
+    _wait_for(lambda: job.finished_at is not None)
+    assert job.state == 'cancelled'
+    assert job.result is None
+    assert done == [True]
+
+
+def test_queued_job_never_starts(manager, tmp_path):
+    marker = tmp_path / 'started'
+    manager.submit('sleep', _sleep, 0.5)
+    job_id = manager.submit('touch', _touch, str(marker))
+
+    assert manager.cancel(job_id)
+    job = manager.get(job_id)
+    _wait_for(lambda: job.finished_at is not None)
+    assert job.state == 'cancelled'
+    assert not marker.exists()
+
+
+def test_cancelled_state_is_visible_to_other_processes(manager):
+    job_id = manager.submit('loop', _report_until_cancelled, progress=True)
+    other = JobManager(max_workers=1, max_queued=1, state_dir=manager.state_dir)
+
+    assert other.cancel(job_id)
+    _wait_for(lambda: manager.get(job_id).finished_at is not None)
+    assert other.get(job_id).state == 'cancelled'
+
+
+def test_full_queue_rejects_new_jobs(manager):
+    manager.submit('sleep', _sleep, 0.5)
+    manager.submit('sleep', _sleep, 0.5)
+    with pytest.raises(JobQueueFull):
+        manager.submit('sleep', _sleep, 0.5)
+    assert manager.stats()['max_queued'] == 1
+
+
+def test_unknown_job_ids_are_not_found(manager):
+    assert manager.get('0' * 32) is None
+    assert manager.get('../../etc/passwd') is None
+    assert not manager.cancel('0' * 32)
+
+
+def test_cluster_job_releases_its_dataset_when_done(web_app, client, run_job):
+    frame = pd.DataFrame({'a': range(200), 'b': [i % 7 for i in range(200)]})
+    upload = client.post('/upload', data={'file': (io.BytesIO(frame.to_csv(index=False).encode()),
+                                                   'data.csv')})
+    dataset_id = upload.get_json()['dataset_id']
+
+    result = run_job('/cluster', json={'columns': ['a', 'b'], 'n_clusters': 3})
+    assert result.status_code == 200
+    assert sum(result.get_json()['cluster_stats'].values()) == 200
+    holders = RefCounter(web_app.dataset_store._directory(dataset_id)).holders()
+    assert 'upload' in holders
+    assert not [holder for holder in holders if holder.startswith('job-')]
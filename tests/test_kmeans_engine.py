@@ -0,0 +1,111 @@
+import numpy as np
+import pytest
+
+from kmeans_engine import choose_assignment, get_engine, nearest_two
+
+
+@pytest.fixture
+def X():
+    rng = np.random.default_rng(0)
+    centers = rng.uniform(-10, 10, size=(8, 3))
+    return np.vstack([rng.normal(center, 1.5, size=(250, 3)) for center in centers])
+
+
+@pytest.fixture
+def init(X):
+    # Deliberately poor starting centers, so both engines need many iterations
+    return X[:8].copy()
+
+
+def test_numpy_engine_matches_sklearn_from_the_same_init(X, init):
+    reference = get_engine('sklearn', tol=0).fit(X, 8, init=init)
+    model = get_engine('numpy', tol=0).fit(X, 8, init=init)
+
+    np.testing.assert_array_equal(model.labels_, reference.labels_)
+    np.testing.assert_allclose(model.cluster_centers_, reference.cluster_centers_, atol=1e-8)
+    assert model.inertia_ == pytest.approx(reference.inertia_, rel=1e-9)
+    np.testing.assert_array_equal(model.predict(X[::7]), reference.predict(X[::7]))
+
+
+def test_seeded_fits_are_reproducible_and_close_to_sklearn(X):
+    engine = get_engine('numpy')
+    first = engine.fit(X, 8, random_state=3, n_init=4)
+    second = engine.fit(X, 8, random_state=3, n_init=4)
+    reference = get_engine('sklearn').fit(X, 8, random_state=3, n_init=4)
+
+    np.testing.assert_array_equal(first.labels_, second.labels_)
+    assert first.inertia_ == second.inertia_
+    # Different k-means++ draws, but both should find the same well-separated blobs
+    assert first.inertia_ == pytest.approx(reference.inertia_, rel=0.02)
+
+
+def test_float32_mode_stays_float32_and_agrees(X, init):
+    model64 = get_engine('numpy', tol=0).fit(X, 8, init=init)
+    model32 = get_engine('numpy', tol=0).fit(X.astype(np.float32), 8, init=init)
+
+    assert model32.cluster_centers_.dtype == np.float32
+    assert np.mean(model32.labels_ == model64.labels_) > 0.999
+    assert model32.inertia_ == pytest.approx(model64.inertia_, rel=1e-4)
+
+
+def test_callback_sees_every_iteration_and_can_stop_the_fit(X, init):
+    seen = []
+    model = get_engine('numpy', tol=0).fit(X, 8, init=init,
+                                           callback=lambda *args: seen.append(args))
+    assert [iteration for _, _, iteration, _ in seen] == list(range(1, model.n_iter_ + 1))
+    # The running inertia converges on the final one
+    assert seen[-1][3] == pytest.approx(model.inertia_, rel=1e-9)
+
+    class Stop(Exception):
+        pass
+
+    def stop(restart, n_init, iteration, inertia):
+        if iteration == 2:
+            raise Stop()
+
+    with pytest.raises(Stop):
+        get_engine('numpy').fit(X, 8, init=init, callback=stop)
+
+
+def test_needs_as_many_rows_as_clusters(X):
+    with pytest.raises(ValueError, match='n_clusters'):
+        get_engine('numpy').fit(X[:3], 4)
+
+
+@pytest.mark.parametrize('n_clusters, n_features', [(300, 2), (40, 6)])
+def test_kdtree_and_brute_force_find_the_same_two_nearest(n_clusters, n_features):
+    rng = np.random.default_rng(1)
+    X = rng.normal(size=(2000, n_features))
+    centers = rng.normal(size=(n_clusters, n_features))
+    x_sq = np.einsum('ij,ij->i', X, X)
+    rows = np.arange(0, 2000, 3)
+
+    brute = nearest_two(X, centers, x_sq, rows, method='brute')
+    kdtree = nearest_two(X, centers, x_sq, rows, method='kdtree')
+
+    np.testing.assert_array_equal(kdtree[0], brute[0])
+    np.testing.assert_allclose(kdtree[1], brute[1], atol=1e-6)
+    np.testing.assert_allclose(kdtree[2], brute[2], atol=1e-6)
+    exact = np.sort(np.linalg.norm(X[rows, None, :] - centers[None], axis=2), axis=1)
+    np.testing.assert_allclose(brute[1], exact[:, 0], atol=1e-6)
+    np.testing.assert_allclose(brute[2], exact[:, 1], atol=1e-6)
+
+
+def test_kdtree_fit_matches_sklearn_from_the_same_init(X, init):
+    reference = get_engine('sklearn', tol=0).fit(X, 8, init=init)
+    model = get_engine('numpy', tol=0, assignment='kdtree').fit(X, 8, init=init)
+
+    assert model.assignment == 'kdtree'
+    np.testing.assert_array_equal(model.labels_, reference.labels_)
+    assert model.inertia_ == pytest.approx(reference.inertia_, rel=1e-9)
+
+
+def test_auto_assignment_uses_the_tree_only_past_the_crossover():
+    assert choose_assignment(8, 2) == 'brute'
+    assert choose_assignment(256, 2) == 'kdtree'
+    assert choose_assignment(256, 8) == 'brute'
+    assert choose_assignment(2048, 8) == 'kdtree'
+    assert choose_assignment(4096, 32) == 'brute'
+    assert choose_assignment(8, 2, 'kdtree') == 'kdtree'
+    with pytest.raises(ValueError, match='Assignment'):
+        choose_assignment(8, 2, 'annoy')
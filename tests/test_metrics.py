@@ -0,0 +1,100 @@
+import io
+import re
+import time
+
+import pandas as pd
+import pytest
+
+import metrics
+from metrics import MetricsRegistry, collect_breakdown, record_breakdown, timed, timed_iter
+
+
+def _sample(text, line_start):
+    """Value of the exposition line that starts with line_start"""
+    for line in text.splitlines():
+        if line.startswith(line_start + ' '):
+            return float(line.rsplit(' ', 1)[1])
+    raise AssertionError(f'{line_start} not rendered')
+
+
+def test_render_follows_the_text_exposition_format():
+    registry = MetricsRegistry()
+    registry.inc('jobs_total', 'Jobs', state='done')
+    registry.inc('jobs_total', 'Jobs', 2, state='done')
+    registry.set('queue_depth', 'Queued jobs', 3)
+    registry.set('label_escape', 'Escaped labels', 1, path='a"b\\c')
+    for value in (0.5, 2, 20):
+        registry.observe('latency_seconds', 'Latency', value, buckets=(1, 10))
+    text = registry.render()
+
+    assert '# TYPE jobs_total counter' in text
+    assert _sample(text, 'jobs_total{state="done"}') == 3
+    assert _sample(text, 'queue_depth') == 3
+    assert 'label_escape{path="a\\"b\\\\c"} 1' in text
+    assert '# TYPE latency_seconds histogram' in text
+    # Buckets are cumulative and +Inf counts every observation
+    assert _sample(text, 'latency_seconds_bucket{le="1"}') == 1
+    assert _sample(text, 'latency_seconds_bucket{le="10"}') == 2
+    assert _sample(text, 'latency_seconds_bucket{le="+Inf"}') == 3
+    assert _sample(text, 'latency_seconds_sum') == 22.5
+    assert _sample(text, 'latency_seconds_count') == 3
+
+
+def test_callbacks_refresh_gauges_before_each_render():
+    registry = MetricsRegistry()
+    calls = []
+    registry.register_callback(lambda r: (calls.append(1), r.set('renders', 'Renders', len(calls))))
+    registry.render()
+    assert _sample(registry.render(), 'renders') == 2
+
+
+def test_timed_stages_add_up_in_the_breakdown():
+    with collect_breakdown() as outer:
+        with timed('outer_stage'):
+            time.sleep(0.01)
+        with collect_breakdown() as inner:
+            with timed('inner_stage'):
+                pass
+            assert list(timed_iter('inner_stage', range(3))) == [0, 1, 2]
+        with timed('outer_stage'):
+            time.sleep(0.01)
+
+    assert list(inner.seconds) == ['inner_stage']
+    assert list(outer.seconds) == ['outer_stage']
+    assert outer.seconds['outer_stage'] >= 0.02
+    assert re.fullmatch(r'outer_stage;dur=\d+\.\d', outer.server_timing())
+    assert set(outer.to_dict()) == {'seconds', 'rss_delta_bytes'}
+
+
+def test_worker_breakdowns_are_folded_into_the_histograms():
+    record_breakdown({'seconds': {'worker_test_stage': 0.2},
+                      'rss_delta_bytes': {'worker_test_stage': -4096}})
+    # Read directly: rendering the shared registry would also refresh the app's gauges
+    histograms = {name: metric['series'][(('stage', 'worker_test_stage'),)]
+                  for name, metric in metrics.registry._metrics.items()
+                  if name in ('kmeans_stage_seconds', 'kmeans_stage_rss_growth_bytes')}
+
+    assert histograms['kmeans_stage_seconds'].sum == 0.2
+    # Memory given back is recorded as no growth
+    assert histograms['kmeans_stage_rss_growth_bytes'].sum == 0
+    assert histograms['kmeans_stage_rss_growth_bytes'].total == 1
+
+
+def test_endpoint_and_server_timing(client, run_job):
+    frame = pd.DataFrame({'a': range(100), 'b': [i % 9 for i in range(100)]})
+    upload = client.post('/upload', data={'file': (io.BytesIO(frame.to_csv(index=False).encode()), 'data.csv')})
+    assert 'csv_parse;dur=' in upload.headers['Server-Timing']
+    result = run_job('/cluster', json={'columns': ['a', 'b'], 'n_clusters': 2}).get_json()
+    assert 'fit' in result['timings']['seconds']
+
+    response = client.get('/metrics')
+    assert response.mimetype == 'text/plain'
+    text = response.data.decode()
+    assert _sample(text, 'kmeans_stage_seconds_count{stage="fit"}') >= 1
+    assert 'kmeans_fits_total{converged="true",engine="sklearn"}' in text
+    assert '# TYPE kmeans_http_request_seconds histogram' in text
+
+
+@pytest.mark.parametrize('value, rendered', [(1, '1'), (0.5, '0.5'), (float('inf'), '+Inf')])
+def test_values_render_like_prometheus(value, rendered):
+    assert metrics._format_value(value) == rendered
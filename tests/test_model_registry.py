@@ -0,0 +1,119 @@
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.cluster import KMeans
+from sklearn.preprocessing import StandardScaler
+
+from model_registry import ModelRegistry, check_model_name
+
+
+@pytest.fixture
+def frame():
+    rng = np.random.default_rng(0)
+    centers = np.array([[20.0, 1000.0], [40.0, 5000.0], [60.0, 3000.0]])
+    points = np.vstack([rng.normal(center, [3.0, 300.0], size=(100, 2)) for center in centers])
+    return pd.DataFrame(points, columns=['age', 'income'])
+
+
+@pytest.fixture
+def fitted(frame):
+    scaler = StandardScaler().fit(frame)
+    kmeans = KMeans(n_clusters=3, n_init=3, random_state=0).fit(scaler.transform(frame))
+    return scaler, kmeans
+
+
+def test_save_and_load_a_new_version_each_time(tmp_path, fitted):
+    registry = ModelRegistry(str(tmp_path))
+    scaler, kmeans = fitted
+    assert registry.save_fitted('demo', ['age', 'income'], scaler, kmeans, {'engine': 'sklearn'}) == 1
+    assert registry.save_fitted('demo', ['age', 'income'], scaler, kmeans) == 2
+
+    model = ModelRegistry(str(tmp_path)).load('demo')
+    assert model.version == 2
+    assert registry.load('demo', 1).info()['engine'] == 'sklearn'
+    assert model.columns == ['age', 'income']
+    np.testing.assert_array_equal(model.centers, kmeans.cluster_centers_)
+    np.testing.assert_array_equal(model.mean, scaler.mean_)
+    assert registry.list() == {'demo': [1, 2]}
+    with pytest.raises(KeyError):
+        registry.load('demo', 3)
+    with pytest.raises(KeyError):
+        registry.load('other')
+
+
+def test_float32_models_keep_float64_scaling(tmp_path, fitted):
+    registry = ModelRegistry(str(tmp_path))
+    scaler, kmeans = fitted
+    registry.save('small', ['age', 'income'], scaler.mean_, scaler.scale_,
+                  kmeans.cluster_centers_.astype(np.float32))
+
+    model = registry.load('small')
+    assert model.centers.dtype == np.float32
+    assert model.mean.dtype == np.float64
+    assert model.scale.dtype == np.float64
+    np.testing.assert_array_equal(model.scale, scaler.scale_)
+
+
+def test_only_the_newest_versions_are_kept(tmp_path, fitted):
+    registry = ModelRegistry(str(tmp_path), keep_versions=2)
+    for _ in range(4):
+        registry.save_fitted('demo', ['age', 'income'], *fitted)
+    assert registry.versions('demo') == [3, 4]
+
+
+@pytest.mark.parametrize('name', ['', '../escape', '.hidden', 'a/b', 'x' * 65, None])
+def test_invalid_names_are_rejected(name):
+    with pytest.raises(ValueError):
+        check_model_name(name)
+
+
+def test_predict_matches_the_fit_and_imputes_missing_values(tmp_path, frame, fitted):
+    registry = ModelRegistry(str(tmp_path))
+    scaler, kmeans = fitted
+    registry.save_fitted('demo', ['age', 'income'], scaler, kmeans)
+    model = registry.load('demo')
+
+    labels, distances = model.predict(frame)
+    np.testing.assert_array_equal(labels, kmeans.labels_)
+    expected = np.linalg.norm(scaler.transform(frame) - kmeans.cluster_centers_[labels], axis=1)
+    np.testing.assert_allclose(distances, expected)
+
+    # Lists follow the model's column order; a missing value counts as the training mean
+    labels, _ = model.predict([[frame['age'][0], np.nan]])
+    imputed = pd.DataFrame([[frame['age'][0], scaler.mean_[1]]], columns=frame.columns)
+    assert labels.tolist() == kmeans.predict(scaler.transform(imputed)).tolist()
+    with pytest.raises(ValueError, match='Missing columns'):
+        model.predict(frame[['age']])
+    with pytest.raises(ValueError, match='Expected 2 features'):
+        model.predict([[1.0, 2.0, 3.0]])
+
+
+def test_predict_route_keeps_the_labels_of_the_fit(client, run_job, frame):
+    client.post('/upload', data={'file': (io.BytesIO(frame.to_csv(index=False).encode()), 'data.csv')})
+    result = run_job('/cluster', json={'columns': ['age', 'income'], 'n_clusters': 3,
+                                       'model_name': 'route-demo'}).get_json()
+    fitted_labels = pd.read_csv(io.BytesIO(client.get(result['download_url']).data))['Cluster']
+    model = result['model']
+
+    by_records = client.post('/predict', json={'model': 'route-demo', 'version': model['version'],
+                                               'rows': frame.to_dict('records')}).get_json()
+    by_csv = client.post('/predict', data={'model': 'route-demo', 'format': 'csv', 'file': (
+        io.BytesIO(frame.to_csv(index=False).encode()), 'rows.csv')})
+
+    assert by_records['labels'] == fitted_labels.tolist()
+    assert pd.read_csv(io.BytesIO(by_csv.data))['Cluster'].tolist() == fitted_labels.tolist()
+    assert client.post('/predict', json={'model': 'missing', 'rows': [{'age': 1}]}).status_code == 404
+    assert client.post('/predict', json={'model': 'route-demo', 'rows': [{'age': 1}]}).status_code == 400
+
+
+def test_kdtree_scoring_matches_brute_force(tmp_path, frame, fitted):
+    registry = ModelRegistry(str(tmp_path))
+    registry.save_fitted('demo', ['age', 'income'], *fitted)
+    model = registry.load('demo')
+
+    brute_labels, brute_distances = model.predict(frame, 'brute')
+    tree_labels, tree_distances = model.predict(frame, 'kdtree')
+    np.testing.assert_array_equal(tree_labels, brute_labels)
+    np.testing.assert_allclose(tree_distances, brute_distances, atol=1e-9)
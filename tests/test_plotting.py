@@ -0,0 +1,77 @@
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from plotting import PlotCache, density_raster, render_cluster_plot, resolve_mode, stratified_sample
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+
+def test_stratified_sample_keeps_shares_and_every_cluster():
+    labels = np.repeat([0, 1, 2], [9000, 990, 10])
+    keep = stratified_sample(labels, 1000)
+
+    assert np.all(np.diff(keep) > 0)
+    counts = np.bincount(labels[keep], minlength=3)
+    assert counts.tolist() == [900, 99, 1]
+    assert stratified_sample(labels[:500], 1000).tolist() == list(range(500))
+
+
+def test_auto_mode_switches_to_density_above_the_limit():
+    assert resolve_mode('auto', 100, point_limit=1000) == 'scatter'
+    assert resolve_mode('auto', 5000, point_limit=1000) == 'density'
+    assert resolve_mode('sample', 5000, point_limit=1000) == 'sample'
+    with pytest.raises(ValueError, match='Plot mode'):
+        resolve_mode('hexbin', 10)
+
+
+def test_density_pixels_take_their_dominant_cluster():
+    x = np.array([0.0, 0.0, 0.0, 1.0])
+    y = np.array([0.0, 0.0, 0.0, 1.0])
+    labels = np.array([1, 1, 0, 0])
+    image, extent = density_raster(x, y, labels, n_clusters=2, size=2)
+
+    assert extent == (0.0, 1.0, 0.0, 1.0)
+    assert image.shape == (2, 2, 4)
+    # Two rows of cluster 1 outweigh one of cluster 0 in the bottom-left pixel
+    assert image[0, 0, 3] == 1.0
+    assert image[0, 1, 3] == 0.0
+    assert not np.array_equal(image[0, 0, :3], image[1, 1, :3])
+
+
+@pytest.mark.parametrize('mode', ['scatter', 'sample', 'density'])
+def test_every_mode_renders_a_png(mode):
+    rng = np.random.default_rng(0)
+    x, y = rng.normal(size=(2, 2000))
+    labels = rng.integers(0, 3, 2000)
+    png = render_cluster_plot(x, y, labels, ['x', 'y'], mode=mode, dpi=30)
+    assert png.startswith(PNG_SIGNATURE)
+
+
+def test_plot_cache_evicts_least_recently_used():
+    cache = PlotCache(max_bytes=10)
+    cache.put('a', b'aaaa')
+    cache.put('b', b'bbbb')
+    cache.get('a')
+    cache.put('c', b'cccc')
+
+    assert cache.get('b') is None
+    assert cache.get('a') == b'aaaa'
+    cache.put('huge', b'x' * 11)
+    assert cache.get('huge') is None
+
+
+def test_plot_route_renders_on_demand_and_checks_its_arguments(client, run_job):
+    frame = pd.DataFrame({'a': np.arange(300.0), 'b': np.arange(300.0) % 17, 'name': ['n'] * 300})
+    client.post('/upload', data={'file': (io.BytesIO(frame.to_csv(index=False).encode()), 'data.csv')})
+    plot_url = run_job('/cluster', json={'columns': ['a', 'b'], 'n_clusters': 3}).get_json()['plot_url']
+
+    response = client.get(plot_url)
+    assert response.status_code == 200
+    assert response.data.startswith(PNG_SIGNATURE)
+    assert client.get(plot_url + '?x=b&y=a&mode=density').status_code == 200
+    assert client.get(plot_url + '?mode=hexbin').status_code == 400
+    assert client.get(plot_url + '?x=name').status_code == 400
+    assert client.get('/plot/' + '0' * 32).status_code == 404
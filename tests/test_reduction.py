@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from reduction import reduce_features, full_space_inertia, parse_reduction
+
+
+@pytest.fixture
+def scaled():
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(2000, 6)) @ rng.normal(size=(6, 6))
+    X = (X - X.mean(axis=0)) / X.std(axis=0)
+    labels = (X[:, 0] > 0).astype(int) + 2 * (X[:, 1] > 0)
+    return X, labels
+
+
+def _cluster_means(X, labels, n_clusters):
+    return np.array([X[labels == k].mean(axis=0) for k in range(n_clusters)])
+
+
+def test_pca_centers_map_back_to_the_full_space(scaled):
+    X, labels = scaled
+    reduced = reduce_features(X, 'pca', n_components=6)
+    centers = _cluster_means(reduced.X, labels, 4)
+
+    # Keeping every component loses nothing: the centers are the full-space cluster means
+    np.testing.assert_allclose(reduced.full_centers(X, labels, centers), _cluster_means(X, labels, 4),
+                               atol=1e-10)
+
+
+def test_truncated_pca_centers_are_projected_means(scaled):
+    X, labels = scaled
+    reduced = reduce_features(X, 'pca', n_components=3)
+    centers = _cluster_means(reduced.X, labels, 4)
+    full = reduced.full_centers(X, labels, centers)
+
+    assert full.shape == (4, 6)
+    projected = ((_cluster_means(X, labels, 4) - reduced.mean) @ reduced.components.T
+                 @ reduced.components + reduced.mean)
+    np.testing.assert_allclose(full, projected, atol=1e-10)
+
+
+def test_projection_centers_are_full_space_cluster_means(scaled):
+    X, labels = scaled
+    reduced = reduce_features(X.astype(np.float32), 'projection', n_components=4)
+    centers = _cluster_means(reduced.X, labels, 4)
+    full = reduced.full_centers(X.astype(np.float32), labels, centers)
+
+    assert full.dtype == np.float32
+    np.testing.assert_allclose(full, _cluster_means(X, labels, 4), atol=1e-5)
+
+
+def test_full_space_inertia_matches_the_definition(scaled):
+    X, labels = scaled
+    means = _cluster_means(X, labels, 4)
+    expected = sum(((X[labels == k] - means[k]) ** 2).sum() for k in range(4))
+    assert full_space_inertia(X, labels, 4) == pytest.approx(expected)
+
+
+def test_variance_threshold_keeps_the_fewest_components(scaled):
+    X, _ = scaled
+    reduced = reduce_features(X, 'pca', variance=0.9)
+    assert reduced.report['variance_retained'] >= 0.9
+    assert reduce_features(X, 'pca', n_components=reduced.X.shape[1] - 1).report['variance_retained'] < 0.9
+
+
+def test_parse_reduction_rejects_both_dimensions_and_variance():
+    assert parse_reduction('none') is None
+    with pytest.raises(ValueError):
+        parse_reduction('pca', n_components=2, variance=0.9)
@@ -0,0 +1,70 @@
+import io
+
+import numpy as np
+import pytest
+from sklearn.datasets import make_blobs
+
+from clustering_core import fit_kmeans
+from restarts import fit_restarts
+
+
+class Stop(Exception):
+    pass
+
+
+class StopAfter:
+    """Picklable callback that raises after a number of iterations"""
+
+    def __init__(self, iterations):
+        self.iterations = iterations
+
+    def __call__(self, restart, n_init, iteration, inertia):
+        if iteration >= self.iterations:
+            raise Stop()
+
+
+@pytest.fixture(scope='module')
+def blobs():
+    X, _ = make_blobs(n_samples=3000, n_features=4, centers=6, cluster_std=2.5, random_state=0)
+    return (X - X.mean(axis=0)) / X.std(axis=0)
+
+
+@pytest.mark.parametrize('engine', ['sklearn', 'numpy'])
+def test_results_do_not_depend_on_the_number_of_workers(blobs, engine):
+    fits = [fit_restarts(blobs, 6, engine=engine, n_init=4, n_jobs=n_jobs) for n_jobs in (1, 2, 3)]
+
+    model, report = fits[0]
+    for other, other_report in fits[1:]:
+        np.testing.assert_array_equal(other.labels_, model.labels_)
+        np.testing.assert_array_equal(other.cluster_centers_, model.cluster_centers_)
+        assert other.inertia_ == model.inertia_
+        assert other_report['best_restart'] == report['best_restart']
+        assert other_report['abandoned'] == report['abandoned']
+    assert [r['workers'] for _, r in fits] == [1, 2, 3]
+
+
+def test_labels_belong_to_the_nearest_center(blobs):
+    model, report = fit_restarts(blobs, 6, n_init=4, n_jobs=1)
+
+    distances = ((blobs[:, None, :] - model.cluster_centers_[None]) ** 2).sum(axis=2)
+    np.testing.assert_array_equal(model.labels_, distances.argmin(axis=1))
+    assert model.inertia_ == pytest.approx(distances.min(axis=1).sum(), rel=1e-6)
+    assert 1 <= report['best_restart'] <= 4
+    assert report['method'] == 'parallel'
+
+
+@pytest.mark.parametrize('n_jobs', [1, 2])
+def test_callback_exceptions_stop_the_fit(blobs, n_jobs):
+    with pytest.raises(Stop):
+        fit_restarts(blobs, 6, engine='numpy', n_init=4, n_jobs=n_jobs, callback=StopAfter(2))
+
+
+def test_parallel_restarts_with_coreset_seeding_are_rejected(blobs, client):
+    with pytest.raises(ValueError, match='full seeding'):
+        fit_kmeans(blobs, 4, seeding='coreset', restarts='parallel')
+
+    client.post('/upload', data={'file': (io.BytesIO(b'a,b\n1,2\n3,4\n5,6\n'), 'data.csv')})
+    response = client.post('/cluster', json={'columns': ['a', 'b'], 'n_clusters': 2,
+                                             'seeding': 'coreset', 'restarts': 'parallel'})
+    assert response.status_code == 400
+    assert 'full seeding' in response.get_json()['error']
@@ -0,0 +1,69 @@
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from exporting import page_to_json, select_rows
+
+
+@pytest.fixture
+def frame():
+    return pd.DataFrame({'a': np.arange(10), 'b': np.arange(10) / 4, 'name': [f'n{i}' for i in range(10)]})
+
+
+@pytest.fixture
+def labels():
+    return np.array([0, 1, 2, 0, 1, 2, 0, 1, 2, 0], dtype=np.uint8)
+
+
+def test_pages_stop_at_the_end(frame, labels):
+    page, positions, total = select_rows(frame, labels, offset=8, limit=5)
+    assert total == 10
+    assert positions.tolist() == [8, 9]
+    assert page['a'].tolist() == [8, 9]
+    assert page['Cluster'].tolist() == [2, 0]
+
+    page, positions, total = select_rows(frame, labels, offset=50, limit=5)
+    assert len(page) == 0 and positions.tolist() == [] and total == 10
+
+
+def test_cluster_filter_pages_over_matching_rows(frame, labels):
+    page, positions, total = select_rows(frame, labels, offset=1, limit=2, columns=['name'], clusters=[0])
+    assert total == 4
+    assert positions.tolist() == [3, 6]
+    assert list(page.columns) == ['name', 'Cluster']
+    assert page['name'].tolist() == ['n3', 'n6']
+
+
+def test_page_encodings_share_values(frame):
+    page = frame.iloc[:2].assign(b=[np.nan, 0.25])
+    assert page_to_json(page) == [{'a': 0, 'b': None, 'name': 'n0'}, {'a': 1, 'b': 0.25, 'name': 'n1'}]
+    assert page_to_json(page, 'columns') == {'a': [0, 1], 'b': [None, 0.25], 'name': ['n0', 'n1']}
+
+
+def test_rows_route_pages_and_checks_bounds(client, run_job, web_app):
+    frame = pd.DataFrame({'a': np.arange(120.0), 'b': np.arange(120.0) % 7})
+    client.post('/upload', data={'file': (io.BytesIO(frame.to_csv(index=False).encode()), 'data.csv')})
+
+    first = client.get('/rows?offset=100&limit=50')
+    assert first.headers['X-Total-Rows'] == '120'
+    body = first.get_json()
+    assert body['row_index'] == list(range(100, 120))
+    assert [row['a'] for row in body['rows']] == list(range(100, 120))
+    assert client.get('/rows?offset=500').get_json()['rows'] == []
+    for query in ('offset=-1', 'limit=0', f'limit={web_app.MAX_PAGE_ROWS + 1}', 'format=xml', 'columns=c'):
+        assert client.get('/rows?' + query).status_code == 400, query
+    assert client.get('/rows?cluster=0').status_code == 400
+
+    result = run_job('/cluster', json={'columns': ['a', 'b'], 'n_clusters': 3}).get_json()
+    filtered = client.get(f"/rows?result_id={result['result_id']}&cluster=1&columns=a&format=columns")
+    body = filtered.get_json()
+    assert body['columns'] == ['a', 'Cluster']
+    assert set(body['rows']['Cluster']) == {1}
+    assert body['total'] == result['cluster_stats']['1']
+    assert client.get('/rows?result_id=' + '0' * 32).status_code == 404
+
+    archive = np.load(io.BytesIO(client.get('/rows?limit=5&format=npz').data), allow_pickle=False)
+    np.testing.assert_array_equal(archive['_row'], np.arange(5))
+    np.testing.assert_array_equal(archive['a'], frame['a'][:5])
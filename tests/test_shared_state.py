@@ -0,0 +1,114 @@
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from dataset_store import DatasetStore
+from shared_state import RefCounter, ResultStore
+
+
+@pytest.fixture
+def dataset_store(tmp_path):
+    return DatasetStore(memory_budget=64 * 1024 * 1024, storage_dir=str(tmp_path / 'datasets'))
+
+
+@pytest.fixture
+def dataset(dataset_store):
+    df = pd.DataFrame({'a': np.arange(10.0), 'b': np.arange(10.0) ** 2})
+    return dataset_store.add(df, holder='upload')
+
+
+def _exists(dataset_store, dataset_id):
+    return os.path.isdir(os.path.join(dataset_store.storage_dir, dataset_id))
+
+
+def test_ref_counter_calls_on_last_once_every_holder_is_gone(tmp_path):
+    directory = tmp_path / 'shared'
+    directory.mkdir()
+    counter = RefCounter(str(directory))
+    deleted = []
+
+    def delete():
+        deleted.append(True)
+        shutil.rmtree(directory)
+
+    counter.acquire('upload')
+    counter.acquire('result-1')
+    assert counter.holders() == ['result-1', 'upload']
+    assert counter.release('upload', on_last=delete) == 1
+    assert deleted == []
+    assert counter.release('result-1', on_last=delete) == 0
+    assert deleted == [True]
+    # A deleted directory cannot be brought back by a late holder
+    with pytest.raises(KeyError):
+        counter.acquire('upload')
+    assert not directory.exists()
+
+
+def test_ref_counter_rejects_holder_names_that_are_paths(tmp_path):
+    with pytest.raises(ValueError):
+        RefCounter(str(tmp_path)).acquire('../escape')
+
+
+def test_result_keeps_its_dataset_after_the_upload_is_released(tmp_path, dataset_store, dataset):
+    results = ResultStore(str(tmp_path / 'results'), dataset_store, max_per_dataset=2, max_results=10)
+    result_id = results.add(dataset, ['a', 'b'], np.arange(10) % 3)
+
+    dataset_store.release(dataset, 'upload')
+    assert _exists(dataset_store, dataset)
+    result = results.get(result_id)
+    assert result['dataset_id'] == dataset
+    assert result['columns'] == ['a', 'b']
+    np.testing.assert_array_equal(result['labels'], np.arange(10) % 3)
+    assert result['projection'] is None
+
+    results.remove(result_id)
+    assert results.get(result_id) is None
+    assert not _exists(dataset_store, dataset)
+
+
+def _add_results(results, dataset, n, start=0):
+    ids = []
+    for i in range(start, start + n):
+        ids.append(results.add(dataset, ['a'], np.full(10, i)))
+        # Eviction goes by modification time
+        os.utime(os.path.join(results.directory, ids[-1]), ns=(i * 10**9, i * 10**9))
+    return ids
+
+
+def test_result_store_evicts_the_oldest_results_of_the_same_dataset(tmp_path, dataset_store, dataset):
+    other = dataset_store.add(pd.DataFrame({'a': np.arange(10.0)}), holder='upload')
+    results = ResultStore(str(tmp_path / 'results'), dataset_store, max_per_dataset=2, max_results=10)
+    other_ids = _add_results(results, other, 2)
+    ids = _add_results(results, dataset, 5, start=2)
+
+    assert len(results) == 4
+    assert [results.get(result_id) is None for result_id in ids] == [True, True, True, False, False]
+    assert results.get(ids[-1])['labels'][0] == 6
+    # A busy dataset does not push out the results of another
+    assert all(results.get(result_id) is not None for result_id in other_ids)
+    dataset_store.release(dataset, 'upload')
+    assert _exists(dataset_store, dataset)
+
+
+def test_total_cap_evicts_the_oldest_results_of_any_dataset(tmp_path, dataset_store, dataset):
+    other = dataset_store.add(pd.DataFrame({'a': np.arange(10.0)}), holder='upload')
+    results = ResultStore(str(tmp_path / 'results'), dataset_store, max_per_dataset=5, max_results=3)
+    first = _add_results(results, other, 2)
+    second = _add_results(results, dataset, 2, start=2)
+
+    assert len(results) == 3
+    assert results.get(first[0]) is None
+    assert all(results.get(result_id) is not None for result_id in first[1:] + second)
+
+
+def test_result_store_keeps_projections(tmp_path, dataset_store, dataset):
+    results = ResultStore(str(tmp_path / 'results'), dataset_store, max_per_dataset=2, max_results=10)
+    projection = np.random.default_rng(0).normal(size=(10, 2)).astype(np.float32)
+    result = results.get(results.add(dataset, ['a', 'b'], np.zeros(10, dtype=int), projection,
+                                     ['PC1', 'PC2']))
+
+    np.testing.assert_array_equal(result['projection'], projection)
+    assert result['axes'] == ['PC1', 'PC2']
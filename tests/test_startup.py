@@ -0,0 +1,25 @@
+import json
+import os
+import subprocess
+import sys
+
+import startup
+
+HEAVY_MODULES = ('sklearn', 'matplotlib', 'scipy')
+# Generous for a cold interpreter on a slow CI machine; locally it is well under a second
+MAX_FIRST_RESPONSE_SECONDS = float(os.environ.get('MAX_FIRST_RESPONSE_SECONDS', 10))
+
+
+def test_importing_app_skips_heavy_modules(tmp_path):
+    code = ('import json, sys, app; '
+            f'print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))')
+    env = dict(os.environ, PYTHONPATH=startup.APP_DIR)
+    # app creates uploads/ in the working directory
+    result = subprocess.run([sys.executable, '-c', code], cwd=tmp_path, env=env,
+                            capture_output=True, text=True, check=True)
+    assert json.loads(result.stdout.splitlines()[-1]) == []
+
+
+def test_time_to_first_response(tmp_path):
+    seconds = startup.time_to_first_response(workdir=str(tmp_path), timeout=60)
+    assert seconds < MAX_FIRST_RESPONSE_SECONDS
@@ -0,0 +1,130 @@
+import gzip
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.cluster import KMeans
+from sklearn.metrics import adjusted_rand_score
+from sklearn.preprocessing import StandardScaler
+
+from streaming import cluster_csv_streaming, run_streaming_job
+
+CENTERS = np.array([[0.0, 0.0], [10.0, 10.0], [0.0, 20.0]])
+
+
+@pytest.fixture
+def frame():
+    rng = np.random.default_rng(0)
+    points = np.vstack([rng.normal(center, 1.0, size=(400, 2)) for center in CENTERS])
+    # Shuffled, since partial_fit seeds its centers from the first chunk alone
+    points = rng.permutation(points)
+    df = pd.DataFrame(points, columns=['a', 'b'])
+    df['name'] = [f'row{i}' for i in range(len(df))]
+    # A few gaps, which both paths fill with the column mean
+    df.loc[::97, 'a'] = np.nan
+    return df
+
+
+@pytest.fixture
+def csv_path(tmp_path, frame):
+    path = tmp_path / 'data.csv'
+    frame.to_csv(path, index=False)
+    return str(path)
+
+
+def test_three_passes_match_an_in_memory_fit(tmp_path, frame, csv_path):
+    output = str(tmp_path / 'out.csv')
+    result = cluster_csv_streaming(csv_path, ['a', 'b'], 3, output_path=output, chunksize=250)
+
+    features = frame[['a', 'b']].fillna(frame[['a', 'b']].mean())
+    scaler = StandardScaler().fit(features)
+    X_scaled = scaler.transform(features)
+    kmeans = KMeans(n_clusters=3, n_init=3, random_state=42).fit(X_scaled)
+
+    np.testing.assert_allclose(result['scaling']['mean'], scaler.mean_)
+    np.testing.assert_allclose(result['scaling']['scale'], scaler.scale_)
+    clustered = pd.read_csv(output)
+    pd.testing.assert_frame_equal(clustered.drop(columns='Cluster'), frame)
+    # Mini-batch centers differ slightly, which may move a few imputed rows between the blobs
+    assert adjusted_rand_score(clustered['Cluster'], kmeans.labels_) > 0.999
+    assert result['n_rows'] == len(frame)
+    assert result['inertia'] == pytest.approx(kmeans.inertia_, rel=0.01)
+
+
+def test_compressed_input_gives_the_same_result(tmp_path, frame, csv_path):
+    gz_path = tmp_path / 'data.csv.gz'
+    with gzip.open(gz_path, 'wt') as f:
+        frame.to_csv(f, index=False)
+    plain = cluster_csv_streaming(csv_path, ['a', 'b'], 3, str(tmp_path / 'plain.csv'), chunksize=250)
+    packed = cluster_csv_streaming(str(gz_path), ['a', 'b'], 3, str(tmp_path / 'packed.csv'),
+                                   chunksize=250, compression='gzip')
+    assert packed['cluster_stats'] == plain['cluster_stats']
+    assert packed['inertia'] == plain['inertia']
+
+
+def test_job_reports_every_pass_and_stops_when_told(tmp_path, csv_path):
+    stages = []
+
+    def progress(stage, **counters):
+        stages.append((stage, counters['rows']))
+
+    result = run_streaming_job(csv_path, ['a', 'b'], 3, str(tmp_path / 'out.csv'), chunksize=500,
+                               progress=progress)
+    assert [stage for stage, _ in stages] == ['scaling'] * 3 + ['fit'] * 3 + ['write'] * 3
+    assert stages[-1] == ('write', 1200)
+    assert len(result['model']['centers']) == 3
+    assert sum(result['cluster_stats'].values()) == 1200
+
+    class Stop(Exception):
+        pass
+
+    def cancel_in_fit(stage, **counters):
+        if stage == 'fit':
+            raise Stop()
+
+    with pytest.raises(Stop):
+        run_streaming_job(csv_path, ['a', 'b'], 3, str(tmp_path / 'cancelled.csv'), chunksize=500,
+                          progress=cancel_in_fit)
+
+
+def test_rejects_text_columns(tmp_path, csv_path):
+    with pytest.raises(ValueError, match='not numeric'):
+        cluster_csv_streaming(csv_path, ['a', 'name'], 3, str(tmp_path / 'out.csv'))
+
+
+def test_route_runs_as_a_job_on_a_chunked_upload(client, run_job, frame):
+    data = gzip.compress(frame.to_csv(index=False).encode())
+    upload = client.post('/uploads', json={'filename': 'data.csv.gz', 'size': len(data),
+                                           'stream': True}).get_json()
+    part_size = upload['part_size']
+    for index in range(upload['n_parts']):
+        client.put(f"/uploads/{upload['upload_id']}/parts/{index}",
+                   data=data[index * part_size:(index + 1) * part_size])
+    # A streaming upload is never loaded as a dataset
+    assert client.post(f"/uploads/{upload['upload_id']}/complete").status_code == 400
+
+    result = run_job('/cluster_stream', json={'upload_id': upload['upload_id'], 'columns': ['a', 'b'],
+                                              'n_clusters': 3, 'chunksize': 500})
+    assert result.status_code == 200
+    body = result.get_json()
+    assert sum(body['cluster_stats'].values()) == len(frame)
+    exported = pd.read_csv(pd.io.common.BytesIO(client.get(body['download_url']).data))
+    assert len(exported) == len(frame)
+    # The upload was handed over to the job and is gone
+    assert client.get(f"/uploads/{upload['upload_id']}").status_code == 404
+
+
+def test_route_accepts_a_form_upload(client, run_job, csv_path):
+    with open(csv_path, 'rb') as f:
+        result = run_job('/cluster_stream', data={'file': (f, 'data.csv'), 'columns': 'a,b',
+                                                  'n_clusters': '3'})
+    assert result.status_code == 200
+    assert sum(result.get_json()['cluster_stats'].values()) == 1200
+
+
+def test_route_rejects_an_upload_opened_for_parsing(client):
+    upload = client.post('/uploads', json={'filename': 'data.csv', 'size': 10}).get_json()
+    response = client.post('/cluster_stream', json={'upload_id': upload['upload_id'],
+                                                    'columns': ['a'], 'n_clusters': 2})
+    assert response.status_code == 400
+    client.delete(f"/uploads/{upload['upload_id']}")
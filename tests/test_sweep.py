@@ -0,0 +1,63 @@
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from clustering_core import elbow_k, sweep_k
+
+CENTERS = np.array([[0.0, 0.0], [6.0, 6.0], [0.0, 12.0]])
+
+
+@pytest.fixture
+def X_scaled():
+    rng = np.random.default_rng(0)
+    return np.vstack([rng.normal(center, 0.5, size=(150, 2)) for center in CENTERS])
+
+
+def test_parallel_sweep_matches_a_serial_one(X_scaled):
+    serial = sweep_k(X_scaled, [2, 3, 4, 5], n_jobs=1)
+    parallel = sweep_k(X_scaled, [5, 4, 3, 2], n_jobs=2)
+
+    assert parallel == serial
+    assert serial['ks'] == [2, 3, 4, 5]
+    assert serial['recommended_k'] == 3
+    assert serial['inertia'] == sorted(serial['inertia'], reverse=True)
+
+
+def test_rejects_impossible_ks(X_scaled):
+    with pytest.raises(ValueError, match='at least 2'):
+        sweep_k(X_scaled, [1, 2])
+    with pytest.raises(ValueError, match='Cannot form'):
+        sweep_k(X_scaled[:4], [2, 5])
+
+
+def test_elbow_is_the_sharpest_bend():
+    assert elbow_k([2, 3, 4, 5, 6], [100, 20, 15, 12, 10]) == 3
+    assert elbow_k([2, 3], [10, 5]) == 2
+
+
+def test_route_gives_the_job_its_share_of_the_cores(web_app, client, run_job, monkeypatch, X_scaled):
+    frame = pd.DataFrame(X_scaled, columns=['a', 'b'])
+    client.post('/upload', data={'file': (io.BytesIO(frame.to_csv(index=False).encode()), 'data.csv')})
+
+    submitted = []
+    submit_job = web_app.submit_job
+
+    def record(kind, fn, ks, X, features, n_jobs, *args, **kwargs):
+        submitted.append(n_jobs)
+        return submit_job(kind, fn, ks, X, features, n_jobs, *args, **kwargs)
+
+    monkeypatch.setattr(web_app, 'submit_job', record)
+    result = run_job('/sweep', json={'columns': ['a', 'b'], 'k_min': 2, 'k_max': 5})
+
+    assert submitted == [web_app.RESTART_WORKERS]
+    assert result.status_code == 200
+    assert result.get_json()['recommended_k'] == 3
+
+
+def test_route_validates_the_range(client):
+    frame = pd.DataFrame({'a': range(20), 'b': range(20)})
+    client.post('/upload', data={'file': (io.BytesIO(frame.to_csv(index=False).encode()), 'data.csv')})
+    response = client.post('/sweep', json={'columns': ['a', 'b'], 'k_min': 5, 'k_max': 3})
+    assert response.status_code == 400